@@ -0,0 +1,322 @@
+"""
+静的ファイルのビルドモジュール.
+外部CDNのファイルをstatic/vendor/に取り込み、共通/HTML作成対象毎のCSS、JSを
+結合・圧縮して、内容のハッシュを含むファイル名でstatic/dist/に出力する(.gz付き)
+
+Usage:
+    $ python assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.parse
+import urllib.request
+
+# 静的ファイルのディレクトリ(HTMLからの参照はSTATIC_URL)
+STATIC_DIR = '../static/'
+STATIC_URL = 'static/'
+DIST_DIR = 'dist/'
+MANIFEST = DIST_DIR + 'manifest.json'
+
+# 取り込む外部ファイル {static/からのパス:URL}
+VENDOR = {
+    'vendor/jquery.min.js':
+        'https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js',
+    'vendor/datatables.min.css':
+        'https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.css',
+    'vendor/datatables.min.js':
+        'https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.js',
+    'vendor/responsive.dataTables.min.css':
+        'https://cdn.datatables.net/responsive/2.2.3/css/responsive.dataTables.min.css',
+    'vendor/dataTables.responsive.min.js':
+        'https://cdn.datatables.net/responsive/2.2.3/js/dataTables.responsive.min.js',
+}
+
+# 出力ファイル {論理名:[結合するstatic/からのパス]}
+BUNDLES = {
+    'css/common.css': [
+        'vendor/datatables.min.css',
+        'vendor/responsive.dataTables.min.css',
+        'css/common.css',
+    ],
+    'css/weather.css': ['css/weather.css'],
+    'css/train.css': ['css/train.css'],
+    'css/english.css': ['css/english.css'],
+    'js/common.js': [
+        'vendor/jquery.min.js',
+        'vendor/datatables.min.js',
+        'vendor/dataTables.responsive.min.js',
+        'js/common.js',
+    ],
+    'js/english.js': ['js/english.js'],
+    'js/debug.js': ['js/debug.js'],
+}
+
+# ビルドしていない場合に参照するファイル {論理名:[URL]}
+FALLBACK = {
+    'css/common.css': [
+        VENDOR['vendor/datatables.min.css'],
+        VENDOR['vendor/responsive.dataTables.min.css'],
+        STATIC_URL + 'css/common.css',
+    ],
+    'js/common.js': [
+        VENDOR['vendor/jquery.min.js'],
+        VENDOR['vendor/datatables.min.js'],
+        VENDOR['vendor/dataTables.responsive.min.js'],
+        STATIC_URL + 'js/common.js',
+    ],
+}
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def load_manifest(path: str = STATIC_DIR + MANIFEST) -> dict:
+    """
+    ビルド結果を読み込む.
+
+    param:
+        path manifest.jsonのパス
+
+    return:
+        manifest {論理名:static/からのパス} ビルドしていない場合は空
+    """
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def urls(name: str, manifest: dict) -> list:
+    """
+    論理名のファイルをHTMLから参照するURLを返す.
+
+    param:
+        name 論理名
+        manifest ビルド結果
+
+    return:
+        urls URLのリスト
+    """
+
+    if name in manifest:
+        return [STATIC_URL + manifest[name]]
+
+    return FALLBACK.get(name, [STATIC_URL + name])
+
+
+def tags(names: list, manifest: dict) -> str:
+    """
+    論理名のファイルを読み込むタグを返す.
+
+    param:
+        names 論理名のリスト
+        manifest ビルド結果
+
+    return:
+        html link、scriptタグ
+    """
+
+    html = ''
+    for name in names:
+        for url in urls(name, manifest):
+            if name.endswith('.css'):
+                html += f'''
+            <link rel="stylesheet" type="text/css" href="{ url }">'''
+            else:
+                html += f'''
+            <script src="{ url }"></script>'''
+
+    return html
+
+
+def download(url: str) -> bytes:
+    """
+    URLの内容を取得する.
+
+    param:
+        url URL
+
+    return:
+        body
+    """
+
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+
+def vendor(static_dir: str = STATIC_DIR):
+    """
+    外部ファイルをstatic/vendor/に取り込む.
+    取り込み済みのファイルは再取得しない
+    CSSから参照される画像、フォントも取り込み、参照先を書き換える
+    """
+
+    for path, url in VENDOR.items():
+        dest = os.path.join(static_dir, path)
+        if os.path.exists(dest):
+            continue
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        body = download(url)
+        if path.endswith('.css'):
+            body = vendor_css_resources(
+                body.decode('utf-8'), url, os.path.dirname(dest)).encode('utf-8')
+
+        with open(dest, 'wb') as file:
+            file.write(body)
+        print('vendor: %s' % path)
+
+
+def vendor_css_resources(css: str, base_url: str, dest_dir: str) -> str:
+    """
+    CSSから相対パスで参照されるファイルを取り込み、参照先を書き換える.
+
+    param:
+        css CSS
+        base_url CSSのURL
+        dest_dir CSSの出力ディレクトリ
+
+    return:
+        css 書き換えたCSS
+    """
+
+    def replace(match):
+        ref = match.group(2)
+        if ref.startswith(('data:', '#')):
+            return match.group(0)
+
+        url = urllib.parse.urljoin(base_url, ref)
+        name = urllib.parse.urlsplit(url).path.rsplit('/', 1)[-1]
+        local = 'res/%s-%s' % (hashlib.sha1(url.encode()).hexdigest()[:10], name)
+        dest = os.path.join(dest_dir, local)
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as file:
+                file.write(download(url))
+
+        return 'url(%s)' % local
+
+    return CSS_URL.sub(replace, css)
+
+
+def minify_css(css: str) -> str:
+    """
+    CSSのコメント、空白を削除する.
+
+    param:
+        css CSS
+
+    return:
+        css
+    """
+
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js: str) -> str:
+    """
+    JSの行頭の空白、コメント行、空行を削除する.
+    文字列中の//等を壊さないよう、行単位で安全に削除できるものだけ削除する
+
+    param:
+        js JS
+
+    return:
+        js
+    """
+
+    js = re.sub(r'^\s*/\*.*?\*/', '', js, flags=re.S | re.M)
+    lines = []
+    for line in js.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def rewrite_css_urls(css: str, src: str) -> str:
+    """
+    CSS内の相対パスを、static/dist/からの相対パスに書き換える.
+
+    param:
+        css CSS
+        src CSSのstatic/からのパス
+
+    return:
+        css
+    """
+
+    def replace(match):
+        ref = match.group(2)
+        if ref.startswith(('data:', '#', '/')) or '://' in ref:
+            return match.group(0)
+
+        path = os.path.normpath(os.path.join(os.path.dirname(src), ref))
+        return 'url(%s)' % os.path.relpath(path, DIST_DIR).replace(os.sep, '/')
+
+    return CSS_URL.sub(replace, css)
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """
+    BUNDLESを結合・圧縮し、ハッシュ付きのファイル名で出力する.
+
+    param:
+        static_dir 静的ファイルのディレクトリ
+
+    return:
+        manifest {論理名:static/からのパス}
+    """
+
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        parts = []
+        for src in sources:
+            with open(os.path.join(static_dir, src), encoding='utf-8') as file:
+                text = file.read()
+            if name.endswith('.css'):
+                parts.append(minify_css(rewrite_css_urls(text, src)))
+            elif src.endswith('.min.js'):
+                parts.append(text)
+            else:
+                parts.append(minify_js(text))
+
+        # 結合時にJSの文が繋がらないよう、ファイル毎に改行と;で区切る
+        separator = '\n' if name.endswith('.css') else '\n;\n'
+        body = separator.join(parts).encode('utf-8')
+
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        base, ext = os.path.splitext(os.path.basename(name))
+        path = '%s%s.%s%s' % (DIST_DIR, base, digest, ext)
+        with open(os.path.join(static_dir, path), 'wb') as file:
+            file.write(body)
+        with gzip.GzipFile(os.path.join(static_dir, path + '.gz'), 'wb',
+                           compresslevel=9, mtime=0) as file:
+            file.write(body)
+
+        manifest[name] = path
+        print('build: %s -> %s (%d bytes)' % (name, path, len(body)))
+
+    with open(os.path.join(static_dir, MANIFEST), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    return manifest
+
+
+if __name__ == "__main__":
+    vendor()
+    build()
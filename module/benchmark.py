@@ -0,0 +1,625 @@
+"""
+ベンチマークモジュール.
+ローカルのfixture_serverに対してスクレイピングの処理性能を計測する
+
+Usage:
+    $ python benchmark.py pool
+    $ python benchmark.py backend
+    $ python benchmark.py extract
+    $ python benchmark.py profile [fixture]
+    $ python benchmark.py pipeline [出力ファイル]
+    $ python benchmark.py workers
+    $ python benchmark.py serve
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import http.client
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import collect
+import daily_html
+import dbaccess
+import fetch
+import fixture_server
+import metrics
+import server
+import worker
+
+# 計測するdriverプールのサイズ
+POOL_SIZES = [1, 2, 4, 8]
+
+# 収集情報毎の計測ページ数
+PAGES = 16
+
+# 1ページあたりの応答遅延(秒)
+DELAY = 0.2
+
+# パイプライン計測の規模(収集情報毎の目的地、路線、英単語の件数)
+SCALES = [10, 100, 1000]
+
+# 計測するワーカープロセス数
+WORKERS = [1, 2, 4, 8]
+
+# ワーカーの起動スクリプト
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# 全収集情報をSeleniumで取得する設定
+SELENIUM = {
+    'weather': 'selenium',
+    'train': 'selenium',
+}
+
+
+def fetch_jobs(ins: object, jobs: list, size: int) -> int:
+    """
+    ジョブを並列に1回ずつ取得する(再試行、サーキットブレーカー無し).
+    取得、解析に失敗したページは数えて続ける
+
+    param:
+        ins collect.Scraping
+        jobs [(収集情報のキーワード, DBの行)]
+        size 同時に取得するページ数
+
+    return:
+        failed 失敗したページ数
+    """
+
+    def fetch_one(job: tuple) -> bool:
+        try:
+            ins.fetch(job)
+        except (fetch.FetchError, fetch.PageError):
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        fetched = list(executor.map(fetch_one, jobs))
+
+    return fetched.count(False)
+
+
+def make_jobs(base_url: str, pages: int, delay: float) -> list:
+    """
+    fixture_server向けの収集ジョブを生成する.
+
+    param:
+        base_url fixture_serverのURL
+        pages 収集情報毎のページ数
+        delay 応答遅延(秒)
+
+    return:
+        jobs [(収集情報のキーワード, DBの行)]
+    """
+
+    jobs = []
+    for num in range(pages):
+        jobs.append(('weather', {
+            'place': 'place%d' % num,
+            'url': '%s/weather/%d?delay=%s' % (base_url, num, delay),
+        }))
+        jobs.append(('train', {
+            'route': 'route%d' % num,
+            'url': '%s/train/%d?delay=%s' % (base_url, num, delay),
+        }))
+
+    return jobs
+
+
+def bench_pool(sizes: list = POOL_SIZES, pages: int = PAGES,
+               delay: float = DELAY) -> list:
+    """
+    driverプールのサイズ毎のスループットを計測する.
+
+    param:
+        sizes driverプールのサイズのリスト
+        pages 収集情報毎のページ数
+        delay 応答遅延(秒)
+
+    return:
+        results [{size, pages, failed, seconds, pages_per_sec}]
+    """
+
+    server = fixture_server.FixtureServer()
+    server.start()
+    jobs = make_jobs(server.base_url, pages, delay)
+
+    results = []
+    try:
+        for size in sizes:
+            ins = collect.Scraping(size, SELENIUM)
+
+            # driverの起動時間を含めないよう、先に全driverを起動しておく
+            pool = ins.backends['weather'].pool('weather')
+            drivers = [pool.acquire() for _ in range(size)]
+            for driver in drivers:
+                pool.release(driver)
+
+            start = time.perf_counter()
+            failed = fetch_jobs(ins, jobs, size)
+            seconds = time.perf_counter() - start
+            ins.close_driver()
+
+            results.append({
+                'size': size,
+                'pages': len(jobs),
+                'failed': failed,
+                'seconds': round(seconds, 3),
+                'pages_per_sec': round(len(jobs) / seconds, 2),
+            })
+    finally:
+        server.stop()
+
+    return results
+
+
+def bench_backend(names: list = None, size: int = 4, pages: int = PAGES,
+                  delay: float = 0.0) -> list:
+    """
+    取得方法毎の処理時間(driverの起動を含む)を計測する.
+
+    param:
+        names 取得方法のリスト
+        size 同時に取得するページ数
+        pages 収集情報毎のページ数
+        delay 応答遅延(秒)
+
+    return:
+        results [{backend, pages, failed, seconds, pages_per_sec}]
+    """
+
+    # 毎回ダウンロードした場合の処理時間を計測する
+    fetch.USE_CACHE = False
+
+    server = fixture_server.FixtureServer()
+    server.start()
+    jobs = make_jobs(server.base_url, pages, delay)
+
+    results = []
+    try:
+        for name in names or list(fetch.BACKENDS):
+            start = time.perf_counter()
+            ins = collect.Scraping(size, {'weather': name, 'train': name})
+            failed = fetch_jobs(ins, jobs, size)
+            ins.close_driver()
+            seconds = time.perf_counter() - start
+
+            results.append({
+                'backend': name,
+                'pages': len(jobs),
+                'failed': failed,
+                'seconds': round(seconds, 3),
+                'pages_per_sec': round(len(jobs) / seconds, 2),
+            })
+    finally:
+        server.stop()
+
+    return results
+
+
+def bench_extract(size: int = 1, pages: int = PAGES) -> list:
+    """
+    Seleniumでの解析対象の取得方法(1回のスクリプト実行、要素毎)毎の処理時間を計測する.
+
+    param:
+        size driverプールのサイズ
+        pages 収集情報毎のページ数
+
+    return:
+        results [{script, pages, failed, seconds, pages_per_sec}]
+    """
+
+    server = fixture_server.FixtureServer()
+    server.start()
+    jobs = make_jobs(server.base_url, pages, 0.0)
+
+    results = []
+    try:
+        for script in (True, False):
+            fetch.SCRIPT_EXTRACT = script
+            ins = collect.Scraping(size, SELENIUM)
+
+            # driverの起動時間を含めない
+            pool = ins.backends['weather'].pool('weather')
+            pool.release(pool.acquire())
+
+            start = time.perf_counter()
+            failed = fetch_jobs(ins, jobs, size)
+            seconds = time.perf_counter() - start
+            ins.close_driver()
+
+            results.append({
+                'script': script,
+                'pages': len(jobs),
+                'failed': failed,
+                'seconds': round(seconds, 3),
+                'pages_per_sec': round(len(jobs) / seconds, 2),
+            })
+    finally:
+        server.stop()
+
+    return results
+
+
+def db_jobs(pages: int) -> list:
+    """
+    DBに登録された収集先から収集ジョブを生成する.
+
+    param:
+        pages 収集情報毎のページ数
+
+    return:
+        jobs [(収集情報のキーワード, DBの行)]
+    """
+
+    jobs = []
+    for target, db in (('weather', dbaccess.Weather()),
+                       ('train', dbaccess.Train())):
+        rows = db.select_all() or []
+        db.close()
+        jobs.extend((target, row) for row in rows[:pages])
+
+    return jobs
+
+
+def bench_profile(profiles: list = None, pages: int = 4,
+                  fixture: bool = False) -> list:
+    """
+    取得プロファイル毎のページ読み込み時間、転送量を計測する.
+    DBに登録された実際の収集先を使う(登録が無い場合、fixtureがTrueの場合はfixture_server)
+    fullは従来の取得方法(全リソースの読み込み完了まで待つ)
+
+    param:
+        profiles 取得プロファイル名のリスト
+        pages 収集情報毎のページ数
+        fixture Trueの場合fixture_serverを使う
+
+    return:
+        results [{profile, pages, seconds, ready_ms, load_ms, bytes, resources,
+                  time_saved, bytes_saved}]
+                  time_saved、bytes_savedはfullに対する削減率(fullを計測しない場合None)
+    """
+
+    server = None
+    jobs = [] if fixture else db_jobs(pages)
+    if not jobs:
+        server = fixture_server.FixtureServer()
+        server.start()
+        jobs = make_jobs(server.base_url, pages, 0.0)
+
+    results = []
+    try:
+        for profile in profiles or list(fetch.PROFILES):
+            pool = fetch.DriverPool(1, profile)
+            driver = pool.acquire()
+            seconds = 0.0
+            totals = {'ready_ms': 0, 'load_ms': 0, 'bytes': 0, 'resources': 0}
+            failed = 0
+            for target, row in jobs:
+                start = time.perf_counter()
+                try:
+                    driver.get(row['url'])
+                    if fetch.PROFILES[profile]['page_load_strategy'] != 'normal':
+                        fetch.wait_for(driver, fetch.SITES[target]['wait_for'])
+                except Exception:
+                    failed += 1
+                    continue
+                seconds += time.perf_counter() - start
+
+                measured = driver.execute_script(fetch.MEASURE_SCRIPT)
+                for key in totals:
+                    totals[key] += measured[key]
+            pool.release(driver)
+            pool.close()
+
+            loaded = max(1, len(jobs) - failed)
+            results.append(dict({
+                'profile': profile,
+                'pages': len(jobs),
+                'failed': failed,
+                'seconds': round(seconds / loaded, 3),
+            }, **{key: round(val / loaded) for key, val in totals.items()}))
+    finally:
+        if server is not None:
+            server.stop()
+
+    base = [row for row in results if row['profile'] == 'full']
+    for row in results:
+        row['time_saved'] = row['bytes_saved'] = None
+        if base and base[0]['seconds']:
+            row['time_saved'] = round(1 - row['seconds'] / base[0]['seconds'], 3)
+        if base and base[0]['bytes']:
+            row['bytes_saved'] = round(1 - row['bytes'] / base[0]['bytes'], 3)
+
+    return results
+
+
+@contextmanager
+def workdir():
+    """
+    一時ディレクトリのDBに切り替える.
+    一時ディレクトリ/module/をカレントディレクトリにし、終了時に削除する
+    """
+
+    cwd = os.getcwd()
+    saved = dbaccess.DB_PATH, dbaccess.POOL
+    work_dir = tempfile.mkdtemp(prefix='daily-bench-')
+    module_dir = os.path.join(work_dir, 'module')
+    os.makedirs(module_dir)
+    os.chdir(module_dir)
+    dbaccess.DB_PATH = os.path.join(module_dir, 'daily.db')
+    dbaccess.POOL = dbaccess.ConnectionPool(dbaccess.DB_PATH)
+    try:
+        dbaccess.CreateTable()
+        yield work_dir
+    finally:
+        dbaccess.POOL.close()
+        dbaccess.DB_PATH, dbaccess.POOL = saved
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def populate(server: object, num: int, delay: float) -> dict:
+    """
+    収集先、英単語テーブルに合成データを登録する.
+    保存したページがあれば収集先に順番に割り当て、無ければ生成したページを使う
+
+    param:
+        server fixture_server
+        num 収集情報毎の件数
+        delay 応答遅延(秒)
+
+    return:
+        counts {テーブル名:登録件数}
+    """
+
+    counts = {}
+    for target, db in (('weather', dbaccess.Weather()),
+                       ('train', dbaccess.Train())):
+        names = server.recorded(target)
+        for idx in range(num):
+            if names:
+                path = 'recorded/%s' % names[idx % len(names)]
+            else:
+                path = '%s/%d' % (target, idx)
+            # 収集URLはUNIQUEのため、同じページを使い回す場合もクエリで区別する
+            db.insert('%s%d' % (collect.TARGET_KEYS[target], idx),
+                      '%s/%s?delay=%s&n=%d' % (server.base_url, path, delay, idx))
+        db.commit()
+        counts[target] = num
+
+    stats = dbaccess.EnglishStudy().bulk_insert(
+        ('word%d' % idx, '単語%d' % idx) for idx in range(num))
+    counts['english_study'] = stats['inserted']
+
+    return counts
+
+
+def bench_pipeline(scales: list = SCALES, backend: str = 'http',
+                   size: int = fetch.POOL_SIZE, delay: float = 0.0) -> dict:
+    """
+    規模毎に、収集→解析→保存→HTML生成の処理時間を計測する.
+    DB、HTML、ログは規模毎の一時ディレクトリに出力し、実環境のファイルには触れない
+
+    param:
+        scales 収集情報毎の件数のリスト
+        backend 取得方法
+        size 同時に取得するページ数
+        delay 応答遅延(秒)
+
+    return:
+        result {environment:{...}, results:[{targets, collect_seconds, ...}]}
+    """
+
+    # 毎回ダウンロードした場合の処理時間を計測する
+    fetch.USE_CACHE = False
+
+    server = fixture_server.FixtureServer(
+        record_dir=os.path.abspath(fixture_server.RECORD_DIR))
+    server.start()
+
+    results = []
+    try:
+        for num in scales:
+            with workdir() as work_dir:
+                counts = populate(server, num, delay)
+                metrics.REGISTRY.reset()
+
+                start = time.perf_counter()
+                ins = collect.Scraping(size, {'weather': backend, 'train': backend})
+                collected = ins.refresh(['weather', 'train'])
+                ins.close_driver()
+                collect_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                daily_html.CreateHtml(['weather', 'train', 'english'])
+                render_seconds = time.perf_counter() - start
+
+                pages = counts['weather'] + counts['train']
+                scraped = sum(len(info or {}) for info in collected.values())
+                results.append({
+                    'targets': num,
+                    'pages': pages,
+                    'collected': scraped,
+                    'failed': pages - scraped,
+                    'collect_seconds': round(collect_seconds, 3),
+                    'render_seconds': round(render_seconds, 3),
+                    'total_seconds': round(collect_seconds + render_seconds, 3),
+                    'pages_per_sec': round(pages / collect_seconds, 2),
+                    'html_bytes': {
+                        target: os.path.getsize(
+                            os.path.join(work_dir, target + '.html'))
+                        for target in ('weather', 'train', 'english')
+                    },
+                    'stages': metrics.REGISTRY.summary()['stages'],
+                })
+    finally:
+        server.stop()
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': backend,
+            'size': size,
+            'delay': delay,
+            'recorded': {
+                target: len(server.recorded(target))
+                for target in collect.TARGET_KEYS
+            },
+        },
+        'results': results,
+    }
+
+
+def bench_workers(workers: list = WORKERS, num: int = 200, threads: int = 2,
+                  delay: float = 0.1) -> list:
+    """
+    ワーカープロセス数毎に、ジョブキューを処理し終えるまでの時間を計測する.
+    ワーカーは一時ディレクトリのDBを共有する別プロセス(main.py worker --once)で起動する
+
+    param:
+        workers ワーカープロセス数のリスト
+        num 収集情報毎の件数
+        threads ワーカー毎に同時に取得するページ数
+        delay 応答遅延(秒)
+
+    return:
+        results [{workers, pages, done, seconds, pages_per_sec, speedup}]
+    """
+
+    server = fixture_server.FixtureServer()
+    server.start()
+
+    results = []
+    try:
+        with workdir():
+            populate(server, num, delay)
+            for count in workers:
+                queued = sum(worker.enqueue(['weather', 'train']).values())
+
+                start = time.perf_counter()
+                processes = [
+                    subprocess.Popen(
+                        [sys.executable, MAIN, 'worker', '--once', '--no-cache',
+                         '--threads', str(threads)],
+                        stdout=subprocess.DEVNULL)
+                    for _ in range(count)
+                ]
+                for process in processes:
+                    process.wait()
+                seconds = time.perf_counter() - start
+
+                db = dbaccess.ScrapeJob()
+                done = db.counts().get(dbaccess.JOB_DONE, 0)
+                db.close()
+                results.append({
+                    'workers': count,
+                    'pages': queued,
+                    'done': done,
+                    'seconds': round(seconds, 3),
+                    'pages_per_sec': round(queued / seconds, 2),
+                })
+    finally:
+        server.stop()
+
+    for row in results:
+        row['speedup'] = round(
+            row['pages_per_sec'] / results[0]['pages_per_sec'], 2)
+
+    return results
+
+
+def bench_serve(clients: int = 200, requests: int = 20) -> dict:
+    """
+    keep-aliveで接続したclients台のクライアントが、条件付きで繰り返し取得した場合の
+    スループットとCPU時間を計測する(クライアントのCPU時間を含む)
+
+    param:
+        clients クライアント数
+        requests クライアント毎のリクエスト数
+
+    return:
+        result {clients, requests, seconds, requests_per_sec, cpu_us_per_request, not_modified}
+    """
+
+    store = server.PageStore()
+    store.load()
+    httpd = server.PageServer(store, host='127.0.0.1', port=0)
+    httpd.start()
+    port = httpd.server_address[1]
+
+    def client(_):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        etag = ''
+        not_modified = 0
+        for _ in range(requests):
+            conn.request('GET', '/', headers={
+                'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+            response = conn.getresponse()
+            response.read()
+            etag = response.getheader('ETag', '')
+            not_modified += response.status == 304
+        conn.close()
+        return not_modified
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            not_modified = sum(executor.map(client, range(clients)))
+    finally:
+        seconds = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        httpd.stop()
+
+    total = clients * requests
+    return {
+        'clients': clients,
+        'requests': total,
+        'seconds': round(seconds, 3),
+        'requests_per_sec': round(total / seconds, 2),
+        'cpu_us_per_request': round(cpu / total * 1e6),
+        'not_modified': not_modified,
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['pool']:
+        print('size\tpages\tfailed\tseconds\tpages/sec')
+        for row in bench_pool():
+            print('%(size)d\t%(pages)d\t%(failed)d\t%(seconds).3f\t%(pages_per_sec).2f' % row)
+    elif sys.argv[1:2] == ['backend']:
+        print('backend\tpages\tfailed\tseconds\tpages/sec')
+        for row in bench_backend():
+            print('%(backend)s\t%(pages)d\t%(failed)d\t%(seconds).3f\t%(pages_per_sec).2f' % row)
+    elif sys.argv[1:2] == ['extract']:
+        print('script\tpages\tfailed\tseconds\tpages/sec')
+        for row in bench_extract():
+            print('%(script)s\t%(pages)d\t%(failed)d\t%(seconds).3f\t%(pages_per_sec).2f' % row)
+    elif sys.argv[1:2] == ['profile']:
+        print('profile\tpages\tfailed\tsec/page\tready_ms\tload_ms\tbytes\tresources'
+              '\ttime_saved\tbytes_saved')
+        for row in bench_profile(fixture=sys.argv[2:3] == ['fixture']):
+            print('%(profile)s\t%(pages)d\t%(failed)d\t%(seconds).3f\t%(ready_ms)d\t'
+                  '%(load_ms)d\t%(bytes)d\t%(resources)d\t%(time_saved)s\t'
+                  '%(bytes_saved)s' % row)
+    elif sys.argv[1:2] == ['workers']:
+        print('workers\tpages\tdone\tseconds\tpages/sec\tspeedup')
+        for row in bench_workers():
+            print('%(workers)d\t%(pages)d\t%(done)d\t%(seconds).3f\t'
+                  '%(pages_per_sec).2f\t%(speedup).2f' % row)
+    elif sys.argv[1:2] == ['serve']:
+        print(json.dumps(bench_serve(), indent=2))
+    elif sys.argv[1:2] == ['pipeline']:
+        text = json.dumps(bench_pipeline(), indent=2)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], 'w', encoding='utf-8') as file:
+                file.write(text)
+        print(text)
+    else:
+        print(__doc__)
@@ -0,0 +1,158 @@
+"""
+サーキットブレーカーモジュール.
+ホスト毎に連続した失敗を数え、閾値に達したホストへの通信を一定時間止める
+停止期間を過ぎたら1件だけ試し、成功すれば再開、失敗すれば再び止める
+試すのは直前に失敗したURL以外(そのURLだけの問題でホストが止まり続けないようにする)
+
+    if breaker.allow(url):
+        ...
+        breaker.success(url)  # 失敗した場合はbreaker.failure(url)
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 通信を止めるまでの連続失敗回数
+FAILURE_THRESHOLD = 3
+
+# 通信を止める時間(秒)
+RESET_TIMEOUT = 60
+
+# 状態
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    ホスト毎のサーキットブレーカークラス.
+    複数スレッドから呼び出せる
+    """
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        """
+        param:
+            threshold 通信を止めるまでの連続失敗回数
+            reset_timeout 通信を止める時間(秒)
+        """
+
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+
+        # {ホスト:{failures:連続失敗回数, opened_at:停止日時, trial:試行中か,
+        #         failed_url:直前に失敗したURL}}
+        self.hosts = {}
+
+    def host(self, url: str) -> dict:
+        """
+        URLのホストの状態を返す. lockを取得して呼ぶ
+
+        param:
+            url URL
+
+        return:
+            state {failures, opened_at, trial, failed_url}
+        """
+
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = {'failures': 0, 'opened_at': None, 'trial': False,
+                                'failed_url': None}
+
+        return self.hosts[host]
+
+    def states(self) -> dict:
+        """
+        状態毎のホスト数を返す. metrics.registerで出力する
+
+        return:
+            counts {closed:通信可, open:停止中, half_open:停止期間後の試行待ち}
+        """
+
+        now = time.time()
+        counts = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        with self.lock:
+            for host in self.hosts.values():
+                if host['opened_at'] is None:
+                    counts[CLOSED] += 1
+                elif now - host['opened_at'] < self.reset_timeout:
+                    counts[OPEN] += 1
+                else:
+                    counts[HALF_OPEN] += 1
+
+        return counts
+
+    def allow(self, url: str) -> bool:
+        """
+        URLへ通信してよいかを返す.
+        停止期間を過ぎたホストは、結果が出るまで1件だけ通信を許可する
+        直前に失敗したURLは、停止期間をもう1回過ぎるまで試行に使わない
+
+        param:
+            url URL
+
+        return:
+            True 停止中の場合False
+        """
+
+        with self.lock:
+            host = self.host(url)
+            if host['opened_at'] is None:
+                return True
+            if time.time() - host['opened_at'] < self.reset_timeout:
+                return False
+            if host['trial']:
+                return False
+            if (url == host['failed_url']
+                    and time.time() - host['opened_at'] < 2 * self.reset_timeout):
+                return False
+
+            host['trial'] = True
+            return True
+
+    def success(self, url: str):
+        """
+        通信の成功を記録する.
+
+        param:
+            url URL
+        """
+
+        with self.lock:
+            host = self.host(url)
+            host['failures'] = 0
+            host['opened_at'] = None
+            host['trial'] = False
+            host['failed_url'] = None
+
+    def release(self, url: str):
+        """
+        成功、失敗のどちらにも数えずに試行を終える.
+        ホストの障害か分からないエラー(プログラムの不具合等)の場合に呼ぶ
+
+        param:
+            url URL
+        """
+
+        with self.lock:
+            self.host(url)['trial'] = False
+
+    def failure(self, url: str):
+        """
+        通信の失敗を記録する.
+        連続失敗回数が閾値に達した場合、試行中に失敗した場合は通信を止める
+
+        param:
+            url URL
+        """
+
+        with self.lock:
+            host = self.host(url)
+            host['failures'] += 1
+            host['failed_url'] = url
+            if host['trial'] or host['failures'] >= self.threshold:
+                host['opened_at'] = time.time()
+            host['trial'] = False
@@ -0,0 +1,289 @@
+"""
+HTTPレスポンスキャッシュモジュール.
+URL毎に本文とETag/Last-Modifiedをディスク(SQLite)に保存し、
+有効期限内はキャッシュを返し、期限切れは条件付きリクエストで再検証する
+"""
+import os
+import sqlite3
+import threading
+import time
+
+# 収集情報毎の有効期限(秒)
+# scheduler.INTERVALSの揺らぎを含めた最短の更新間隔より十分短くする
+# (同じ長さにすると定期更新の半分程度が通信せずに期限内のキャッシュを返す)
+TTL = {
+    'weather': 30 * 60,
+    'train': 60,
+}
+DEFAULT_TTL = 60
+
+# キャッシュサイズの上限(超えた場合は最終参照が古いものから削除)
+MAX_BYTES = 64 * 1024 * 1024
+MAX_ENTRIES = 10000
+
+# 上限の確認間隔(保存回数) 他のプロセスの保存分もこの間隔で反映する
+EVICT_INTERVAL = 100
+
+CACHE_PATH = os.path.join(os.getcwd(), 'http_cache.db')
+
+# ロック解除を待つ時間(秒) 複数のワーカープロセスで共有するため
+BUSY_TIMEOUT = 30
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS http_cache (
+        url text PRIMARY KEY,
+        body blob NOT NULL,
+        charset text,
+        etag text,
+        last_modified text,
+        fetched_at real NOT NULL,
+        accessed_at real NOT NULL,
+        elapsed real NOT NULL,
+        size integer NOT NULL
+    )''',
+    '''CREATE INDEX IF NOT EXISTS http_cache_accessed_at
+        ON http_cache (accessed_at)''',
+]
+
+
+class Entry:
+    """
+    キャッシュエントリクラス.
+    """
+
+    def __init__(self, row: tuple):
+        (self.url, self.body, self.charset, self.etag, self.last_modified,
+         self.fetched_at, self.accessed_at, self.elapsed, self.size) = row
+
+    def is_fresh(self, ttl: float, now: float) -> bool:
+        """
+        有効期限内か判定する.
+
+        param:
+            ttl 有効期限(秒)
+            now 現在時刻
+
+        return:
+            True
+        """
+
+        return now - self.fetched_at < ttl
+
+    def validators(self) -> dict:
+        """
+        条件付きリクエスト用のヘッダを返す.
+
+        return:
+            headers {ヘッダ名:値}
+        """
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+    def text(self) -> str:
+        """
+        本文を文字列で返す.
+        """
+
+        return bytes(self.body).decode(self.charset or 'utf-8', errors='replace')
+
+
+class ResponseCache:
+    """
+    HTTPレスポンスキャッシュクラス.
+    複数スレッドから共有できる
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES,
+                 max_entries: int = MAX_ENTRIES):
+        """
+        param:
+            path キャッシュファイルのパス
+            max_bytes 本文の合計サイズの上限
+            max_entries エントリ数の上限
+        """
+
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for sql in SCHEMA:
+            self.conn.execute(sql)
+        self.conn.commit()
+
+        # エントリ数、本文の合計サイズ(保存毎に加減し、evictで実際の値に合わせる)
+        self.count, self.total = self.totals()
+        self.puts = 0
+
+        # 計測用カウンタ
+        self.counters = {
+            'hit': 0,
+            'miss': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'evicted': 0,
+            'bytes_saved': 0,
+            'seconds_saved': 0.0,
+        }
+
+    def get(self, url: str) -> object:
+        """
+        キャッシュを取得する.
+
+        param:
+            url URL
+
+        return:
+            entry 存在しない場合None
+        """
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT url, body, charset, etag, last_modified, fetched_at, '
+                'accessed_at, elapsed, size FROM http_cache WHERE url = ?',
+                (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        return Entry(row)
+
+    def hit(self, entry: object, revalidated: bool = False):
+        """
+        キャッシュを利用したことを記録する.
+        再検証(304)の場合は取得時刻も更新する
+
+        param:
+            entry エントリ
+            revalidated 再検証した場合True
+        """
+
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.conn.execute(
+                    'UPDATE http_cache SET fetched_at = ?, accessed_at = ? '
+                    'WHERE url = ?', (now, now, entry.url))
+                self.counters['revalidated'] += 1
+            else:
+                self.conn.execute(
+                    'UPDATE http_cache SET accessed_at = ? WHERE url = ?',
+                    (now, entry.url))
+                self.counters['hit'] += 1
+                self.counters['seconds_saved'] += entry.elapsed
+            self.conn.commit()
+            self.counters['bytes_saved'] += entry.size
+
+    def miss(self):
+        """
+        キャッシュを利用できなかったことを記録する.
+        """
+
+        with self.lock:
+            self.counters['miss'] += 1
+
+    def put(self, url: str, body: bytes, charset: str, etag: str,
+            last_modified: str, elapsed: float):
+        """
+        キャッシュを保存し、上限を超えた分を削除する.
+
+        param:
+            url URL
+            body 本文
+            charset 文字コード
+            etag ETagヘッダ
+            last_modified Last-Modifiedヘッダ
+            elapsed 取得にかかった時間(秒)
+        """
+
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT size FROM http_cache WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                self.count += 1
+            else:
+                self.total -= row[0]
+            self.total += len(body)
+            self.puts += 1
+
+            self.conn.execute(
+                'INSERT OR REPLACE INTO http_cache (url, body, charset, etag, '
+                'last_modified, fetched_at, accessed_at, elapsed, size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, body, charset, etag, last_modified, now, now, elapsed,
+                 len(body)))
+            self.counters['stored'] += 1
+            if (self.count > self.max_entries or self.total > self.max_bytes
+                    or self.puts % EVICT_INTERVAL == 0):
+                self.evict()
+            self.conn.commit()
+
+    def totals(self) -> tuple:
+        """
+        エントリ数、本文の合計サイズを集計する.
+
+        return:
+            (エントリ数, 合計サイズ)
+        """
+
+        return self.conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache').fetchone()
+
+    def evict(self):
+        """
+        上限を超えた分を最終参照が古い順(LRU)に削除する.
+        全件を集計するため、保存毎ではなく上限を超えた時、EVICT_INTERVAL回毎に呼び出す
+        lockを取得した状態で呼び出す
+        """
+
+        count, total = self.totals()
+        self.count, self.total = count, total
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute(
+            'SELECT url, size FROM http_cache ORDER BY accessed_at').fetchall()
+        for url, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+            count -= 1
+            total -= size
+            self.counters['evicted'] += 1
+        self.count, self.total = count, total
+
+    def stats(self) -> dict:
+        """
+        カウンタを返す.
+
+        return:
+            counters {カウンタ名:値}
+        """
+
+        with self.lock:
+            counters = dict(self.counters)
+
+        lookups = counters['hit'] + counters['revalidated'] + counters['miss']
+        counters['hit_ratio'] = round(
+            (counters['hit'] + counters['revalidated']) / lookups, 3
+        ) if lookups else 0.0
+        counters['seconds_saved'] = round(counters['seconds_saved'], 3)
+
+        return counters
+
+    def close(self):
+        """
+        キャッシュファイルを閉じる.
+        """
+
+        with self.lock:
+            self.conn.close()
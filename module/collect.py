@@ -1,19 +1,57 @@
 """
 スクレイピング用モジュール.
 """
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import NoSuchElementException
-import chromedriver_binary
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import csv
+import json
+import random
+import sqlite3
+import time
+import breaker
 import dbaccess
+import fetch
 import log
-
-# Headlessモード定義
-OPTS = Options()
-OPTS.add_argument('--headless')
-OPTS.add_argument('--no-sandbox')
-OPTS.add_argument('--disable-dev-shm-usage')
-DRIVER = webdriver.Chrome('./lib/chromedriver', options=OPTS)
+import metrics
+
+# 収集情報毎のキーとなるカラム
+TARGET_KEYS = {
+    'weather': 'place',
+    'train': 'route',
+}
+
+# 非同期収集の定義
+# 1件毎のタイムアウト(秒、再試行を含む)、収集全体の期限(秒)、同時に取得する最大ページ数
+FETCH_TIMEOUT = 30
+DEADLINE = 60
+ASYNC_WORKERS = 256
+
+# 再試行の定義
+# 再試行回数、初回の待ち時間(秒、再試行毎に倍にする)、待ち時間の上限(秒)
+RETRIES = 2
+BACKOFF = 0.5
+BACKOFF_MAX = 8
+
+# 目的地(路線)毎の収集状況
+#   ok:成功 failed:再試行しても失敗 skipped:サーキットブレーカーにより通信せず
+#   error:ページの問題(4xx、解析対象無し)により失敗 再試行しない
+#   timeout:1件毎のタイムアウト deadline:収集全体の期限切れ
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_ERROR = 'error'
+STATUS_SKIPPED = 'skipped'
+STATUS_TIMEOUT = 'timeout'
+STATUS_DEADLINE = 'deadline'
+
+# 収集結果の保存期間(秒)
+SNAPSHOT_RETENTION = 7 * 24 * 60 * 60
+
+# 収集情報毎の取得方法(fetch.BACKENDSのキー)
+# JavaScriptで描画されるページに変わった場合は'selenium'に切り替える
+BACKENDS = {
+    'weather': 'http',
+    'train': 'http',
+}
 
 
 class Scraping:
@@ -21,6 +59,28 @@ class Scraping:
     スクレイピング用クラス.
     """
 
+    def __init__(self, pool_size: int = fetch.POOL_SIZE,
+                 backends: dict = None):
+        """
+        param:
+            pool_size 同時に取得するページ数
+            backends {収集情報のキーワード:取得方法}
+        """
+
+        self.pool_size = pool_size
+        self.breaker = breaker.CircuitBreaker()
+        metrics.register('circuit_breaker', self.breaker.states)
+
+        # 直近の収集状況 {収集情報のキーワード:{目的地(路線):{status, attempts, error}}}
+        self.status = {}
+
+        self.backends = {}
+        instances = {}
+        for target, name in dict(BACKENDS, **(backends or {})).items():
+            if name not in instances:
+                instances[name] = fetch.BACKENDS[name](pool_size)
+            self.backends[target] = instances[name]
+
     def get_target_from_db(self, target: str) -> dict:
         """
         リアルタイムで収集する情報（天気予報、運行情報）のURLをDBから取得する.
@@ -55,48 +115,432 @@ class Scraping:
             
         return target_info
 
-    def collect_weather(self) -> dict:
+    def collect(self, targets: list) -> dict:
         """
-        天気予報をスクレイピングする.
+        複数の収集情報(天気予報、運行情報)を同時にスクレイピングする.
+
+        param:
+            targets 収集情報のキーワードのリスト
 
         return:
-            weather_info {場所:{時間:[コメント,気温]}
+            collected {収集情報のキーワード:{目的地(路線):情報}}
+            失敗した目的地(路線)は除外し、1件も収集できなかった収集情報はNone、
+            DBアクセスに失敗した収集情報はFalse
         """
 
-        results = self.get_target_from_db('weather')
-        if results is None:
-            return None
-        elif results is False:
+        collected = {}
+        jobs = []
+        for target in targets:
+            self.status[target] = {}
+            results = self.get_target_from_db(target)
+            if results is None or results is False:
+                collected[target] = results
+                continue
+
+            collected[target] = {}
+            jobs.extend((target, row) for row in results)
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            results = list(executor.map(self.fetch_with_retry, jobs))
+
+        for (target, row), (info, status) in zip(jobs, results):
+            key = row[TARGET_KEYS[target]]
+            self.status[target][key] = status
+            if info is not None:
+                collected[target][key] = info
+
+        for target, info in collected.items():
+            if info == {}:
+                collected[target] = None
+
+        return collected
+
+    def refresh(self, targets: list, use_async: bool = True) -> dict:
+        """
+        スクレイピングし、収集結果をDBに保存する.
+        HTMLは保存された最新の収集結果から生成する
+
+        param:
+            targets 収集情報のキーワードのリスト
+            use_async Trueの場合、非同期で収集し期限内に取得できた分だけ保存する
+
+        return:
+            collected {収集情報のキーワード:{目的地(路線):情報}}
+        """
+
+        start = time.perf_counter()
+        if use_async:
+            collected = self.collect_async(targets)
+        else:
+            collected = self.collect(targets)
+        duration = time.perf_counter() - start
+
+        scraped_at = time.time()
+        for target, info in collected.items():
+            statuses = self.status.get(target, {})
+            log.info('refresh: collected %d' % len(info or {}),
+                     target=target, duration=round(duration, 3),
+                     failed=sum(
+                         1 for status in statuses.values()
+                         if status['status'] != STATUS_OK))
+            if self.store_status(target, statuses, scraped_at) is False:
+                log.error('refresh: store status error', target=target)
+            if not info:
+                continue
+            with metrics.timer('sqlite', target):
+                stored = self.store(target, info, scraped_at, statuses)
+            if stored is False:
+                metrics.fail('sqlite', target)
+                log.error('refresh: store error', target=target)
+
+        return collected
+
+    def store(self, target: str, collected: dict, scraped_at: float,
+              statuses: dict = None, conn: object = None) -> bool:
+        """
+        収集結果をDBに保存し、保存期間を過ぎた収集結果を削除する.
+        キャッシュから返したページは、保存日時ではなくキャッシュの取得日時で保存する
+        connを渡した場合はコミットせず、コミット、ロールバックは呼び出し元で行う
+
+        param:
+            target 収集情報のキーワード
+            collected {目的地(路線):情報}
+            scraped_at 収集日時(UNIX時間)
+            statuses {目的地(路線):{status, attempts, error, fetched_at}}
+            conn 共有する接続
+
+        return:
+            True
+        """
+
+        try:
+            if target == 'weather':
+                db = dbaccess.WeatherSnapshot(conn)
+            elif target == 'train':
+                db = dbaccess.TrainSnapshot(conn)
+        except RuntimeError:
+            log.error('store: RuntimeError')
             return False
 
-        weather_info = {}
-        for row in results:
-            place = row['place']
-            
+        # 前回の収集結果と比べ、変化した路線を保存前に記録する
+        # 比較から保存までを1つのトランザクションで行い、変化の重複、欠落を防ぐ
+        try:
+            if not db.conn.in_transaction:
+                db.conn.execute("BEGIN IMMEDIATE")
+            if target == 'train':
+                changes = self.detect_changes(db, collected)
+                if changes is False or self.store_changes(
+                        changes, scraped_at, db.conn) is False:
+                    log.error('store: change error')
+                    db.close()
+                    return False
+
+            for key, info in collected.items():
+                fetched_at = (statuses or {}).get(key, {}).get('fetched_at')
+                if db.insert(key, info, fetched_at or scraped_at) is False:
+                    log.error('store: insert error')
+                    db.close()
+                    return False
+
+            if db.delete_before(scraped_at - SNAPSHOT_RETENTION) is False:
+                log.error('store: delete error')
+                db.close()
+                return False
+        except sqlite3.Error as e:
+            log.error('store: sqlite error', error=repr(e))
+            db.close()
+            return False
+
+        if conn is not None:
+            db.close()
+        elif db.commit() is False:
+            log.error('store: commit error')
+            return False
+
+        return True
+
+    def detect_changes(self, db: object, collected: dict) -> list:
+        """
+        前回の収集結果から見出し、コメントが変化した路線を返す.
+        前回の収集結果が無い路線は変化としない
+
+        param:
+            db TrainSnapshot
+            collected {路線:{heading:見出し,comment:コメント}}
+
+        return:
+            changes [(路線, 情報, 前回の情報)]
+        """
+
+        changes = []
+        for route, info in collected.items():
+            previous = db.select_latest(route)
+            if previous is False:
+                return False
+            if previous is None:
+                continue
+            if (info['heading'], info['comment']) != (
+                    previous['heading'], previous['comment']):
+                changes.append((route, info, previous))
+
+        return changes
+
+    def store_changes(self, changes: list, changed_at: float, conn: object) -> bool:
+        """
+        運行情報の変化をDBに保存し、保存期間を過ぎた変化を削除する.
+        コミットは収集結果と一緒に呼び出し元で行う
+
+        param:
+            changes [(路線, 情報, 前回の情報)]
+            changed_at 検知日時(UNIX時間)
+            conn 収集結果を保存する接続
+
+        return:
+            True
+        """
+
+        db = dbaccess.TrainChange(conn)
+        for route, info, previous in changes:
+            if db.insert(route, info, previous, changed_at) is False:
+                log.error('store_changes: insert error')
+                db.close()
+                return False
+            log.info('store_changes: changed', route=route,
+                     heading=info['heading'])
+
+        if db.delete_before(changed_at - SNAPSHOT_RETENTION) is False:
+            log.error('store_changes: delete error')
+            db.close()
+            return False
+        db.close()
+
+        return True
+
+    def store_status(self, target: str, statuses: dict, updated_at: float) -> bool:
+        """
+        目的地(路線)毎の収集状況をDBに保存する.
+
+        param:
+            target 収集情報のキーワード
+            statuses {目的地(路線):{status, attempts, error}}
+            updated_at 更新日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        if not statuses:
+            return True
+
+        try:
+            db = dbaccess.CollectStatus()
+        except RuntimeError:
+            log.error('store_status: RuntimeError')
+            return False
+
+        for key, status in statuses.items():
+            if db.upsert(target, key, status, updated_at) is False:
+                log.error('store_status: upsert error')
+                return False
+
+        if db.commit() is False:
+            log.error('store_status: commit error')
+            return False
+
+        return True
+
+    def collect_async(self, targets: list, fetch_timeout: float = FETCH_TIMEOUT,
+                      deadline: float = DEADLINE) -> dict:
+        """
+        DBに登録された全URLを一斉に非同期でスクレイピングする.
+        タイムアウト、期限切れ、失敗した目的地(路線)は除外し、取得できた分だけ返す
+
+        param:
+            targets 収集情報のキーワードのリスト
+            fetch_timeout 1件毎のタイムアウト(秒)
+            deadline 収集全体の期限(秒)
+
+        return:
+            collected {収集情報のキーワード:{目的地(路線):情報}}
+            1件も収集できなかった収集情報はNone、DBアクセスに失敗した収集情報はFalse
+        """
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(
+                self._collect_async(loop, targets, fetch_timeout, deadline))
+        finally:
+            loop.close()
+
+    async def _collect_async(self, loop: object, targets: list,
+                             fetch_timeout: float, deadline: float) -> dict:
+        """
+        collect_asyncの本体.
+        """
+
+        collected = {}
+        jobs = []
+        for target in targets:
+            self.status[target] = {}
+            results = self.get_target_from_db(target)
+            if results is None or results is False:
+                collected[target] = results
+                continue
+
+            collected[target] = {}
+            jobs.extend((target, row) for row in results)
+
+        if not jobs:
+            return collected
+
+        executor = ThreadPoolExecutor(max_workers=min(len(jobs), ASYNC_WORKERS))
+        tasks = [
+            asyncio.ensure_future(asyncio.wait_for(
+                loop.run_in_executor(
+                    executor, self.fetch_with_retry, job, fetch_timeout),
+                fetch_timeout))
+            for job in jobs
+        ]
+        await asyncio.wait(tasks, timeout=deadline)
+
+        for (target, row), task in zip(jobs, tasks):
+            key = row[TARGET_KEYS[target]]
+            if not task.done():
+                task.cancel()
+                self.status[target][key] = {
+                    'status': STATUS_DEADLINE, 'attempts': 0, 'error': None}
+                log.warn('collect_async: deadline exceeded',
+                         target=target, url=row['url'])
+                continue
+            if isinstance(task.exception(), asyncio.TimeoutError):
+                self.breaker.failure(row['url'])
+                self.status[target][key] = {
+                    'status': STATUS_TIMEOUT, 'attempts': 0, 'error': None}
+                log.warn('collect_async: timeout', target=target, url=row['url'])
+                continue
+            if task.exception() is not None:
+                self.status[target][key] = {
+                    'status': STATUS_FAILED, 'attempts': 0,
+                    'error': repr(task.exception())}
+                log.error('collect_async: %r' % task.exception(),
+                          target=target, url=row['url'])
+                continue
+
+            info, self.status[target][key] = task.result()
+            if info is not None:
+                collected[target][key] = info
+
+        # 期限切れのスレッドは待たずに打ち切る
+        executor.shutdown(wait=False)
+
+        for target, info in collected.items():
+            if info == {}:
+                collected[target] = None
+
+        return collected
+
+    def fetch_with_retry(self, job: tuple, timeout: float = FETCH_TIMEOUT) -> tuple:
+        """
+        1件スクレイピングし、失敗した場合は待ち時間を倍にしながら再試行する.
+        サーキットブレーカーにより停止中のホストには通信しない
+        再試行し、サーキットブレーカーに数えるのはホストの障害(fetch.FetchError)だけ
+        ページの問題(fetch.PageError)、その他の例外はそのURLの失敗として記録し、再試行しない
+        再試行の待ち時間がtimeoutを超える場合は再試行しない
+
+        param:
+            job (収集情報のキーワード, DBの行)
+            timeout 再試行を含めた期限(秒)
+
+        return:
+            (info, status) infoは失敗した場合None、statusは{status, attempts, error}
+            成功した場合、statusのfetched_atはページの取得日時(不明な場合None)
+        """
+
+        target, row = job
+        url = row['url']
+        start = time.perf_counter()
+        attempts = 0
+        while True:
+            if not self.breaker.allow(url):
+                metrics.fail('circuit_open', target)
+                return None, {
+                    'status': STATUS_SKIPPED, 'attempts': attempts,
+                    'error': 'circuit open'}
+
+            attempts += 1
             try:
-                DRIVER.get(row['url'])
-            except Exception:
-                log.error('collect_weather: target url is None')
-                return None
+                info = self.fetch(job)
+            except fetch.FetchError as e:
+                error = repr(e)
+            except Exception as e:
+                # ホストは応答している(PageError)か、ホストの障害か分からない
+                if isinstance(e, fetch.PageError):
+                    self.breaker.success(url)
+                else:
+                    self.breaker.release(url)
+                log.warn('fetch_with_retry: page error', target=target, url=url,
+                         error=repr(e))
+                return None, {
+                    'status': STATUS_ERROR, 'attempts': attempts,
+                    'error': repr(e)}
+            else:
+                self.breaker.success(url)
+                return info, {
+                    'status': STATUS_OK, 'attempts': attempts, 'error': None,
+                    'fetched_at': self.backends[target].fetched_at(url)}
+
+            self.breaker.failure(url)
+            wait = min(BACKOFF_MAX, BACKOFF * 2 ** (attempts - 1))
+            wait *= random.uniform(0.5, 1)
+            if attempts > RETRIES or time.perf_counter() - start + wait >= timeout:
+                return None, {
+                    'status': STATUS_FAILED, 'attempts': attempts,
+                    'error': error}
+
+            log.warn('fetch_with_retry: retry', target=target, url=url,
+                     attempts=attempts, wait=round(wait, 3))
+            metrics.fail('retry', target)
+            time.sleep(wait)
+
+    def fetch(self, job: tuple) -> dict:
+        """
+        収集情報毎の取得方法で1件スクレイピングする.
 
+        param:
+            job (収集情報のキーワード, DBの行)
+
+        return:
+            info 解析済みの情報
+            失敗した場合はfetch.FetchError、fetch.PageErrorを送出する
+        """
+
+        target, row = job
+        backend = self.backends[target]
+        # 失敗はmetrics.timerが記録する
+        with metrics.timer('fetch', target):
+            if target == 'weather':
+                fetched = backend.fetch_weather(row['url'])
+            elif target == 'train':
+                fetched = backend.fetch_train(row['url'])
+
+        with metrics.timer('parse', target):
             try:
-                selenium_obj = DRIVER.find_element_by_class_name("hour")
-                times = selenium_obj.text
-                not_current_time = [
-                    val.text
-                    for val in selenium_obj.find_elements_by_class_name("past")
-                ]
-                comments = DRIVER.find_element_by_class_name("weather").text
-                temps = DRIVER.find_element_by_class_name("temperature").text
-            except NoSuchElementException:
-                log.error('collect_weather: target row is None')
-                return None
-            
-            info = self.parse_weather(times, not_current_time, comments, temps)
+                if target == 'weather':
+                    return self.parse_weather(*fetched)
+                elif target == 'train':
+                    return self.parse_train(fetched)
+            except (IndexError, KeyError, TypeError, ValueError) as e:
+                raise fetch.PageError('parse error: %r' % e)
 
-            weather_info[place] = info
+    def collect_weather(self) -> dict:
+        """
+        天気予報をスクレイピングする.
+
+        return:
+            weather_info {場所:{時間:[コメント,気温]}
+        """
 
-        return weather_info
+        return self.collect(['weather'])['weather']
 
     def parse_weather(self, times: list, not_current_time: list,
                       comments: list, temps: list) -> dict:
@@ -104,10 +548,10 @@ class Scraping:
         天気予報収集データを解析する.
 
         param:
-            times 時間
-            not_current_time 現在時刻以外
-            comments コメント
-            temps 気温
+            times 時間のリスト
+            not_current_time 現在時刻以外の時間のリスト
+            comments コメントのリスト
+            temps 気温のリスト
 
         return:
             info {時間:[コメント,気温]}
@@ -115,7 +559,7 @@ class Scraping:
 
         info = {}
         flag = False
-        for time, com, temp in zip(times.split(), comments.split()[1:], temps.split()):
+        for time, com, temp in zip(times, comments, temps):
             disp_time = time.strip('0') + '時'
 
             if time not in not_current_time and flag is False:
@@ -134,48 +578,24 @@ class Scraping:
             train_info {路線:{heading:見出し,comment:コメント}}
         """
 
-        results = self.get_target_from_db('train')
-        if results is None:
-            return None
-        elif results is False:
-            return False
-
-        train_info = {}
-        for row in results:
-            try:
-                DRIVER.get(row['url'])
-            except Exception:
-                log.error('collect_train: target url is None')
-                return None
-
-            try:
-                service_status = DRIVER.find_element_by_id("mdServiceStatus").text
-            except NoSuchElementException:
-                log.error('collect_train: target info is None')
-                return None
+        return self.collect(['train'])['train']
 
-            service_info = self.parse_train(service_status)
-
-            train_info[row['route']] = service_info
-
-        return train_info
-
-    def parse_train(self, service_status: str) -> dict:
+    def parse_train(self, service_status: list) -> dict:
         """
         運行情報収集データを解析する.
 
         param:
-            service_status 運行情報
+            service_status 運行情報の行のリスト(先頭行はアイコン[○]から始まる)
 
         return:
             info {heading:見出し,comment:コメント}
         """
 
         info = {}
-        heading = service_status[3:].split('\n')[0]
+        heading = service_status[0][3:]
         info['heading'] = heading
 
-        comment = service_status[3:].split('\n')[1]
+        comment = service_status[1]
         info['comment'] = comment
 
         return info
@@ -187,8 +607,8 @@ class Scraping:
         そのため、全サイトのスクレイピング完了時に当関数をコールしdriverクローズ
         """
 
-        DRIVER.close()
-        DRIVER.quit()
+        for backend in set(self.backends.values()):
+            backend.close()
 
 
 class Insert:
@@ -198,119 +618,195 @@ class Insert:
     """
 
     def __init__(self):
-        self.weather_traget = {
-            """
-            場所: 収集URL(tenki.jp)
-            """
-        }
-        self.train_traget = {
-            """
-            路線: 収集URL(transit.yahoo.co.jp)
-            """
-        }
         self.english_traget = [
             """
             収集URL(eigo-duke.com)
             """
         ]
 
-    def insert_weather(self) -> bool:
+    def iter_target_file(self, target: str, path: str):
         """
-        天気予報(収集URL)をDBに登録する.
+        CSV/JSONファイルから収集先を読み込む.
+        拡張子が.jsonの場合はJSON、それ以外はCSVとして扱う
+            CSV  1列目:目的地(路線), 2列目:収集url(1行目が見出しの場合は読み飛ばす)
+            JSON {目的地(路線):収集url} または [{place(route):目的地(路線), url:収集url}]
+
+        param:
+            target 収集情報のキーワード
+            path ファイルパス
 
         return:
-            True
+            (目的地(路線), 収集url)
         """
 
-        try:
-            db = dbaccess.Weather()
-        except RuntimeError:
-            log.error('insert_weather: RuntimeError')
-            return False
+        key = TARGET_KEYS[target]
+        with open(path, encoding='utf-8', newline='') as file:
+            if path.endswith('.json'):
+                data = json.load(file)
+                if isinstance(data, dict):
+                    rows = list(data.items())
+                else:
+                    rows = [(item.get(key), item.get('url')) for item in data]
+            else:
+                rows = csv.reader(file)
 
-        for place in self.weather_traget:
-            if db.insert(place, self.weather_traget[place]) is False:
-                log.error('insert_weather: insert error')
-                return False
+            for row in rows:
+                if len(row) < 2:
+                    continue
+                name, url = (row[0] or '').strip(), (row[1] or '').strip()
+                if not name or not url or (name == key and url == 'url'):
+                    continue
+                yield name, url
 
-        if db.commit() is False:
-            log.error('insert_weather: commit error')
-            return False
+    def read_targets(self, target: str, path: str) -> dict:
+        """
+        CSV/JSONファイルから収集先を読み込み、重複を除く.
+        同じ目的地(路線)は後の行を、同じURLは先の行を採用する
 
-        log.info('insert_weather: commit Complete!')
-        return True
+        param:
+            target 収集情報のキーワード
+            path ファイルパス
 
-    def insert_train(self) -> bool:
+        return:
+            entries {目的地(路線):収集url}
         """
-        運行情報(収集URL)をDBに登録する.
+
+        entries = {}
+        owners = {}
+        for name, url in self.iter_target_file(target, path):
+            owner = owners.get(url)
+            if owner is not None and owner != name:
+                log.warn('read_targets: duplicate url', target=target,
+                         key=name, url=url, used=owner)
+                continue
+            if name in entries:
+                owners.pop(entries[name], None)
+            entries[name] = url
+            owners[url] = name
+
+        return entries
+
+    def import_targets(self, target: str, path: str, dry_run: bool = False) -> dict:
+        """
+        収集先をDBに一括登録(更新)する.
+        登録済みの目的地(路線)はURLを更新し、ファイルに無い収集先は残す
+
+        param:
+            target 収集情報のキーワード
+            path CSV/JSONファイルパス
+            dry_run Trueの場合、差分を返すだけで登録しない
 
         return:
-            True
+            diff {added:[(目的地, url)], updated:[(目的地, 旧url, 新url)],
+                  removed:[(目的地, url)], unchanged:件数}
         """
 
         try:
-            db = dbaccess.Train()
+            entries = self.read_targets(target, path)
+        except (OSError, ValueError, AttributeError) as e:
+            log.error('import_targets: %r' % e, target=target)
+            return False
+
+        try:
+            if target == 'weather':
+                db = dbaccess.Weather()
+            elif target == 'train':
+                db = dbaccess.Train()
         except RuntimeError:
-            log.error('insert_train: RuntimeError')
+            log.error('import_targets: RuntimeError')
             return False
 
-        for route in self.train_traget:
-            if db.insert(route, self.train_traget[route]) is False:
-                log.error('insert_train: insert error')
-                return False
+        try:
+            if dry_run:
+                diff = db.diff(entries)
+            else:
+                diff = db.upsert(entries)
+        except sqlite3.Error as e:
+            log.error('import_targets: %r' % e, target=target)
+            return False
+        finally:
+            db.close()
 
-        if db.commit() is False:
-            log.error('insert_train: commit error')
+        if diff is False:
+            log.error('import_targets: select error', target=target)
             return False
 
-        log.info('insert_train: commit Complete!')
-        return True
+        log.info('import_targets: complete', target=target, dry_run=dry_run,
+                 read=len(entries), added=len(diff['added']),
+                 updated=len(diff['updated']), removed=len(diff['removed']),
+                 unchanged=diff['unchanged'])
+        return diff
 
-    def collect_english(self) -> list:
+    def iter_english(self):
         """
         サイトから英単語、日本語を収集する.
+        1ページ毎に(英単語, 日本語)を返す
 
         return:
-            english_info 英単語
-            japanese_info 日本語
+            (英単語, 日本語)
         """
 
-        english_info = []
-        japanese_info = []
-        for url in self.english_traget:
-            try:
-                DRIVER.get(url)
-            except Exception:
-                log.error('collect_english: target url is None')
-                continue
+        from selenium.common.exceptions import NoSuchElementException
 
-            try:
-                english_text = [
-                    eng.text
-                    for eng in DRIVER.find_elements_by_class_name("eng")
-                ]
-                japanese_text = [
-                    jap.text
-                    for jap in DRIVER.find_elements_by_class_name("jap")
-                ]
-            except NoSuchElementException:
-                log.error('collect_english: target text is None')
-                return None
+        pool = fetch.DriverPool(1)
+        driver = pool.acquire()
 
-            english_info.extend(english_text)
-            japanese_info.extend(japanese_text)
+        try:
+            for url in self.english_traget:
+                try:
+                    driver.get(url)
+                except Exception:
+                    log.error('iter_english: target url is None')
+                    continue
+
+                try:
+                    english_text = [
+                        eng.text
+                        for eng in driver.find_elements_by_class_name("eng")
+                    ]
+                    japanese_text = [
+                        jap.text
+                        for jap in driver.find_elements_by_class_name("jap")
+                    ]
+                except NoSuchElementException:
+                    log.error('iter_english: target text is None')
+                    continue
+
+                for row in zip(english_text, japanese_text):
+                    yield row
+        finally:
+            pool.close()
+
+    def iter_english_file(self, path: str):
+        """
+        CSV/TSVファイルから英単語、日本語を読み込む.
+        拡張子が.tsvの場合はタブ区切り、それ以外はカンマ区切りとして扱う
 
-        DRIVER.close()
-        DRIVER.quit()
+        param:
+            path ファイルパス(1列目:英単語, 2列目:日本語)
+
+        return:
+            (英単語, 日本語)
+        """
 
-        return english_info, japanese_info
+        delimiter = '\t' if path.endswith('.tsv') else ','
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.reader(file, delimiter=delimiter):
+                if len(row) < 2 or row[0].strip().lower() == 'english':
+                    continue
+                english, japanese = row[0].strip(), row[1].strip()
+                if english and japanese:
+                    yield english, japanese
 
-    def insert_english(self) -> bool:
+    def insert_english(self, path: str = None) -> bool:
         """
-        英単語をDBに登録する.
+        英単語をDBに一括登録する.
+
+        param:
+            path CSV/TSVファイルパス(省略時はサイトから収集)
 
         return:
-            True
+            stats {read:読込件数, inserted:登録件数, seconds:処理時間}
         """
 
         try:
@@ -319,15 +815,18 @@ class Insert:
             log.error('insert_english: RuntimeError')
             return False
 
-        english_info, japanese_info = self.collect_english()
-        for eng, jap in zip(english_info, japanese_info):
-            if db.insert(eng, jap) is False:
-                log.error('insert_english: insert error')
-                return False
+        if path is None:
+            rows = self.iter_english()
+        else:
+            rows = self.iter_english_file(path)
 
-        if db.commit() is False:
-            log.error('insert_english: commit error')
+        try:
+            stats = db.bulk_insert(rows)
+        except (OSError, sqlite3.Error) as e:
+            log.error('insert_english: %r' % e)
             return False
+        finally:
+            db.close()
 
-        log.info('insert_english: commit Complete!')
-        return True
\ No newline at end of file
+        log.info('insert_english: commit Complete!', **stats)
+        return stats
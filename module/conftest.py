@@ -0,0 +1,32 @@
+"""
+テスト共通のフィクスチャ.
+benchmark.workdirと同じく<一時ディレクトリ>/module/をカレントディレクトリにし、
+DB(daily.db)、ログ(../log/)、メトリクス(../metrics/)を一時ディレクトリに作る
+"""
+import pytest
+import dbaccess
+
+
+@pytest.fixture
+def module_dir(tmp_path, monkeypatch):
+    """
+    <一時ディレクトリ>/module/をカレントディレクトリにする.
+    """
+
+    path = tmp_path / 'module'
+    path.mkdir()
+    monkeypatch.chdir(str(path))
+
+    return path
+
+
+@pytest.fixture
+def workdir(module_dir, monkeypatch):
+    """
+    DBを<一時ディレクトリ>/module/daily.dbに切り替える. テーブルは作らない
+    """
+
+    monkeypatch.setattr(dbaccess, 'DB_PATH', str(module_dir / 'daily.db'))
+    monkeypatch.setattr(dbaccess, 'POOL', dbaccess.ConnectionPool(dbaccess.DB_PATH))
+    yield module_dir
+    dbaccess.POOL.close()
@@ -1,64 +1,57 @@
 """
 HTML生成モジュール.
 """
-import collect
+import glob
+import json
+import os
+import time
+import assets
 import dbaccess
 import log
+import metrics
+import template
 
 # 静的ファイルのパス定義
-CSS_PATH = 'static/css/'
-JS_PATH = 'static/js/'
 IMG_PATH = 'static/img/'
 
+# ビルド済みの静的ファイル(assets.py) ビルドしていない場合はCDN、static/を参照する
+MANIFEST = assets.load_manifest()
 
-class CreateHtml:
-    """
-    天気予報、運行情報、英単語HTML生成クラス.
-    """
-    
-    def __init__(self, target_list: list):
-        """
-        ヘッダ、フッタを生成する.
+# デバッグ用データの出力先、1ファイルあたりの行数
+DEBUG_DATA_PATH = '../debug/'
+DEBUG_CHUNK_SIZE = 5000
 
-        param:
-            target_list HTML作成対象リスト
-        """
+# JSONの出力先、差分を出力するHTML作成対象
+FEED_PATH = '../'
+DELTA_TARGETS = ('weather', 'train')
 
-        self.ins = collect.Scraping()
+# 英単語の出題方法
+# random ランダム
+# review 復習日時を過ぎた英単語を優先(表示する度に復習間隔を延ばす)
+ENGLISH_MODE = 'random'
 
-        for target in target_list:
-            self.target = target
-            if self.target == 'weather':
-                self.title = '天気予報'
-            elif self.target == 'train':
-                self.title = '運行情報'
-            elif self.target == 'english':
-                self.title = '今日の英単語'
-
-            self.header = f'''
+# HTML作成対象毎のタイトル
+TITLES = {
+    'weather': '天気予報',
+    'train': '運行情報',
+    'english': '今日の英単語',
+}
+
+# ページの骨格(全HTML作成対象で共有)
+PAGE = template.Page('''
             <!DOCTYPE html>
             <html lang="ja">
             <head>
-            <title>{ self.title }</title>
-            <meta charset="utf-8">
-            <link rel="stylesheet" href="https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.css"/>
-            <link rel="stylesheet" href="https://cdn.datatables.net/responsive/2.2.3/css/responsive.dataTables.min.css"/>
-            <link rel="stylesheet" type="text/css" href="{ CSS_PATH }common.css">
-            <link rel="stylesheet" type="text/css" href="{ CSS_PATH }{ self.target }.css">
-            <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script>
-            <script src="https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.js"></script>
-            <script src="https://cdn.datatables.net/responsive/2.2.3/js/dataTables.responsive.min.js"></script>
-            <script src="{ JS_PATH }common.js"></script>
+            <title>{{ title }}</title>
+            <meta charset="utf-8">{{ assets }}
             </head>
             <body>
             <header>
             <div id="headWrap">
-            <h1>{ self.title }</h1>
+            <h1>{{ title }}</h1>
             </div>
             </header>
-            <main>'''
-
-            self.footer = f'''
+            <main>{{ body }}
             </main>
             <footer>
             <div id="footerWrap">
@@ -68,71 +61,281 @@ class CreateHtml:
             </div>
             </footer>
             </body>
-            </html>'''
+            </html>''')
 
-            self.create_html()
+DEBUG_PAGE = template.Page('''
+        <!DOCTYPE html>
+        <html lang="ja">
+        <head>
+        <title>デバッグ</title>
+        <meta charset="utf-8">{{ assets }}
+        </head>
+        <body>
+        <header>
+        <div id="headWrap">
+        <h1>デバッグ</h1>
+        </div>
+        </header>
+        <main>{{ body }}
+        </main>
+        <footer>
+        </footer>
+        </body>
+        </html>''')
 
-    def create_html(self):
+
+def read_json(path: str) -> dict:
+    """
+    JSONファイルを読み込む.
+
+    param:
+        path ファイルパス
+
+    return:
+        data 存在しない、壊れている場合None
+    """
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: str, data: object):
+    """
+    JSONファイルを出力する.
+    読み込み中のクライアントに書きかけのファイルを返さないよう、一時ファイルに書いてから置き換える
+
+    param:
+        path ファイルパス
+        data 出力するデータ
+    """
+
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+
+
+class CreateHtml:
+    """
+    天気予報、運行情報、英単語HTML生成クラス.
+    """
+    
+    def __init__(self, target_list: list):
         """
-        ヘッダ、body、フッタを結合し、HTML生成.
+        HTMLを生成する.
+        天気予報、運行情報はDBに保存された最新の収集結果から生成する
+
+        param:
+            target_list HTML作成対象リスト
         """
 
-        html = self.header
+        for target in target_list:
+            self.target = target
+            self.title = TITLES[target]
+            self.create_html()
 
+    def create_body(self) -> list:
+        """
+        HTML作成対象のHTMLBodyを生成する.
+
+        return:
+            body HTMLBodyの断片のリスト
+        """
+
+        self.feed = None
         if self.target == 'weather':
             body = self.create_body_about_weather()
         elif self.target == 'train':
             body = self.create_body_about_train()
         elif self.target == 'english':
             body = self.create_body_about_english()
-        
-        if body is None:
 
-            html += f'''
-            <p class="leadText">収集に失敗しました<p>'''
+        if body is None:
+            return ['''
+            <p class="leadText">収集に失敗しました<p>''']
         elif body is False:
+            return ['''
+            <p class="leadText">データベースのアクセスに失敗しました<p>''']
 
-            html += f'''
-            <p class="leadText">データベースのアクセスに失敗しました<p>'''
-        else:
-            html += body
+        return body
 
-        html += self.footer
+    def create_html(self):
+        """
+        ページの骨格にHTMLBodyを差し込み、HTML生成.
+        """
 
         create_html = f'../{ self.target }.html'
-        with open(create_html, 'wb') as file:
-            file.write(html.encode('utf-8'))
-            log.info('create_html: Complete!')
+        with metrics.timer('render', self.target):
+            PAGE.write(create_html, self.create_body(), title=self.title,
+                       assets=assets.tags([
+                           'css/common.css', f'css/{ self.target }.css',
+                           'js/common.js'
+                       ], MANIFEST))
+            if self.feed is not None:
+                self.write_feed()
+        log.info('create_html: Complete!')
+
+    def write_feed(self):
+        """
+        HTMLと同じ内容をJSON(../<HTML作成対象>.json)で出力する.
+        天気予報、運行情報は前回のJSONから変わった目的地(路線)だけを
+        差分(../<HTML作成対象>.delta.json)として出力する
+        """
+
+        path = f'{ FEED_PATH }{ self.target }.json'
+        generated_at = round(time.time(), 3)
+        previous = read_json(path)
+        write_json(path, {'generated_at': generated_at, 'items': self.feed})
+
+        if self.target not in DELTA_TARGETS:
+            return
+
+        old = previous.get('items', {}) if previous else {}
+        write_json(f'{ FEED_PATH }{ self.target }.delta.json', {
+            'generated_at': generated_at,
+            'since': previous.get('generated_at') if previous else None,
+            'changed': {
+                key: item for key, item in self.feed.items()
+                if old.get(key) != item
+            },
+            'removed': [key for key in old if key not in self.feed],
+        })
+
+    def select_latest(self, target: str) -> dict:
+        """
+        目的地(路線)毎の最新の収集結果をDBから取得する.
+        収集結果が無い目的地(路線)の情報はNone
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            latest {目的地(路線):情報} 全目的地(路線)の収集結果が無い場合None
+        """
+
+        try:
+            if target == 'weather':
+                db = dbaccess.Weather()
+                snapshot = dbaccess.WeatherSnapshot()
+                key = 'place'
+            elif target == 'train':
+                db = dbaccess.Train()
+                snapshot = dbaccess.TrainSnapshot()
+                key = 'route'
+        except RuntimeError:
+            log.error('select_latest: RuntimeError')
+            return False
+
+        rows = db.select_all()
+        if rows is False:
+            return False
+
+        latest = {}
+        for row in rows:
+            info = snapshot.select_latest(row[key])
+            if info is False:
+                return False
+            latest[row[key]] = info
+
+        if all(info is None for info in latest.values()):
+            return None
+
+        return latest
+
+    def select_status(self, target: str) -> dict:
+        """
+        目的地(路線)毎の収集状況をDBから取得する.
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            statuses {目的地(路線):{status, succeeded_at, ...}} 取得に失敗した場合は空
+        """
+
+        try:
+            statuses = dbaccess.CollectStatus().select_by_target(target)
+        except RuntimeError:
+            log.error('select_status: RuntimeError')
+            return {}
+
+        return statuses or {}
+
+    def create_status(self, status: dict, missing: bool = False) -> str:
+        """
+        直近の収集に失敗した目的地(路線)の注記を生成する.
+
+        param:
+            status 収集状況(無い場合None)
+            missing 収集結果が無い場合True
+
+        return:
+            html 直近の収集に成功している場合は空文字
+        """
+
+        if not missing and (status is None or status['status'] == 'ok'):
+            return ''
+
+        if missing:
+            return '''
+            <p class="status">収集に失敗しました</p>'''
+        if status['succeeded_at'] is None:
+            return '''
+            <p class="status">最新の収集に失敗しました</p>'''
+
+        succeeded_at = time.strftime(
+            '%m/%d %H:%M', time.localtime(status['succeeded_at']))
+        return f'''
+            <p class="status">最新の収集に失敗しました({ succeeded_at }時点の情報)</p>'''
 
     def create_body_about_weather(self) -> str:
         """
         天気予報のHTMLBody生成.
+
+        return:
+            body HTMLBodyの断片のリスト
         """
 
-        weather_info = self.ins.collect_weather()
+        with metrics.timer('sqlite', 'weather'):
+            weather_info = self.select_latest('weather')
+            statuses = self.select_status('weather')
         if weather_info is None:
             return None
         elif weather_info is False:
             return False
 
-        body = ''
+        body = []
+        self.feed = {}
         for place, info in weather_info.items():
+            self.feed[place] = {
+                'status': statuses.get(place, {}).get('status'),
+                'forecast': info,
+            }
+            status = self.create_status(statuses.get(place), info is None)
+            if info is None:
+                body.append(f'''
+            <section>
+            <h2>{ place }</h2>{ status }
+            </section>''')
+                continue
 
-            body += f'''
+            body.append(f'''
             <section>
-            <h2>{ place }</h2>
-            <div class="content">'''
+            <h2>{ place }</h2>{ status }
+            <div class="content">''')
 
             for val in info.values():
                 if 'current' in val:
 
-                    body += f'''
+                    body.append(f'''
                     <div class="current">
                     <p class="current-temp">{ val[1] }&deg;</p>
                     <p class="current-comment">{ val[0] }</p>
-                    </div>'''
+                    </div>''')
 
-            body += '<div class="list">'
+            body.append('<div class="list">')
             for time, val in info.items():
                 comment = val[0]
                 
@@ -147,37 +350,53 @@ class CreateHtml:
                 else:
                     icon = f'{ IMG_PATH }unknown.png'
 
-                body += f'''
+                body.append(f'''
                 <div class="time-unit">
                 <p class="time">{ time }<p>
                 <p class="icon"><img src="{ icon }" alt="{ comment }"><p>
                 <p class="temp">{ val[1] }&deg;</p>
-                </div>'''
+                </div>''')
 
-            body += '</div></div></section>'
+            body.append('</div></div></section>')
 
         return body
 
     def create_body_about_train(self) -> str:
         """
         運行情報のHTMLBody生成.
+
+        return:
+            body HTMLBodyの断片のリスト
         """
 
-        train_info = self.ins.collect_train()
+        with metrics.timer('sqlite', 'train'):
+            train_info = self.select_latest('train')
+            statuses = self.select_status('train')
         if train_info is None:
             return None
         elif train_info is False:
             return False
 
-        body = ''
+        body = []
+        self.feed = {}
         for route, info in train_info.items():
+            self.feed[route] = dict(info or {'heading': None, 'comment': None},
+                                    status=statuses.get(route, {}).get('status'))
+            status = self.create_status(statuses.get(route), info is None)
+            if info is None:
+                body.append(f'''
+            <section>
+            <h2>{ route }</h2>{ status }
+            </section>''')
+                continue
+
             heading = info['heading']
             if heading == '平常運転':
                 icon = f'{ IMG_PATH }circle.png'
-            else heading == '列車遅延':
+            else:
                 icon = f'{ IMG_PATH }alert.png'
 
-            body += f'''
+            body.append(f'''
             <section>
             <h2>{ route }</h2>
             <h3>
@@ -185,14 +404,17 @@ class CreateHtml:
             { heading }
             <span><img src="{ icon }" alt="{ heading }"></span>
             </h3>
-            <p class="comment">{ info['comment'] }</p>
-            </section>'''
+            <p class="comment">{ info['comment'] }</p>{ status }
+            </section>''')
 
         return body
 
     def create_body_about_english(self) -> str:
         """
         英単語のHTMLBody生成.
+
+        return:
+            body HTMLBodyの断片のリスト
         """
 
         try:
@@ -200,124 +422,124 @@ class CreateHtml:
         except RuntimeError:
             return False
 
-        english_info = db.select_random_english()
+        if ENGLISH_MODE == 'review':
+            english_info = db.select_review_english()
+            if english_info and db.commit() is False:
+                return False
+        else:
+            english_info = db.select_random_english()
         if english_info is None:
             return None
         elif english_info is False:
             return False
 
-        body = ''
+        body = []
+        self.feed = [
+            {'english': row['english'], 'japanese': row['japanese']}
+            for row in english_info
+        ]
         for row in english_info:
 
-            body += f'''
+            body.append(f'''
             <div class="content">
             <p class="english">{ row['english'] }</p>
             <p class="japanese">{ row['japanese'] }</p>
             <button class="btn">答えを見る<button>
             </div>
-            <script src="{ JS_PATH }{ self.target }.js"></script>'''
+            <script src="{ assets.urls('js/english.js', MANIFEST)[0] }"></script>''')
 
         return body
 
-    def __del__(self):
-        """
-        driver閉じる.
-        """
-
-        log.info('__del__: driver close')
-        self.ins.close_driver()
-
 
 class Debug:
     """
     デバッグHTML生成クラス.
+    テーブルの行はJSONに分割して出力し、ブラウザで読み込みながら表示する
     """
 
-    def __init__(self):
-        """
-        ヘッダ、フッタを生成する.
-        """
-
-        self.header = f'''
-        <!DOCTYPE html>
-        <html lang="ja">
-        <head>
-        <title>デバッグ</title>
-        <meta charset="utf-8">
-        <link rel="stylesheet" href="https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.css"/>
-        <link rel="stylesheet" type="text/css" href="{ CSS_PATH }common.css">
-        <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script>
-        <script src="https://cdn.datatables.net/t/bs-3.3.6/jqc-1.12.0,dt-1.10.11/datatables.min.js"></script>
-        </head>
-        <body>
-        <header>
-        <div id="headWrap">
-        <h1>デバッグ</h1>
-        </div>
-        </header>
-        <main>'''
-
-        self.footer = f'''
-        </main>
-        <footer>
-        </footer>
-        </body>
-        </html>'''
-
     def create_html_about_debug(self):
         """
         デバッグ用HTMLを生成する.
         """
 
-        html = self.header
+        body = []
 
         debug_list = {
-            'weather': dbaccess.Weather().select_all(),
-            'train': dbaccess.Train().select_all(),
-            'english': dbaccess.EnglishStudy().select_all()
+            'weather': dbaccess.Weather(),
+            'train': dbaccess.Train(),
+            'english': dbaccess.EnglishStudy()
         }
-        for table, rows in debug_list.items():
-
-            html += f'''
-            <script>
-            jQuery(function($){{
-            $("#debug-table-{ table }").DataTable();
-            }});
-            </script>
+        for table, db in debug_list.items():
+            columns = db.columns()
+            chunks = self.create_json_about_debug(table, db.iter_all())
+            db.close()
+
+            body.append(f'''
             <section>
             <h2>{ table }</h2>
-            <table id="debug-table-{ table }" class="table table-bordered">
+            <table id="debug-table-{ table }" class="table table-bordered debug-table"
+             data-url="debug/{ table }-" data-chunks="{ chunks }">
             <thead>
             <tr>
-            '''
+            ''')
 
             # テーブルカラム作成
-            for column in rows[0].keys():
+            for column in columns:
 
-                html += f'''
+                body.append(f'''
                 <th>{ column }</th>
-                '''
+                ''')
             else:
-                html += '</tr></thead>'
+                body.append('</tr></thead></table></section>')
 
-            # テーブルbody作成
-            html += '''<tbody>'''
-            for row in rows:
+        # HTMLファイル生成
+        with metrics.timer('render', 'debug'):
+            DEBUG_PAGE.write('../debug.html', body, assets=assets.tags(
+                ['css/common.css', 'js/common.js', 'js/debug.js'], MANIFEST))
+        log.info('create_html_about_debug: Complete!')
 
-                html += '<tr>'
-                for val in row.values():
+    def create_json_about_debug(self, table: str, rows: object) -> int:
+        """
+        テーブルの行をDEBUG_CHUNK_SIZE行ずつJSONファイルに出力する.
+        出力先 DEBUG_DATA_PATH<テーブル名>-<連番>.json {"data":[[値,...],...]}
 
-                    html += f'''
-                    <td>{ val }</td>
-                    '''
-                else:
-                    html += '</tr>'
-            else:
-                html += '</tbody></table>'
+        param:
+            table テーブル名
+            rows 行のイテラブル
 
-        self.footer += html
+        return:
+            chunks 出力したファイル数
+        """
 
-        # HTMLファイル生成
-        with open('../debug.html', 'wb') as file:
-            file.write(html.encode('utf-8'))
-            log.info('create_html_about_debug: Complete!')
\ No newline at end of file
+        os.makedirs(DEBUG_DATA_PATH, exist_ok=True)
+        for path in glob.glob(f'{ DEBUG_DATA_PATH }{ table }-*.json'):
+            os.remove(path)
+
+        chunks = 0
+        data = []
+        for row in rows:
+            data.append(list(row.values()))
+            if len(data) >= DEBUG_CHUNK_SIZE:
+                self.write_json(table, chunks, data)
+                chunks += 1
+                data = []
+        if data or chunks == 0:
+            self.write_json(table, chunks, data)
+            chunks += 1
+
+        return chunks
+
+    def write_json(self, table: str, num: int, data: list):
+        """
+        JSONファイルを1つ出力する.
+
+        param:
+            table テーブル名
+            num 連番
+            data 行のリスト
+        """
+
+        path = f'{ DEBUG_DATA_PATH }{ table }-{ num }.json'
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'data': data}, file, ensure_ascii=False,
+                      separators=(',', ':'))
@@ -2,7 +2,22 @@
 SQLモジュール
 """
 import sqlite3
+import json
 import os
+import queue
+import random
+import threading
+import time
+import log
+
+# データベースファイル(全テーブル共通)
+DB_PATH = os.path.join(os.getcwd(), "daily.db")
+
+# コネクションプールに保持する接続数の上限
+POOL_SIZE = 8
+
+# ロック解除を待つ時間(秒)
+BUSY_TIMEOUT = 30
 
 # テーブル定義
 DATABASES = {
@@ -20,29 +35,332 @@ DATABASES = {
         ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
         ("english", "text", "NOT NULL"),
         ("japanese", "text", "NOT NULL"),
+        ("next_review", "real", "NOT NULL DEFAULT 0"),
+        ("interval", "real", "NOT NULL DEFAULT 0"),
+    ],
+    "weather_snapshot": [
+        ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
+        ("place", "text", "NOT NULL"),
+        ("info", "text", "NOT NULL"),
+        ("scraped_at", "real", "NOT NULL"),
+    ],
+    "train_snapshot": [
+        ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
+        ("route", "text", "NOT NULL"),
+        ("heading", "text", "NOT NULL"),
+        ("comment", "text", "NOT NULL"),
+        ("scraped_at", "real", "NOT NULL"),
+    ],
+    "train_change": [
+        ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
+        ("route", "text", "NOT NULL"),
+        ("heading", "text", "NOT NULL"),
+        ("comment", "text", "NOT NULL"),
+        ("previous_heading", "text", "NOT NULL"),
+        ("previous_comment", "text", "NOT NULL"),
+        ("changed_at", "real", "NOT NULL"),
+    ],
+    "collect_status": [
+        ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
+        ("target", "text", "NOT NULL"),
+        ("key", "text", "NOT NULL"),
+        ("status", "text", "NOT NULL"),
+        ("attempts", "integer", "NOT NULL DEFAULT 0"),
+        ("error", "text", ""),
+        ("updated_at", "real", "NOT NULL"),
+        ("succeeded_at", "real", ""),
+    ],
+    "scrape_job": [
+        ("pkey", "integer", "PRIMARY KEY AUTOINCREMENT"),
+        ("target", "text", "NOT NULL"),
+        ("key", "text", "NOT NULL"),
+        ("url", "text", "NOT NULL"),
+        ("status", "text", "NOT NULL"),
+        ("attempts", "integer", "NOT NULL DEFAULT 0"),
+        ("lease_owner", "text", ""),
+        ("lease_expires", "real", ""),
+        ("error", "text", ""),
+        ("enqueued_at", "real", "NOT NULL"),
+        ("updated_at", "real", "NOT NULL"),
+    ],
+}
+
+# インデックス定義
+# UNIQUEインデックスを作成する際、既存の重複行は最初の1件を残して削除する
+INDEXES = {
+    "weather": [
+        ("weather_place", "place", "UNIQUE"),
+        ("weather_url", "url", "UNIQUE"),
+    ],
+    "train": [
+        ("train_route", "route", "UNIQUE"),
+        ("train_url", "url", "UNIQUE"),
+    ],
+    "english_study": [
+        ("english_study_english", "english", "UNIQUE"),
+        ("english_study_next_review", "next_review", ""),
+    ],
+    "weather_snapshot": [
+        ("weather_snapshot_place_scraped_at", "place, scraped_at", ""),
+        ("weather_snapshot_scraped_at", "scraped_at", ""),
+    ],
+    "train_snapshot": [
+        ("train_snapshot_route_scraped_at", "route, scraped_at", ""),
+        ("train_snapshot_scraped_at", "scraped_at", ""),
+    ],
+    "train_change": [
+        ("train_change_changed_at", "changed_at", ""),
+    ],
+    "collect_status": [
+        ("collect_status_target_key", "target, key", "UNIQUE"),
+    ],
+    "scrape_job": [
+        ("scrape_job_target_key", "target, key", "UNIQUE"),
+        ("scrape_job_status_enqueued_at", "status, enqueued_at", ""),
     ],
 }
 
+# マイグレーション(スキーマの版毎の変更)
+# 版番号(1始まりの添字)はPRAGMA user_versionに記録し、未適用の版だけを順に適用する
+# 適用済みの版は変更せず、スキーマを変える場合は末尾に版を追加する
+#   ("table", テーブル名)               DATABASESの定義でテーブルを生成する
+#   ("column", テーブル名, カラム名)    DATABASESの定義でカラムを追加する
+#   ("index", テーブル名, インデックス名) INDEXESの定義でインデックスを生成する
+# 版管理以前のデータベースも版0から適用できるよう、どの変更も適用済みであれば何もしない
+MIGRATIONS = [
+    # 1: 収集先、英単語
+    [
+        ("table", "weather"),
+        ("table", "train"),
+        ("table", "english_study"),
+    ],
+    # 2: 英単語の復習
+    [
+        ("column", "english_study", "next_review"),
+        ("column", "english_study", "interval"),
+        ("index", "english_study", "english_study_english"),
+        ("index", "english_study", "english_study_next_review"),
+    ],
+    # 3: 収集結果
+    [
+        ("table", "weather_snapshot"),
+        ("table", "train_snapshot"),
+        ("index", "weather_snapshot", "weather_snapshot_place_scraped_at"),
+        ("index", "train_snapshot", "train_snapshot_route_scraped_at"),
+    ],
+    # 4: 収集状況
+    [
+        ("table", "collect_status"),
+        ("index", "collect_status", "collect_status_target_key"),
+    ],
+    # 5: ジョブキュー
+    [
+        ("table", "scrape_job"),
+        ("index", "scrape_job", "scrape_job_target_key"),
+        ("index", "scrape_job", "scrape_job_status_enqueued_at"),
+    ],
+    # 6: 運行情報の変化
+    [
+        ("table", "train_change"),
+        ("index", "train_change", "train_change_changed_at"),
+    ],
+    # 7: 収集先の重複防止
+    [
+        ("index", "weather", "weather_place"),
+        ("index", "weather", "weather_url"),
+        ("index", "train", "train_route"),
+        ("index", "train", "train_url"),
+    ],
+    # 8: 保存期間を過ぎた収集結果の削除
+    [
+        ("index", "weather_snapshot", "weather_snapshot_scraped_at"),
+        ("index", "train_snapshot", "train_snapshot_scraped_at"),
+    ],
+]
+
+# 取り込み済みのテーブル毎のデータベースファイルに付ける拡張子
+LEGACY_SUFFIX = ".imported"
+
+# 実行計画を確認する頻出クエリ(名前, SQL)
+# check_query_plansでテーブルの全件走査になっていないことを確認する
+QUERY_PLANS = [
+    ("weather.delete_by_route", "DELETE FROM weather WHERE place = ?"),
+    ("train.delete_by_route", "DELETE FROM train WHERE route = ?"),
+    ("weather_snapshot.select_latest",
+     "SELECT * FROM weather_snapshot WHERE place = ? ORDER BY scraped_at DESC LIMIT 1"),
+    ("weather_snapshot.delete_before", "DELETE FROM weather_snapshot WHERE scraped_at < ?"),
+    ("train_snapshot.select_latest",
+     "SELECT heading, comment FROM train_snapshot "
+     "WHERE route = ? ORDER BY scraped_at DESC LIMIT 1"),
+    ("train_snapshot.delete_before", "DELETE FROM train_snapshot WHERE scraped_at < ?"),
+    ("train_change.select_since",
+     "SELECT * FROM train_change WHERE pkey > ? ORDER BY pkey LIMIT ?"),
+    ("train_change.delete_before", "DELETE FROM train_change WHERE changed_at < ?"),
+    ("english_study.select_review_english",
+     "SELECT * FROM english_study WHERE next_review <= ? ORDER BY next_review LIMIT ?"),
+    ("collect_status.select_by_target", "SELECT * FROM collect_status WHERE target = ?"),
+    ("scrape_job.claim",
+     "SELECT pkey, target, key, url, attempts FROM scrape_job "
+     "WHERE status = ? OR (status = ? AND lease_expires <= ?) "
+     "ORDER BY enqueued_at, pkey LIMIT ?"),
+    ("scrape_job.complete",
+     "UPDATE scrape_job SET status = ? WHERE pkey = ? AND lease_owner = ? AND status = ?"),
+]
+
+# ジョブの状態
+#   queued:待ち leased:ワーカーが処理中(lease_expiresまで) done:完了 failed:失敗
+JOB_QUEUED = 'queued'
+JOB_LEASED = 'leased'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# 一括登録時に1トランザクションで登録する件数
+BATCH_SIZE = 5000
+
+# 英単語の復習間隔(日) 表示する度に倍にし、上限で頭打ちにする
+REVIEW_INTERVAL_MIN = 1
+REVIEW_INTERVAL_MAX = 180
+
+# 新規登録した英単語の復習日時(0以上1未満の乱数)
+# 未出題の英単語はシャッフル済みの山札として登録順に関係なく出題される
+NEW_REVIEW = "ABS(RANDOM()) / 9223372036854775808.0"
+
+
+def dict_factory(cursor: object, row: tuple) -> dict:
+    """
+    検索結果をdict形式に変換する.
+
+    param:
+        row 行
+
+    return:
+        d {カラム: 値}
+    """
+
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+
+    return d
+
+
+class ConnectionPool:
+    """
+    コネクションプールクラス.
+    WALモードで接続し、スレッド間で接続を使い回す
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE):
+        """
+        param:
+            path データベースファイルのパス
+            size 保持する接続数の上限
+        """
+
+        self.path = path
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def connect(self) -> object:
+        """
+        接続する.
+
+        return:
+            conn
+        """
+
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = dict_factory
+
+        return conn
+
+    def acquire(self) -> object:
+        """
+        空いている接続を取得する.
+        空きが無ければ新たに接続する
+
+        return:
+            conn
+        """
+
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn: object):
+        """
+        接続を返却する.
+        未コミットの変更はロールバックし、上限を超えた接続は閉じる
+
+        param:
+            conn 返却する接続
+        """
+
+        if conn.in_transaction:
+            conn.rollback()
+
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """
+        保持している接続を全て閉じる.
+        """
+
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+POOL = None
+POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> object:
+    """
+    共有のコネクションプールを取得する.
+
+    return:
+        pool
+    """
+
+    global POOL
+    with POOL_LOCK:
+        if POOL is None:
+            POOL = ConnectionPool()
+
+    return POOL
+
 
 class Base:
     """
     基底クラス.
     """
     
-    def __init__(self, table: str):
+    def __init__(self, table: str, conn: object = None):
         """
         データベース接続.
+        接続は共有のコネクションプールから借り、commit、closeで返却する
+        connを渡した場合は他のクラスと接続(トランザクション)を共有し、
+        commit、返却は接続を借りた側で行う(closeはカーソルを閉じるだけ)
 
         param:
             table テーブル名
+            conn 共有する接続
         """
 
-        db_path = os.path.join(os.getcwd(), table + ".db")
-        self.conn = sqlite3.connect(db_path)
-        self.conn.row_factory = self.dict_factory
+        self.shared = conn is not None
+        self.conn = conn or get_pool().acquire()
         self.cur = self.conn.cursor()
     
-    def dict_factory(self, cursor: object, row: dict) -> dict:
+    def dict_factory(self, cursor: object, row: tuple) -> dict:
         """
         検索結果をdict形式に変換する.
 
@@ -53,11 +371,7 @@ class Base:
             d {カラム: 値}
         """
 
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-
-        return d
+        return dict_factory(cursor, row)
 
     def select_all(self) -> list:
         """
@@ -72,6 +386,45 @@ class Base:
             return False
 
         return self.cur.fetchall()
+
+    def iter_all(self, batch_size: int = BATCH_SIZE):
+        """
+        全件をbatch_size件ずつ読み込みながら1件ずつ返す.
+        fetchallと異なり全件をメモリに載せない
+
+        param:
+            batch_size 1回に読み込む件数
+
+        return:
+            row 行
+        """
+
+        # 読込中にselect_all等でカーソルが再利用されないよう専用のカーソルを使う
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SELECT * FROM %s" % self.table)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cur.close()
+
+    def columns(self) -> list:
+        """
+        カラム名を取得する.
+
+        return:
+            columns カラム名のリスト
+        """
+
+        sql = "PRAGMA table_info(%s)" % self.table
+        if self.cur.execute(sql) is False:
+            return False
+
+        return [row["name"] for row in self.cur.fetchall()]
     
     def commit(self) -> bool:
         """
@@ -83,184 +436,1075 @@ class Base:
 
         if self.conn.commit() is False:
             return False
-        self.conn.close()
+        self.close()
 
         return True
 
+    def close(self):
+        """
+        接続をコネクションプールに返却する.
+        未コミットの変更はロールバックする
+        """
+
+        if getattr(self, 'conn', None) is None:
+            return
+
+        self.cur.close()
+        if not self.shared:
+            get_pool().release(self.conn)
+        self.conn = None
+        self.cur = None
+
+    def __del__(self):
+        self.close()
+
 
 class CreateTable:
     """
     テーブル生成クラス.
+    未適用のマイグレーションを適用し、スキーマを最新にする
     """
 
     def __init__(self):
-        for table in DATABASES:
-            db_path = os.path.join(os.getcwd(), table + ".db")
-            self.conn = sqlite3.connect(db_path)
-            self.cur = self.conn.cursor()
-            self.create(table)
-        self.conn.commit()
-        self.conn.close()
+        self.conn = get_pool().acquire()
+        self.cur = self.conn.cursor()
+        try:
+            self.schema_version = self.migrate()
+            for table in DATABASES:
+                self.import_legacy(table)
+            self.conn.commit()
+        finally:
+            get_pool().release(self.conn)
 
-    def create(self, table: str) -> bool:
+    def version(self) -> int:
         """
-        テーブルを生成する.
+        適用済みのスキーマの版を取得する.
+
+        return:
+            version 版番号(未適用の場合0)
+        """
+
+        self.cur.execute("PRAGMA user_version")
+
+        return self.cur.fetchone()["user_version"]
+
+    def migrate(self) -> int:
+        """
+        未適用のマイグレーションを1トランザクションで適用する.
+        複数のプロセスが同時に起動しても、適用するのは最初にロックを取ったプロセスだけ
+
+        return:
+            version 適用後の版番号
+        """
+
+        if self.version() >= len(MIGRATIONS):
+            return self.version()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # ロックを待つ間に他のプロセスが適用している場合がある
+            version = self.version()
+            for number, steps in enumerate(MIGRATIONS[version:], version + 1):
+                for step in steps:
+                    if self.apply(step) is False:
+                        raise sqlite3.OperationalError('migration error: %r' % (step,))
+                self.cur.execute("PRAGMA user_version = %d" % number)
+                log.info('migrate: applied', version=number)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+        return self.version()
+
+    def apply(self, step: tuple) -> bool:
+        """
+        マイグレーションの変更を1件適用する.
+
+        param:
+            step ("table", テーブル名) ("column", テーブル名, カラム名)
+                 ("index", テーブル名, インデックス名)
+
+        return:
+            True
+        """
+
+        if step[0] == "table":
+            return self.create(step[1])
+        if step[0] == "column":
+            return self.add_column(step[1], step[2])
+        if step[0] == "index":
+            return self.create_index(step[1], step[2])
+
+        return False
+
+    def add_column(self, table: str, name: str) -> bool:
+        """
+        既存のテーブルにカラムを追加する. 追加済みの場合は何もしない
 
         param:
             table テーブル名
+            name カラム名
 
         return:
             True
         """
 
-        sql = "CREATE TABLE IF NOT EXISTS %s (" % table
-        for column in DATABASES[table]:
-            sql += "%s %s %s, " % (column[0], column[1], column[2])
-        sql = sql.rstrip(", ") + ")"
+        self.cur.execute("PRAGMA table_info(%s)" % table)
+        if name in {row["name"] for row in self.cur.fetchall()}:
+            return True
+
+        column = [column for column in DATABASES[table] if column[0] == name][0]
+        sql = "ALTER TABLE %s ADD COLUMN %s %s %s" % (
+            table, column[0], column[1], column[2])
         if self.cur.execute(sql) is False:
             return False
 
+        # 追加した復習日時は乱数で初期化し、既存の英単語もシャッフルする
+        if table == "english_study" and name == "next_review":
+            sql = "UPDATE %s SET next_review = %s" % (table, NEW_REVIEW)
+            if self.cur.execute(sql) is False:
+                return False
+
         return True
 
+    def import_legacy(self, table: str) -> bool:
+        """
+        テーブル毎のデータベースファイル(<テーブル名>.db)が残っている場合、
+        テーブルが空であれば全件を取り込む.
+        取り込んだファイルは<テーブル名>.db.importedに改名し、次回の起動で再び取り込まない
+        (取り込んだ行を削除して空にしたテーブルに、削除した行が戻らないようにする)
 
-class Weather(Base):
-    """
-    天気予報クラス.
-    """
+        param:
+            table テーブル名
 
-    def __init__(self):
-        self.table = 'weather'
-        super().__init__(self.table)
-    
-    def insert(self, place: str, url: str) -> bool:
+        return:
+            True
         """
-        insertする.
+
+        legacy_path = os.path.join(os.path.dirname(DB_PATH), table + ".db")
+        if not os.path.exists(legacy_path):
+            return True
+
+        self.cur.execute("SELECT COUNT(*) AS count FROM %s" % table)
+        if self.cur.fetchone()["count"] > 0:
+            return True
+
+        # ATTACHはトランザクション外で実行する
+        self.conn.commit()
+        self.cur.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+        try:
+            self.cur.execute(
+                "SELECT name FROM legacy.sqlite_master "
+                "WHERE type = 'table' AND name = ?", (table,))
+            if self.cur.fetchone() is not None:
+                self.cur.execute("PRAGMA legacy.table_info(%s)" % table)
+                legacy_columns = {row["name"] for row in self.cur.fetchall()}
+                columns = ", ".join(
+                    column[0] for column in DATABASES[table]
+                    if column[0] in legacy_columns)
+                self.cur.execute(
+                    "INSERT OR IGNORE INTO %s (%s) SELECT %s FROM legacy.%s" % (
+                        table, columns, columns, table))
+                imported = self.cur.rowcount
+                self.cur.execute("SELECT COUNT(*) AS count FROM legacy.%s" % table)
+                log.info('import_legacy: imported', table=table, count=imported,
+                         duplicate=self.cur.fetchone()["count"] - imported)
+
+                # 復習日時の無い英単語は、add_columnと同様に乱数で初期化する
+                if table == "english_study" and "next_review" not in legacy_columns:
+                    self.cur.execute("UPDATE %s SET next_review = %s" % (
+                        table, NEW_REVIEW))
+            self.conn.commit()
+        finally:
+            self.cur.execute("DETACH DATABASE legacy")
+
+        try:
+            os.replace(legacy_path, legacy_path + LEGACY_SUFFIX)
+        except OSError as e:
+            log.warn('import_legacy: rename error', table=table, error=repr(e))
+            return False
+        log.info('import_legacy: renamed', table=table,
+                 path=legacy_path + LEGACY_SUFFIX)
+
+        return True
+
+    def create(self, table: str) -> bool:
+        """
+        テーブルを生成する.
 
         param:
-            place 場所
-            url 収集url
+            table テーブル名
 
         return:
             True
         """
 
-        sql = "INSERT INTO %s (place, url) " % self.table
-        sql += "VALUES (?, ?)"
-        data = (place, url)
-        if self.cur.execute(sql, data) is False:
+        sql = "CREATE TABLE IF NOT EXISTS %s (" % table
+        for column in DATABASES[table]:
+            sql += "%s %s %s, " % (column[0], column[1], column[2])
+        sql = sql.rstrip(", ") + ")"
+        if self.cur.execute(sql) is False:
             return False
 
         return True
- 
-    def delete_by_route(self, place: str) -> bool:
+
+    def create_index(self, table: str, name: str) -> bool:
         """
-        deleteする.
+        インデックスを生成する.
+        UNIQUEインデックスの場合、既存の重複行は最初の1件を残して削除する
 
         param:
-            place 場所
+            table テーブル名
+            name インデックス名
 
         return:
             True
         """
 
-        sql = "DELETE FROM %s " % self.table
-        sql += "WHERE place = ?"
-        data = (place,)
-        if self.cur.execute(sql, data) is False:
+        _, columns, option = [
+            index for index in INDEXES[table] if index[0] == name][0]
+        if option == "UNIQUE":
+            where = "WHERE pkey NOT IN "
+            where += "(SELECT MIN(pkey) FROM %s GROUP BY %s)" % (table, columns)
+            self.cur.execute("SELECT * FROM %s %s" % (table, where))
+            for row in self.cur.fetchall():
+                log.warn('create_index: duplicate removed', table=table,
+                         index=name, **row)
+            if self.cur.execute("DELETE FROM %s %s" % (table, where)) is False:
+                return False
+
+        sql = "CREATE %s INDEX IF NOT EXISTS %s ON %s (%s)" % (
+            option, name, table, columns)
+        if self.cur.execute(sql) is False:
             return False
 
         return True
 
 
-class Train(Base):
+def check_query_plans() -> list:
     """
-    運行情報クラス.
+    頻出クエリ(QUERY_PLANS)の実行計画を取得し、インデックスを使っているか確認する.
+    スキーマを最新にしてから確認する
+
+    return:
+        plans [(名前, インデックスを使っている場合True, 実行計画)]
     """
 
-    def __init__(self):
-        self.table = 'train'
-        super().__init__(self.table)
+    CreateTable()
+    conn = get_pool().acquire()
+    try:
+        plans = []
+        for name, sql in QUERY_PLANS:
+            params = (None,) * sql.count("?")
+            details = [
+                row["detail"]
+                for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+            ]
+            # SCAN <テーブル>(インデックス無しの全件走査)があれば使っていない
+            uses_index = not any(
+                detail.startswith("SCAN") and "USING" not in detail
+                for detail in details)
+            plans.append((name, uses_index, details))
+    finally:
+        get_pool().release(conn)
+
+    return plans
+
+
+class Target(Base):
+    """
+    収集先の基底クラス.
+    目的地(路線)、URLはそれぞれUNIQUEインデックスで重複させない
+    """
+
+    def __init__(self, table: str, key: str):
+        """
+        param:
+            table テーブル名
+            key 目的地(路線)のカラム名
+        """
+
+        self.key = key
+        super().__init__(table)
 
-    def insert(self, route: str, url: str) -> bool:
+    def insert(self, key: str, url: str) -> bool:
         """
         insertする.
+        登録済みの目的地(路線)、URLの行は置き換える
 
         param:
-            route 路線
+            key 目的地(路線)
             url 収集url
 
         return:
             True
         """
 
-        sql = "INSERT INTO %s (route, url) " % self.table
+        sql = "INSERT OR REPLACE INTO %s (%s, url) " % (self.table, self.key)
         sql += "VALUES (?, ?)"
-        data = (route, url)
+        data = (key, url)
         if self.cur.execute(sql, data) is False:
             return False
 
         return True
 
-    def delete_by_route(self, route: str) -> bool:
+    def delete_by_route(self, key: str) -> bool:
         """
         deleteする.
 
         param:
-            route 路線
+            key 目的地(路線)
 
         return:
             True
         """
 
         sql = "DELETE FROM %s " % self.table
-        sql += "WHERE route = ?"
-        data = (route,)
+        sql += "WHERE %s = ?" % self.key
+        data = (key,)
         if self.cur.execute(sql, data) is False:
             return False
 
         return True
 
-
-class EnglishStudy(Base):
-    """
-    英単語クラス.
-    """
-
-    def __init__(self):
-        self.table = 'english_study'
-        super().__init__(self.table)
-
-    def insert(self, english_word: str, japanese_word: str) -> bool:
+    def diff(self, entries: dict) -> dict:
         """
-        insertする.
+        登録する収集先と登録済みの収集先を比較する.
 
         param:
-            english_word 英単語
-            japanese_word 日本語
+            entries {目的地(路線):収集url}
 
         return:
-            True
+            diff {added:[(目的地, url)], updated:[(目的地, 旧url, 新url)],
+                  removed:[(目的地, url)], unchanged:件数}
+                  removedは他の目的地に移るURLの登録済みの行(置き換えにより削除される)
         """
 
-        sql = "INSERT INTO %s (english, japanese) " % self.table
-        sql += "VALUES (?, ?)"
-        data = (english_word, japanese_word)
-        if self.cur.execute(sql, data) is False:
+        rows = self.select_all()
+        if rows is False:
             return False
 
-        return True
+        existing = {row[self.key]: row['url'] for row in rows}
+        owners = {row['url']: row[self.key] for row in rows}
+
+        diff = {'added': [], 'updated': [], 'removed': [], 'unchanged': 0}
+        for key, url in entries.items():
+            if key not in existing:
+                diff['added'].append((key, url))
+            elif existing[key] != url:
+                diff['updated'].append((key, existing[key], url))
+            else:
+                diff['unchanged'] += 1
+
+            owner = owners.get(url)
+            if owner is not None and owner != key and owner not in entries:
+                diff['removed'].append((owner, url))
 
-    def select_random_english(self) -> list:
+        return diff
+
+    def upsert(self, entries: dict) -> dict:
         """
-        ランダムに抽出する.
+        収集先を1トランザクションで登録(更新)する.
+        変わらない行は書き込まない
+
+        param:
+            entries {目的地(路線):収集url}
 
         return:
-            fetchall 英単語と日本語(3件ずつ)
+            diff 登録した差分(diffと同じ形式)
         """
 
-        sql = "SELECT * FROM %s " % self.table
-        sql += "ORDER BY RANDOM() LIMIT 3"
-        if self.cur.execute(sql) is False:
+        diff = self.diff(entries)
+        if diff is False:
             return False
 
-        return self.cur.fetchall()
+        sql = "INSERT OR REPLACE INTO %s (%s, url) " % (self.table, self.key)
+        sql += "VALUES (?, ?)"
+        data = diff['added'] + [(key, url) for key, _, url in diff['updated']]
+        with self.conn:
+            self.cur.executemany(sql, data)
+
+        return diff
+
+
+class Weather(Target):
+    """
+    天気予報クラス.
+    """
+
+    def __init__(self):
+        self.table = 'weather'
+        super().__init__(self.table, 'place')
+
+
+class Train(Target):
+    """
+    運行情報クラス.
+    """
+
+    def __init__(self):
+        self.table = 'train'
+        super().__init__(self.table, 'route')
+
+
+class EnglishStudy(Base):
+    """
+    英単語クラス.
+    """
+
+    def __init__(self):
+        self.table = 'english_study'
+        super().__init__(self.table)
+
+    def insert(self, english_word: str, japanese_word: str) -> bool:
+        """
+        insertする.
+
+        param:
+            english_word 英単語
+            japanese_word 日本語
+
+        return:
+            True
+        """
+
+        sql = "INSERT INTO %s (english, japanese, next_review) " % self.table
+        sql += "VALUES (?, ?, %s)" % NEW_REVIEW
+        data = (english_word, japanese_word)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+    def bulk_insert(self, rows: object, batch_size: int = BATCH_SIZE) -> dict:
+        """
+        一括でinsertする.
+        batch_size件毎にexecutemanyでinsertしてコミットするため、
+        rowsはジェネレータで渡せば全件をメモリに載せずに登録できる
+        登録済みの英単語(UNIQUEインデックス)は無視する
+
+        param:
+            rows (英単語, 日本語)のイテラブル
+            batch_size 1トランザクションで登録する件数
+
+        return:
+            stats {read:読込件数, inserted:登録件数, seconds:処理時間}
+        """
+
+        sql = "INSERT OR IGNORE INTO %s (english, japanese, next_review) " % self.table
+        sql += "VALUES (?, ?, %s)" % NEW_REVIEW
+
+        stats = {'read': 0, 'inserted': 0, 'seconds': 0.0}
+        start = time.perf_counter()
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.insert_batch(sql, batch, stats, start)
+                batch = []
+        if batch:
+            self.insert_batch(sql, batch, stats, start)
+
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+
+        return stats
+
+    def insert_batch(self, sql: str, batch: list, stats: dict, start: float):
+        """
+        1トランザクション分をinsertし、進捗を記録する.
+
+        param:
+            sql insert文
+            batch [(英単語, 日本語)]
+            stats 集計
+            start 開始時刻
+        """
+
+        changes = self.conn.total_changes
+        with self.conn:
+            self.cur.executemany(sql, batch)
+
+        stats['read'] += len(batch)
+        stats['inserted'] += self.conn.total_changes - changes
+        elapsed = time.perf_counter() - start
+        log.info('bulk_insert: progress', read=stats['read'],
+                 inserted=stats['inserted'],
+                 rows_per_sec=round(stats['read'] / elapsed) if elapsed else 0)
+
+    def select_random_english(self, limit: int = 3) -> list:
+        """
+        ランダムに抽出する.
+        pkeyの範囲から乱数を選び、主キーで1件ずつ検索するため
+        ORDER BY RANDOM()と異なり件数が増えても全件を走査しない
+
+        param:
+            limit 抽出件数
+
+        return:
+            rows 英単語と日本語(3件ずつ)
+        """
+
+        # MIN、MAXは1つずつ問い合わせないと全件走査になる
+        bounds = {}
+        for func in ("MIN", "MAX"):
+            sql = "SELECT %s(pkey) AS pkey FROM %s" % (func, self.table)
+            if self.cur.execute(sql) is False:
+                return False
+            bounds[func] = self.cur.fetchone()["pkey"]
+
+        if bounds["MIN"] is None:
+            return []
+
+        sql = "SELECT * FROM %s " % self.table
+        sql += "WHERE pkey >= ? ORDER BY pkey LIMIT 1"
+        rows = {}
+        for _ in range(limit * 10):
+            if len(rows) >= limit:
+                break
+            data = (random.randint(bounds["MIN"], bounds["MAX"]),)
+            if self.cur.execute(sql, data) is False:
+                return False
+            row = self.cur.fetchone()
+            rows[row["pkey"]] = row
+
+        return list(rows.values())
+
+    def select_review_english(self, limit: int = 3, now: float = None) -> list:
+        """
+        復習日時を過ぎた英単語を復習日時の古い順に抽出し、次の復習日時を設定する.
+        復習日時を過ぎた英単語が足りない場合はランダムに補う
+
+        param:
+            limit 抽出件数
+            now 現在日時(UNIX時間)
+
+        return:
+            rows 英単語と日本語
+        """
+
+        if now is None:
+            now = time.time()
+
+        sql = "SELECT * FROM %s " % self.table
+        sql += "WHERE next_review <= ? ORDER BY next_review LIMIT ?"
+        data = (now, limit)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        rows = self.cur.fetchall()
+        if len(rows) < limit:
+            randoms = self.select_random_english(limit)
+            if randoms is False:
+                return False
+            pkeys = {row["pkey"] for row in rows}
+            rows.extend(
+                row for row in randoms if row["pkey"] not in pkeys
+            )
+            rows = rows[:limit]
+
+        for row in rows:
+            interval = min(max(row["interval"] * 2, REVIEW_INTERVAL_MIN),
+                           REVIEW_INTERVAL_MAX)
+            sql = "UPDATE %s " % self.table
+            sql += "SET interval = ?, next_review = ? WHERE pkey = ?"
+            data = (interval, now + interval * 24 * 60 * 60, row["pkey"])
+            if self.cur.execute(sql, data) is False:
+                return False
+
+        return rows
+
+
+class WeatherSnapshot(Base):
+    """
+    天気予報収集結果クラス.
+    """
+
+    def __init__(self, conn: object = None):
+        """
+        param:
+            conn 共有する接続(省略時はコネクションプールから借りる)
+        """
+
+        self.table = 'weather_snapshot'
+        super().__init__(self.table, conn)
+
+    def insert(self, place: str, info: dict, scraped_at: float) -> bool:
+        """
+        insertする.
+
+        param:
+            place 場所
+            info {時間:[コメント,気温]}
+            scraped_at 収集日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "INSERT INTO %s (place, info, scraped_at) " % self.table
+        sql += "VALUES (?, ?, ?)"
+        data = (place, json.dumps(info, ensure_ascii=False), scraped_at)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+    def select_latest(self, place: str) -> dict:
+        """
+        最新の収集結果を取得する.
+
+        param:
+            place 場所
+
+        return:
+            info {時間:[コメント,気温]} 収集結果が無い場合None
+        """
+
+        sql = "SELECT * FROM %s " % self.table
+        sql += "WHERE place = ? ORDER BY scraped_at DESC LIMIT 1"
+        data = (place,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        row = self.cur.fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row['info'])
+
+    def delete_before(self, scraped_at: float) -> bool:
+        """
+        指定日時より前の収集結果をdeleteする.
+
+        param:
+            scraped_at 収集日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "DELETE FROM %s " % self.table
+        sql += "WHERE scraped_at < ?"
+        data = (scraped_at,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+
+class TrainSnapshot(Base):
+    """
+    運行情報収集結果クラス.
+    """
+
+    def __init__(self, conn: object = None):
+        """
+        param:
+            conn 共有する接続(省略時はコネクションプールから借りる)
+        """
+
+        self.table = 'train_snapshot'
+        super().__init__(self.table, conn)
+
+    def insert(self, route: str, info: dict, scraped_at: float) -> bool:
+        """
+        insertする.
+
+        param:
+            route 路線
+            info {heading:見出し,comment:コメント}
+            scraped_at 収集日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "INSERT INTO %s (route, heading, comment, scraped_at) " % self.table
+        sql += "VALUES (?, ?, ?, ?)"
+        data = (route, info['heading'], info['comment'], scraped_at)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+    def select_latest(self, route: str) -> dict:
+        """
+        最新の収集結果を取得する.
+
+        param:
+            route 路線
+
+        return:
+            info {heading:見出し,comment:コメント} 収集結果が無い場合None
+        """
+
+        sql = "SELECT heading, comment FROM %s " % self.table
+        sql += "WHERE route = ? ORDER BY scraped_at DESC LIMIT 1"
+        data = (route,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return self.cur.fetchone()
+
+    def delete_before(self, scraped_at: float) -> bool:
+        """
+        指定日時より前の収集結果をdeleteする.
+
+        param:
+            scraped_at 収集日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "DELETE FROM %s " % self.table
+        sql += "WHERE scraped_at < ?"
+        data = (scraped_at,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+
+class TrainChange(Base):
+    """
+    運行情報の変化クラス.
+    pkeyを変化の連番として、クライアントは受信済みのpkeyより後の変化を取得する
+    """
+
+    def __init__(self, conn: object = None):
+        """
+        param:
+            conn 共有する接続(省略時はコネクションプールから借りる)
+        """
+
+        self.table = 'train_change'
+        super().__init__(self.table, conn)
+
+    def insert(self, route: str, info: dict, previous: dict, changed_at: float) -> bool:
+        """
+        insertする.
+
+        param:
+            route 路線
+            info {heading:見出し,comment:コメント}
+            previous 変化前の{heading:見出し,comment:コメント}
+            changed_at 検知日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "INSERT INTO %s (route, heading, comment, " % self.table
+        sql += "previous_heading, previous_comment, changed_at) "
+        sql += "VALUES (?, ?, ?, ?, ?, ?)"
+        data = (route, info['heading'], info['comment'],
+                previous['heading'], previous['comment'], changed_at)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+    def select_since(self, pkey: int, limit: int = 1000) -> list:
+        """
+        pkeyより後の変化を取得する.
+
+        param:
+            pkey 受信済みのpkey
+            limit 取得件数
+
+        return:
+            changes [{pkey, route, heading, comment, previous_heading, ...}]
+        """
+
+        sql = "SELECT * FROM %s " % self.table
+        sql += "WHERE pkey > ? ORDER BY pkey LIMIT ?"
+        data = (pkey, limit)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return self.cur.fetchall()
+
+    def select_last_pkey(self) -> int:
+        """
+        最新の変化のpkeyを取得する.
+
+        return:
+            pkey 変化が無い場合0
+        """
+
+        sql = "SELECT MAX(pkey) AS pkey FROM %s" % self.table
+        if self.cur.execute(sql) is False:
+            return False
+
+        return self.cur.fetchone()['pkey'] or 0
+
+    def delete_before(self, changed_at: float) -> bool:
+        """
+        指定日時より前の変化をdeleteする.
+
+        param:
+            changed_at 検知日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "DELETE FROM %s " % self.table
+        sql += "WHERE changed_at < ?"
+        data = (changed_at,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+
+class CollectStatus(Base):
+    """
+    目的地(路線)毎の収集状況クラス.
+    """
+
+    def __init__(self):
+        self.table = 'collect_status'
+        super().__init__(self.table)
+
+    def upsert(self, target: str, key: str, status: dict, updated_at: float) -> bool:
+        """
+        収集状況を登録、更新する.
+        最後に成功した日時は、成功した場合のみ更新する
+
+        param:
+            target 収集情報のキーワード
+            key 目的地(路線)
+            status {status:状態, attempts:試行回数, error:エラー}
+            updated_at 更新日時(UNIX時間)
+
+        return:
+            True
+        """
+
+        sql = "INSERT OR REPLACE INTO %s " % self.table
+        sql += "(target, key, status, attempts, error, updated_at, succeeded_at) "
+        sql += "VALUES (?, ?, ?, ?, ?, ?, "
+        if status['status'] == 'ok':
+            sql += "?)"
+            data = (target, key, status['status'], status['attempts'],
+                    status.get('error'), updated_at, updated_at)
+        else:
+            sql += "(SELECT succeeded_at FROM %s WHERE target = ? AND key = ?))" % self.table
+            data = (target, key, status['status'], status['attempts'],
+                    status.get('error'), updated_at, target, key)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return True
+
+    def select_by_target(self, target: str) -> dict:
+        """
+        収集情報の収集状況を取得する.
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            statuses {目的地(路線):{status, attempts, error, updated_at, succeeded_at}}
+        """
+
+        sql = "SELECT * FROM %s " % self.table
+        sql += "WHERE target = ?"
+        data = (target,)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return {row['key']: row for row in self.cur.fetchall()}
+
+
+class ScrapeJob(Base):
+    """
+    スクレイピングのジョブキュークラス.
+    複数のプロセス(DBファイルを共有する複数のマシン)のワーカーが、
+    期限付きの貸出(リース)でジョブを取得する
+    """
+
+    def __init__(self, conn: object = None):
+        """
+        param:
+            conn 共有する接続(省略時はコネクションプールから借りる)
+        """
+
+        self.table = 'scrape_job'
+        super().__init__(self.table, conn)
+
+    def enqueue(self, jobs: list, now: float) -> int:
+        """
+        ジョブを登録する.
+        登録済みのジョブは待ちに戻す(ワーカーが処理中のジョブはそのまま)
+
+        param:
+            jobs [(収集情報のキーワード, 目的地(路線), 収集url)]
+            now 登録日時(UNIX時間)
+
+        return:
+            count 待ちにしたジョブ数
+        """
+
+        update = "UPDATE %s SET url = ?, status = ?, attempts = 0, " % self.table
+        update += "lease_owner = NULL, lease_expires = NULL, error = NULL, "
+        update += "enqueued_at = ?, updated_at = ? "
+        update += "WHERE target = ? AND key = ? "
+        update += "AND NOT (status = ? AND lease_expires > ?)"
+        insert = "INSERT OR IGNORE INTO %s " % self.table
+        insert += "(target, key, url, status, attempts, enqueued_at, updated_at) "
+        insert += "VALUES (?, ?, ?, ?, 0, ?, ?)"
+
+        changes = self.conn.total_changes
+        with self.conn:
+            self.cur.executemany(update, [
+                (url, JOB_QUEUED, now, now, target, key, JOB_LEASED, now)
+                for target, key, url in jobs
+            ])
+            self.cur.executemany(insert, [
+                (target, key, url, JOB_QUEUED, now, now)
+                for target, key, url in jobs
+            ])
+
+        return self.conn.total_changes - changes
+
+    def claim(self, owner: str, limit: int, lease: float, now: float,
+              max_attempts: int) -> list:
+        """
+        待ちのジョブ、リース期限切れのジョブを取得し、ownerに貸し出す.
+        書き込みロックを取得してから検索するため、複数のワーカーに同じジョブは貸し出さない
+        貸出回数がmax_attemptsに達したジョブは、リース期限切れで失敗にする
+
+        param:
+            owner ワーカーID
+            limit 取得件数
+            lease リース期間(秒)
+            now 現在日時(UNIX時間)
+            max_attempts 貸出回数の上限
+
+        return:
+            jobs [{pkey, target, key, url, attempts}]
+        """
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            sql = "UPDATE %s SET status = ?, error = 'lease expired', " % self.table
+            sql += "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            sql += "WHERE status = ? AND lease_expires <= ? AND attempts >= ?"
+            self.cur.execute(sql, (JOB_FAILED, now, JOB_LEASED, now, max_attempts))
+
+            sql = "SELECT pkey, target, key, url, attempts FROM %s " % self.table
+            sql += "WHERE status = ? OR (status = ? AND lease_expires <= ?) "
+            sql += "ORDER BY enqueued_at, pkey LIMIT ?"
+            self.cur.execute(sql, (JOB_QUEUED, JOB_LEASED, now, limit))
+            jobs = self.cur.fetchall()
+
+            sql = "UPDATE %s SET status = ?, lease_owner = ?, " % self.table
+            sql += "lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+            sql += "WHERE pkey = ?"
+            self.cur.executemany(sql, [
+                (JOB_LEASED, owner, now + lease, now, job['pkey']) for job in jobs
+            ])
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+        return jobs
+
+    def complete(self, pkey: int, owner: str, status: str, error: str,
+                 now: float) -> bool:
+        """
+        貸し出したジョブを完了、失敗にする.
+        リース期限切れで他のワーカーに貸し出されたジョブは更新しない
+
+        param:
+            pkey ジョブのpkey
+            owner ワーカーID
+            status JOB_DONE、JOB_FAILED
+            error エラー
+            now 現在日時(UNIX時間)
+
+        return:
+            True 貸出中でなかった場合False
+        """
+
+        sql = "UPDATE %s SET status = ?, error = ?, lease_owner = NULL, " % self.table
+        sql += "lease_expires = NULL, updated_at = ? "
+        sql += "WHERE pkey = ? AND lease_owner = ? AND status = ?"
+        data = (status, error, now, pkey, owner, JOB_LEASED)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return self.cur.rowcount == 1
+
+    def select_held(self, pkeys: list, owner: str) -> list:
+        """
+        ownerが借りたままのジョブを取得する.
+        リース期限切れで他のワーカーに貸し出されたジョブは含まない
+
+        param:
+            pkeys ジョブのpkeyのリスト
+            owner ワーカーID
+
+        return:
+            pkeys 借りたままのジョブのpkeyのリスト
+        """
+
+        if not pkeys:
+            return []
+
+        sql = "SELECT pkey FROM %s " % self.table
+        sql += "WHERE pkey IN (%s) " % ', '.join('?' * len(pkeys))
+        sql += "AND lease_owner = ? AND status = ?"
+        data = tuple(pkeys) + (owner, JOB_LEASED)
+        if self.cur.execute(sql, data) is False:
+            return False
+
+        return [row['pkey'] for row in self.cur.fetchall()]
+
+    def release(self, pkeys: list, owner: str, error: str, now: float,
+                max_attempts: int) -> int:
+        """
+        貸し出したジョブを待ちに戻す.
+        貸出回数がmax_attemptsに達したジョブは失敗にする
+
+        param:
+            pkeys ジョブのpkeyのリスト
+            owner ワーカーID
+            error エラー
+            now 現在日時(UNIX時間)
+            max_attempts 貸出回数の上限
+
+        return:
+            count 戻した(失敗にした)ジョブ数
+        """
+
+        sql = "UPDATE %s SET " % self.table
+        sql += "status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+        sql += "error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+        sql += "WHERE pkey = ? AND lease_owner = ? AND status = ?"
+        self.cur.executemany(sql, [
+            (max_attempts, JOB_FAILED, JOB_QUEUED, error, now, pkey, owner, JOB_LEASED)
+            for pkey in pkeys
+        ])
+
+        return self.cur.rowcount
+
+    def counts(self) -> dict:
+        """
+        状態毎のジョブ数を取得する.
+
+        return:
+            counts {状態:ジョブ数}
+        """
+
+        sql = "SELECT status, COUNT(*) AS num FROM %s " % self.table
+        sql += "GROUP BY status"
+        if self.cur.execute(sql) is False:
+            return False
+
+        return {row['status']: row['num'] for row in self.cur.fetchall()}
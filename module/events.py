@@ -0,0 +1,194 @@
+"""
+運行情報の変化の配信モジュール.
+収集時にDB(train_change)へ記録された変化を定期的に読み込み、待っているクライアントへ配信する
+ワーカーが別プロセス、別マシンで収集した変化もDB経由で配信される
+
+    broker = events.ChangeBroker()
+    broker.start()
+    changes = broker.wait(last_id, timeout)  # last_idより後の変化が届くまで待つ
+"""
+import threading
+import dbaccess
+import log
+
+# DBを読み込む間隔(秒) 同じプロセスの収集はnotifyで直ちに読み込む
+POLL_INTERVAL = 2
+
+# メモリに保持する変化の件数 これより古い変化はDBから読み込む
+BUFFER_SIZE = 1000
+
+
+def to_event(row: dict) -> dict:
+    """
+    DBの行を配信する形式に変換する.
+
+    param:
+        row train_changeの行
+
+    return:
+        event {id, route, heading, comment, previous_heading, previous_comment, changed_at}
+    """
+
+    return {
+        'id': row['pkey'],
+        'route': row['route'],
+        'heading': row['heading'],
+        'comment': row['comment'],
+        'previous_heading': row['previous_heading'],
+        'previous_comment': row['previous_comment'],
+        'changed_at': row['changed_at'],
+    }
+
+
+class ChangeBroker:
+    """
+    運行情報の変化の配信クラス.
+    複数スレッドから呼び出せる
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL, buffer_size: int = BUFFER_SIZE):
+        """
+        param:
+            interval DBを読み込む間隔(秒)
+            buffer_size メモリに保持する変化の件数
+        """
+
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.condition = threading.Condition()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        # 保持している変化(id順)、最新のid
+        # floorより後の変化は全てchangesにある
+        self.changes = []
+        self.last_id = 0
+        self.floor = 0
+
+    def start(self) -> bool:
+        """
+        起動時点の最新の変化以降を、バックグラウンドで読み込み始める.
+
+        return:
+            True DBアクセスに失敗した場合False
+        """
+
+        db = dbaccess.TrainChange()
+        last_id = db.select_last_pkey()
+        db.close()
+        if last_id is False:
+            log.error('start: select error')
+            return False
+
+        self.last_id = self.floor = last_id
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        log.info('start: broker start', last_id=last_id)
+
+        return True
+
+    def run(self):
+        """
+        stopが呼ばれるまで、一定間隔またはnotifyの度にDBを読み込む.
+        """
+
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            try:
+                self.poll()
+            except Exception as e:
+                log.error('run: poll error', error=repr(e))
+
+    def poll(self) -> int:
+        """
+        DBから新しい変化を読み込み、待っているクライアントを起こす.
+
+        return:
+            count 読み込んだ件数
+        """
+
+        db = dbaccess.TrainChange()
+        rows = db.select_since(self.last_id)
+        db.close()
+        if not rows:
+            return 0
+
+        events = [to_event(row) for row in rows]
+        with self.condition:
+            self.changes.extend(events)
+            if len(self.changes) > self.buffer_size:
+                dropped = self.changes[:-self.buffer_size]
+                self.changes = self.changes[-self.buffer_size:]
+                self.floor = dropped[-1]['id']
+            self.last_id = events[-1]['id']
+            self.condition.notify_all()
+        log.info('poll: changes', count=len(events), last_id=self.last_id)
+
+        return len(events)
+
+    def notify(self, target: str = None):
+        """
+        DBを直ちに読み込ませる. Scheduler.on_completeから呼ぶ
+
+        param:
+            target HTML作成対象(運行情報以外は無視する)
+        """
+
+        if target in (None, 'train'):
+            self.wakeup.set()
+
+    def since(self, last_id: int) -> list:
+        """
+        last_idより後の変化を返す.
+        メモリに保持していない古い変化はDBから読み込む
+
+        param:
+            last_id クライアントが受信済みのid
+
+        return:
+            events [{id, route, heading, comment, ...}]
+        """
+
+        with self.condition:
+            if last_id >= self.floor:
+                return [event for event in self.changes if event['id'] > last_id]
+
+        db = dbaccess.TrainChange()
+        rows = db.select_since(last_id, self.buffer_size)
+        db.close()
+        if not rows:
+            return []
+
+        return [to_event(row) for row in rows]
+
+    def wait(self, last_id: int, timeout: float) -> list:
+        """
+        last_idより後の変化が届くまで待つ.
+
+        param:
+            last_id クライアントが受信済みのid
+            timeout 待つ時間(秒)
+
+        return:
+            events [{id, route, heading, comment, ...}] 変化が無いまま時間切れ、停止した場合は空
+        """
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.last_id > last_id or self.stopped.is_set(), timeout)
+
+        return self.since(last_id)
+
+    def stop(self):
+        """
+        停止し、待っているクライアントを起こす.
+        """
+
+        self.stopped.set()
+        self.wakeup.set()
+        with self.condition:
+            self.condition.notify_all()
@@ -0,0 +1,915 @@
+"""
+ページ取得モジュール.
+収集情報毎に取得方法(バックエンド)を選択できる
+
+    http     HTTPクライアント + HTMLパーサ(サーバ側で描画されるページ向け)
+    selenium Headless Chrome(JavaScriptで描画されるページ向け)
+"""
+from contextlib import contextmanager
+from html.parser import HTMLParser
+import queue
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import cache
+import log
+import metrics
+
+# Headlessモード定義
+# selenium、chromedriver_binaryはdriverを起動する時にimportする
+# (httpバックエンド、収集しないサブコマンドはseleniumが無くても動く)
+OPTS = ['--headless', '--no-sandbox', '--disable-dev-shm-usage']
+
+# driverプールのサイズ(同時に起動するブラウザ数)
+POOL_SIZE = 4
+
+# 取得プロファイル定義
+#   page_load_strategy normal:全リソースの読み込み完了まで待つ eager:DOM構築完了まで待つ
+#   block_types 読み込まないリソースの種類(RESOURCE_PATTERNS)
+#   block_urls 読み込まないURLのパターン(*は任意の文字列)
+PROFILES = {
+    'full': {
+        'page_load_strategy': 'normal',
+        'block_types': [],
+        'block_urls': [],
+    },
+    'lean': {
+        'page_load_strategy': 'eager',
+        'block_types': ['image', 'font', 'stylesheet', 'media'],
+        'block_urls': [
+            '*doubleclick.net*',
+            '*googlesyndication.com*',
+            '*googletagmanager.com*',
+            '*googletagservices.com*',
+            '*google-analytics.com*',
+            '*adservice.google.*',
+            '*amazon-adsystem.com*',
+            '*yads.yahoo.co.jp*',
+            '*yjtag.yahoo.co.jp*',
+            '*criteo.*',
+            '*facebook.net*',
+            '*twitter.com/widgets*',
+        ],
+    },
+}
+
+# リソースの種類毎のURLのパターン
+RESOURCE_PATTERNS = {
+    'image': ['*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.svg*', '*.ico*'],
+    'font': ['*.woff*', '*.woff2*', '*.ttf*', '*.otf*', '*.eot*'],
+    'stylesheet': ['*.css*'],
+    'media': ['*.mp4*', '*.webm*', '*.mp3*', '*.m3u8*'],
+}
+
+# 収集情報毎のプロファイルと、取得完了とみなす要素(CSSセレクタ)
+SITES = {
+    'weather': {'profile': 'lean', 'wait_for': '.forecast-point-3h .temperature'},
+    'train': {'profile': 'lean', 'wait_for': '#mdServiceStatus'},
+}
+
+# 取得完了とみなす要素を待つ時間(秒)
+WAIT_TIMEOUT = 10
+
+# HTTPリクエスト定義
+# TIMEOUTは1回の通信(Seleniumはページ読み込み)のタイムアウト(秒)
+# collect.FETCH_TIMEOUT内に再試行できるよう短めにする
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) daily-app'
+TIMEOUT = 10
+
+# HTTPレスポンスをキャッシュするか(cache.pyで有効期限を定義)
+USE_CACHE = True
+
+# 改行、空白として扱うタグ(Seleniumの.textに合わせる)
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl',
+    'dt', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+    'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table',
+    'tbody', 'thead', 'tfoot', 'tr', 'ul',
+}
+CELL_TAGS = {'td', 'th'}
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+}
+SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+
+# Trueの場合、Seleniumでは1ページの解析対象を1回のスクリプト実行でまとめて取得する
+# Falseの場合は要素毎に取得する(要素の検索、.text毎にchromedriverとの通信が発生する)
+SCRIPT_EXTRACT = True
+
+# 天気予報ページの解析対象を取得するスクリプト
+WEATHER_SCRIPT = '''
+function text(element) {
+    return element.innerText.replace(/\\s+/g, ' ').trim();
+}
+function cells(row) {
+    return Array.prototype.map.call(row.getElementsByTagName('td'), text);
+}
+var hour = document.getElementsByClassName('hour')[0];
+var weather = document.getElementsByClassName('weather')[0];
+var temperature = document.getElementsByClassName('temperature')[0];
+if (!hour || !weather || !temperature) {
+    return null;
+}
+return [
+    cells(hour),
+    Array.prototype.map.call(hour.getElementsByClassName('past'), text),
+    cells(weather),
+    cells(temperature)
+];
+'''
+
+# 運行情報ページの解析対象を取得するスクリプト
+TRAIN_SCRIPT = '''
+var status = document.getElementById('mdServiceStatus');
+if (!status) {
+    return null;
+}
+return status.innerText.split('\\n').map(function (line) {
+    return line.replace(/\\s+/g, ' ').trim();
+}).filter(function (line) {
+    return line.length > 0;
+});
+'''
+
+
+class FetchError(Exception):
+    """
+    取得失敗(接続エラー、タイムアウト、5xx).
+    ホストの障害として再試行し、サーキットブレーカーに数える
+    """
+
+
+class PageError(Exception):
+    """
+    ページの問題(4xx、解析対象が無い).
+    ホストは応答しているため、再試行せずサーキットブレーカーにも数えない
+    """
+
+
+class Element:
+    """
+    HTML要素クラス.
+    """
+
+    def __init__(self, tag: str, attrs: dict, parent: object = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.classes = set(attrs.get('class', '').split())
+
+    def iter(self):
+        """
+        子孫要素を文書順に返す.
+        """
+
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            yield element
+            stack.extend(reversed([
+                child for child in element.children
+                if isinstance(child, Element)
+            ]))
+
+    def find_element_by_class_name(self, name: str) -> object:
+        """
+        class名で最初の子孫要素を検索する.
+
+        param:
+            name class名
+
+        return:
+            element 見つからない場合None
+        """
+
+        for element in self.find_elements_by_class_name(name):
+            return element
+
+        return None
+
+    def find_elements_by_class_name(self, name: str):
+        """
+        class名で子孫要素を検索する.
+
+        param:
+            name class名
+        """
+
+        for element in self.iter():
+            if element is not self and name in element.classes:
+                yield element
+
+    def find_elements_by_tag_name(self, name: str):
+        """
+        タグ名で子孫要素を検索する.
+
+        param:
+            name タグ名
+        """
+
+        for element in self.iter():
+            if element is not self and element.tag == name:
+                yield element
+
+    def find_element_by_id(self, id_: str) -> object:
+        """
+        idで子孫要素を検索する.
+
+        param:
+            id_ id
+
+        return:
+            element 見つからない場合None
+        """
+
+        for element in self.iter():
+            if element.attrs.get('id') == id_:
+                return element
+
+        return None
+
+    @property
+    def text(self) -> str:
+        """
+        表示テキスト.
+        ブロック要素は改行、セルは空白で区切る
+        """
+
+        parts = []
+        self._collect_text(parts)
+        lines = []
+        for line in ''.join(parts).split('\n'):
+            line = re.sub(r'[ \t\r\f\v]+', ' ', line).strip()
+            if line:
+                lines.append(line)
+
+        return '\n'.join(lines)
+
+    def _collect_text(self, parts: list):
+        if self.tag in BLOCK_TAGS:
+            parts.append('\n')
+        for child in self.children:
+            if isinstance(child, Element):
+                child._collect_text(parts)
+            else:
+                parts.append(child.replace('\n', ' '))
+        if self.tag in BLOCK_TAGS:
+            parts.append('\n')
+        elif self.tag in CELL_TAGS:
+            parts.append(' ')
+
+
+class DocumentParser(HTMLParser):
+    """
+    HTMLを要素ツリーに変換するパーサ.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element('#document', {})
+        self.stack = [self.root]
+        self.skip = 0
+
+    def handle_starttag(self, tag: str, attrs: list):
+        if self.skip:
+            if tag in SKIP_TAGS:
+                self.skip += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip = 1
+            return
+
+        parent = self.stack[-1]
+        element = Element(tag, {key: val or '' for key, val in attrs}, parent)
+        parent.children.append(element)
+        if tag not in VOID_TAGS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag: str, attrs: list):
+        if self.skip or tag in SKIP_TAGS:
+            return
+
+        parent = self.stack[-1]
+        parent.children.append(
+            Element(tag, {key: val or '' for key, val in attrs}, parent))
+
+    def handle_endtag(self, tag: str):
+        if self.skip:
+            if tag in SKIP_TAGS:
+                self.skip -= 1
+            return
+
+        # 閉じタグが省略された要素は、対応する開始タグまで遡って閉じる
+        for idx in range(len(self.stack) - 1, 0, -1):
+            if self.stack[idx].tag == tag:
+                del self.stack[idx:]
+                break
+
+    def handle_data(self, data: str):
+        if not self.skip:
+            self.stack[-1].children.append(data)
+
+
+def parse_html(html: str) -> object:
+    """
+    HTMLを解析する.
+
+    param:
+        html HTML文字列
+
+    return:
+        root ルート要素
+    """
+
+    parser = DocumentParser()
+    parser.feed(html)
+    parser.close()
+
+    return parser.root
+
+
+def cells(row: object) -> list:
+    """
+    行のセル(td)毎の表示テキストを返す.
+
+    param:
+        row 行要素(Element、SeleniumのWebElement)
+
+    return:
+        texts
+    """
+
+    return [cell.text for cell in row.find_elements_by_tag_name('td')]
+
+
+# ページの読み込み時間、転送量を取得するスクリプト
+# 別ドメインのリソースはTiming-Allow-Originが無いとtransferSizeが0になる
+MEASURE_SCRIPT = '''
+var nav = performance.getEntriesByType('navigation')[0] || {};
+var resources = performance.getEntriesByType('resource');
+var bytes = nav.transferSize || 0;
+for (var i = 0; i < resources.length; i++) {
+    bytes += resources[i].transferSize || 0;
+}
+return {
+    ready_ms: nav.domContentLoadedEventEnd || 0,
+    load_ms: nav.loadEventEnd || 0,
+    bytes: bytes,
+    resources: resources.length
+};
+'''
+
+
+def blocked_urls(profile: dict) -> list:
+    """
+    プロファイルで読み込まないURLのパターンを返す.
+
+    param:
+        profile 取得プロファイル
+
+    return:
+        patterns
+    """
+
+    patterns = []
+    for resource_type in profile['block_types']:
+        patterns.extend(RESOURCE_PATTERNS[resource_type])
+
+    return patterns + profile['block_urls']
+
+
+def create_driver(profile: str = None) -> object:
+    """
+    Headlessモードでdriverを起動する.
+
+    param:
+        profile 取得プロファイル名(Noneの場合はプロファイルを適用しない)
+
+    return:
+        driver
+    """
+
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+    import chromedriver_binary
+
+    opts = Options()
+    for argument in OPTS:
+        opts.add_argument(argument)
+
+    if profile is None:
+        with metrics.timer('driver_start'):
+            driver = webdriver.Chrome('./lib/chromedriver', options=opts)
+        driver.set_page_load_timeout(TIMEOUT)
+        return driver
+
+    settings = PROFILES[profile]
+    if 'image' in settings['block_types']:
+        opts.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2})
+
+    capabilities = DesiredCapabilities.CHROME.copy()
+    capabilities['pageLoadStrategy'] = settings['page_load_strategy']
+
+    with metrics.timer('driver_start'):
+        driver = webdriver.Chrome('./lib/chromedriver', options=opts,
+                                  desired_capabilities=capabilities)
+    driver.set_page_load_timeout(TIMEOUT)
+
+    patterns = blocked_urls(settings)
+    if patterns:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+    return driver
+
+
+def wait_for(driver: object, selector: str, timeout: float = WAIT_TIMEOUT) -> bool:
+    """
+    要素が表示されるまで待つ.
+
+    param:
+        driver driver
+        selector CSSセレクタ
+        timeout 待つ時間(秒)
+
+    return:
+        True 期限内に表示されなかった場合False
+    """
+
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    try:
+        WebDriverWait(driver, timeout).until(
+            expected_conditions.presence_of_element_located(
+                (By.CSS_SELECTOR, selector)))
+    except TimeoutException:
+        return False
+
+    return True
+
+
+class DriverPool:
+    """
+    driverプールクラス.
+    driverは必要になった時点で最大size個まで起動し、スレッド間で使い回す
+    """
+
+    def __init__(self, size: int = POOL_SIZE, profile: str = None):
+        """
+        param:
+            size 最大driver数
+            profile 取得プロファイル名
+        """
+
+        self.size = max(1, size)
+        self.profile = profile
+        self.drivers = []
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> object:
+        """
+        空いているdriverを取得する.
+        空きが無く上限未満であれば起動し、上限に達していれば返却を待つ
+
+        return:
+            driver
+        """
+
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if len(self.drivers) < self.size:
+                driver = create_driver(self.profile)
+                self.drivers.append(driver)
+                return driver
+
+        return self.idle.get()
+
+    def release(self, driver: object):
+        """
+        driverを返却する.
+
+        param:
+            driver 返却するdriver
+        """
+
+        self.idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """
+        with文でdriverを借りる.
+        """
+
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """
+        起動済みの全driverを閉じる.
+        """
+
+        with self.lock:
+            for driver in self.drivers:
+                driver.close()
+                driver.quit()
+            self.drivers = []
+            self.idle = queue.LifoQueue()
+
+
+class HttpBackend:
+    """
+    HTTPクライアント + HTMLパーサによる取得クラス.
+    """
+
+    name = 'http'
+
+    def __init__(self, size: int = POOL_SIZE, use_cache: bool = None):
+        """
+        param:
+            size 同時接続数
+            use_cache レスポンスキャッシュを利用する場合True(省略時はUSE_CACHE)
+        """
+
+        if use_cache is None:
+            use_cache = USE_CACHE
+
+        self.size = max(1, size)
+        self.cache = cache.ResponseCache() if use_cache else None
+        if self.cache is not None:
+            # 常駐中もmetrics.writeでキャッシュの利用状況を出力する
+            # (statsは閉じた後も読めるため、close後の最後のwriteにも出力される)
+            metrics.register('http_cache', self.cache.stats)
+
+        # {URL:取得日時} キャッシュを返した場合はキャッシュの取得日時
+        self.fetched = {}
+
+    def fetched_at(self, url: str) -> float:
+        """
+        直前に取得したURLの取得日時を返す.
+
+        param:
+            url 収集url
+
+        return:
+            fetched_at 取得日時(UNIX時間) 取得していない場合None
+        """
+
+        return self.fetched.pop(url, None)
+
+    def get(self, url: str, target: str) -> object:
+        """
+        ページを取得し解析する.
+        キャッシュが有効期限内であれば通信せず、期限切れであれば条件付きで再取得する
+        取得日時はfetched_atで返す
+
+        param:
+            url 収集url
+            target 収集情報のキーワード(キャッシュの有効期限に使用)
+
+        return:
+            root ルート要素
+        """
+
+        if self.cache is None:
+            with metrics.timer('http_get', target):
+                body, response_headers = self.download(url, {})
+            self.fetched[url] = time.time()
+            charset = response_headers.get_content_charset() or 'utf-8'
+            return self.parse(body.decode(charset, errors='replace'), target)
+
+        entry = self.cache.get(url)
+        if entry is not None and entry.is_fresh(
+                cache.TTL.get(target, cache.DEFAULT_TTL), time.time()):
+            self.cache.hit(entry)
+            self.fetched[url] = entry.fetched_at
+            return self.parse(entry.text(), target)
+
+        headers = entry.validators() if entry is not None else {}
+        start = time.perf_counter()
+        try:
+            with metrics.timer('http_get', target):
+                body, response_headers = self.download(url, headers)
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            self.cache.hit(entry, revalidated=True)
+            self.fetched[url] = time.time()
+            return self.parse(entry.text(), target)
+
+        self.fetched[url] = time.time()
+        self.cache.miss()
+        charset = response_headers.get_content_charset() or 'utf-8'
+        self.cache.put(url, body, charset, response_headers.get('ETag'),
+                       response_headers.get('Last-Modified'),
+                       time.perf_counter() - start)
+
+        return self.parse(body.decode(charset, errors='replace'), target)
+
+    def parse(self, html: str, target: str) -> object:
+        """
+        HTMLを解析する.
+
+        param:
+            html HTML文字列
+            target 収集情報のキーワード
+
+        return:
+            root ルート要素
+        """
+
+        with metrics.timer('html_parse', target):
+            return parse_html(html)
+
+    def download(self, url: str, headers: dict) -> tuple:
+        """
+        ページをダウンロードする.
+
+        param:
+            url 収集url
+            headers 追加のリクエストヘッダ
+
+        return:
+            (本文, レスポンスヘッダ)
+        """
+
+        request = urllib.request.Request(
+            url, headers=dict(headers, **{'User-Agent': USER_AGENT}))
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            return response.read(), response.headers
+
+    def request(self, url: str, target: str) -> object:
+        """
+        getの例外を、ホストの障害(FetchError)とページの問題(PageError)に分ける.
+
+        param:
+            url 収集url
+            target 収集情報のキーワード
+
+        return:
+            root ルート要素
+        """
+
+        try:
+            return self.get(url, target)
+        except urllib.error.HTTPError as e:
+            log.error('request: http error', url=url, code=e.code)
+            if 400 <= e.code < 500:
+                raise PageError('HTTP %d' % e.code)
+            raise FetchError('HTTP %d' % e.code)
+        except (urllib.error.URLError, OSError) as e:
+            log.error('request: connection error', url=url, error=repr(e))
+            raise FetchError(repr(e))
+
+    def fetch_weather(self, url: str) -> tuple:
+        """
+        天気予報ページから解析対象を取得する.
+
+        param:
+            url 収集url
+
+        return:
+            (times, not_current_time, comments, temps) セル毎のテキストのリスト
+            失敗した場合はFetchError、PageErrorを送出する
+        """
+
+        root = self.request(url, 'weather')
+
+        hour = root.find_element_by_class_name('hour')
+        weather = root.find_element_by_class_name('weather')
+        temperature = root.find_element_by_class_name('temperature')
+        if hour is None or weather is None or temperature is None:
+            log.error('fetch_weather: target row is None', url=url)
+            raise PageError('target row is None')
+
+        not_current_time = [
+            val.text for val in hour.find_elements_by_class_name('past')
+        ]
+
+        return cells(hour), not_current_time, cells(weather), cells(temperature)
+
+    def fetch_train(self, url: str) -> list:
+        """
+        運行情報ページから解析対象を取得する.
+
+        param:
+            url 収集url
+
+        return:
+            service_status 運行情報の行のリスト
+            失敗した場合はFetchError、PageErrorを送出する
+        """
+
+        root = self.request(url, 'train')
+
+        service_status = root.find_element_by_id('mdServiceStatus')
+        if service_status is None:
+            log.error('fetch_train: target info is None', url=url)
+            raise PageError('target info is None')
+
+        return service_status.text.split('\n')
+
+    def close(self):
+        """
+        キャッシュの利用状況を記録し、キャッシュファイルを閉じる.
+        """
+
+        if self.cache is not None:
+            log.info('close: http cache', **self.cache.stats())
+            self.cache.close()
+            self.cache = None
+
+
+class SeleniumBackend:
+    """
+    Headless Chromeによる取得クラス.
+    """
+
+    name = 'selenium'
+
+    def __init__(self, size: int = POOL_SIZE, script: bool = None):
+        """
+        param:
+            size driverプールのサイズ
+            script Trueの場合、解析対象を1回のスクリプト実行で取得する
+                   (Noneの場合はSCRIPT_EXTRACT)
+        """
+
+        if script is None:
+            script = SCRIPT_EXTRACT
+
+        self.size = max(1, size)
+        self.script = script
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def fetched_at(self, url: str) -> float:
+        """
+        直前に取得したURLの取得日時を返す.
+        キャッシュを使わないため常にNone(保存日時を取得日時とする)
+
+        param:
+            url 収集url
+
+        return:
+            None
+        """
+
+        return None
+
+    def pool(self, target: str) -> object:
+        """
+        収集情報のプロファイルのdriverプールを返す.
+        同じプロファイルの収集情報はdriverプールを共有する
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            pool
+        """
+
+        profile = SITES.get(target, {}).get('profile')
+        with self.lock:
+            if profile not in self.pools:
+                self.pools[profile] = DriverPool(self.size, profile)
+
+            return self.pools[profile]
+
+    def load(self, driver: object, url: str, target: str):
+        """
+        ページを開き、取得完了とみなす要素が表示されるまで待つ.
+
+        param:
+            driver driver
+            url 収集url
+            target 収集情報のキーワード
+        """
+
+        with metrics.timer('driver_get', target):
+            driver.get(url)
+
+        selector = SITES.get(target, {}).get('wait_for')
+        if selector is None:
+            return
+
+        with metrics.timer('wait_for', target):
+            ready = wait_for(driver, selector)
+        if not ready:
+            metrics.fail('wait_for', target)
+            log.warn('load: wait_for timeout', target=target, url=url)
+
+    def fetch_weather(self, url: str) -> tuple:
+        """
+        天気予報ページから解析対象を取得する.
+
+        param:
+            url 収集url
+
+        return:
+            (times, not_current_time, comments, temps) セル毎のテキストのリスト
+            失敗した場合はFetchError、PageErrorを送出する
+        """
+
+        from selenium.common.exceptions import NoSuchElementException
+
+        with self.pool('weather').driver() as driver:
+            try:
+                self.load(driver, url, 'weather')
+            except Exception as e:
+                log.error('fetch_weather: target url is None', url=url)
+                raise FetchError(repr(e))
+
+            try:
+                with metrics.timer('find_elements', 'weather'):
+                    if self.script:
+                        fetched = driver.execute_script(WEATHER_SCRIPT)
+                    else:
+                        selenium_obj = driver.find_element_by_class_name("hour")
+                        fetched = [
+                            cells(selenium_obj),
+                            [
+                                val.text for val in
+                                selenium_obj.find_elements_by_class_name("past")
+                            ],
+                            cells(driver.find_element_by_class_name("weather")),
+                            cells(driver.find_element_by_class_name("temperature")),
+                        ]
+            except NoSuchElementException:
+                fetched = None
+
+        if fetched is None:
+            log.error('fetch_weather: target row is None', url=url)
+            raise PageError('target row is None')
+
+        return tuple(fetched)
+
+    def fetch_train(self, url: str) -> list:
+        """
+        運行情報ページから解析対象を取得する.
+
+        param:
+            url 収集url
+
+        return:
+            service_status 運行情報の行のリスト
+            失敗した場合はFetchError、PageErrorを送出する
+        """
+
+        from selenium.common.exceptions import NoSuchElementException
+
+        with self.pool('train').driver() as driver:
+            try:
+                self.load(driver, url, 'train')
+            except Exception as e:
+                log.error('fetch_train: target url is None', url=url)
+                raise FetchError(repr(e))
+
+            try:
+                with metrics.timer('find_elements', 'train'):
+                    if self.script:
+                        service_status = driver.execute_script(TRAIN_SCRIPT)
+                    else:
+                        service_status = driver.find_element_by_id(
+                            "mdServiceStatus").text.split('\n')
+            except NoSuchElementException:
+                service_status = None
+
+        if service_status is None:
+            log.error('fetch_train: target info is None', url=url)
+            raise PageError('target info is None')
+
+        return service_status
+
+    def close(self):
+        """
+        driverを閉じる.
+        """
+
+        with self.lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools = {}
+
+
+# バックエンド定義
+BACKENDS = {
+    HttpBackend.name: HttpBackend,
+    SeleniumBackend.name: SeleniumBackend,
+}
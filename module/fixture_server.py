@@ -0,0 +1,264 @@
+"""
+ベンチマーク用ローカルHTTPサーバモジュール.
+tenki.jp、transit.yahoo.co.jpと同じセレクタを持つページを返す
+生成したページの他に、実際のページを保存したもの(fixtures/<収集情報>-<名前>.html)も返す
+
+Usage:
+    $ python fixture_server.py record <収集情報> <名前> <url>
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+import glob
+import hashlib
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+# 保存したページのディレクトリ
+RECORD_DIR = '../fixtures/'
+
+# 接続待ちキューの長さ collect_asyncの同時接続数(最大256)より大きくする
+REQUEST_QUEUE_SIZE = 1024
+
+WEATHER_PAGE = '''<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>{ place }</title></head>
+<body>
+<table class="forecast-point-3h">
+<tr class="hour">{ hours }</tr>
+<tr class="weather"><th>天気</th>{ weathers }</tr>
+<tr class="temperature">{ temps }</tr>
+</table>
+</body>
+</html>'''
+
+TRAIN_PAGE = '''<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>{ route }</title></head>
+<body>
+<div id="mdServiceStatus">
+<dl>
+<dt><span class="icnNormalLarge">[○]</span>{ heading }</dt>
+<dd><p>{ comment }</p></dd>
+</dl>
+</div>
+</body>
+</html>'''
+
+COMMENTS = ['晴れ', '曇り', '雨', '雪']
+
+
+def weather_page(num: int) -> str:
+    """
+    天気予報ページを生成する.
+
+    param:
+        num 場所番号
+
+    return:
+        html
+    """
+
+    hours = ''
+    weathers = ''
+    temps = ''
+    for idx, hour in enumerate(range(3, 25, 3)):
+        past = ' class="past"' if idx < 2 else ''
+        hours += '<td%s><span>%02d</span></td>' % (past, hour)
+        weathers += '<td><p>%s</p></td>' % COMMENTS[(num + idx) % len(COMMENTS)]
+        temps += '<td><span>%.1f</span></td>' % (10 + (num + idx) % 15)
+
+    return WEATHER_PAGE.replace('{ place }', 'place%d' % num) \
+        .replace('{ hours }', hours) \
+        .replace('{ weathers }', weathers) \
+        .replace('{ temps }', temps)
+
+
+def train_page(num: int) -> str:
+    """
+    運行情報ページを生成する.
+
+    param:
+        num 路線番号
+
+    return:
+        html
+    """
+
+    if num % 5 == 0:
+        heading = '列車遅延'
+        comment = '車両点検の影響で、一部列車に遅れが出ています。'
+    else:
+        heading = '平常運転'
+        comment = '現在、事故・遅延に関する情報はありません。'
+
+    return TRAIN_PAGE.replace('{ route }', 'route%d' % num) \
+        .replace('{ heading }', heading) \
+        .replace('{ comment }', comment)
+
+
+def record(target: str, name: str, url: str, record_dir: str = RECORD_DIR) -> str:
+    """
+    実際のページを保存する.
+
+    param:
+        target 収集情報のキーワード
+        name 保存名
+        url 収集url
+        record_dir 保存先
+
+    return:
+        path 保存したファイルのパス
+    """
+
+    request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        body = response.read()
+        charset = response.headers.get_content_charset() or 'utf-8'
+
+    os.makedirs(record_dir, exist_ok=True)
+    path = os.path.join(record_dir, '%s-%s.html' % (target, name))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(body.decode(charset, errors='replace'))
+
+    return path
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    リクエストハンドラ.
+    /weather/<番号>、/train/<番号>、/recorded/<収集情報>-<名前>を返す
+    ?delay=秒 を付けると応答を遅延させる
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        delay = float(query.get('delay', ['0'])[0])
+        if delay > 0:
+            time.sleep(delay)
+
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'recorded':
+            body = self.server.recorded_page(parts[1])
+            if body is None:
+                self.send_error(404)
+                return
+        elif len(parts) != 2 or not parts[1].isdigit():
+            self.send_error(404)
+            return
+        elif parts[0] == 'weather':
+            body = weather_page(int(parts[1]))
+        elif parts[0] == 'train':
+            body = train_page(int(parts[1]))
+        else:
+            self.send_error(404)
+            return
+
+        data = body.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingMixIn, HTTPServer):
+    """
+    スレッド毎にリクエストを処理するローカルサーバ.
+    """
+
+    daemon_threads = True
+
+    # 接続待ちキューの長さ(既定の5では同時接続の多い計測で接続が再送待ちになる)
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+    def __init__(self, port: int = 0, record_dir: str = RECORD_DIR):
+        """
+        param:
+            port ポート番号(0の場合は空いているポート)
+            record_dir 保存したページのディレクトリ
+        """
+
+        super().__init__(('127.0.0.1', port), FixtureHandler)
+        self.thread = None
+        self.record_dir = record_dir
+        self.pages = {}
+
+    def recorded(self, target: str) -> list:
+        """
+        保存したページの名前を返す.
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            names [<収集情報>-<名前>]
+        """
+
+        pattern = os.path.join(self.record_dir, '%s-*.html' % target)
+
+        return sorted(
+            os.path.basename(path)[:-len('.html')] for path in glob.glob(pattern))
+
+    def recorded_page(self, name: str) -> str:
+        """
+        保存したページを返す. 一度読んだページはメモリに保持する
+
+        param:
+            name <収集情報>-<名前>
+
+        return:
+            html 存在しない場合はNone
+        """
+
+        if name not in self.pages:
+            path = os.path.join(self.record_dir, os.path.basename(name) + '.html')
+            try:
+                with open(path, encoding='utf-8') as file:
+                    self.pages[name] = file.read()
+            except OSError:
+                return None
+
+        return self.pages[name]
+
+    @property
+    def base_url(self) -> str:
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        """
+        バックグラウンドで起動する.
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        停止する.
+        """
+
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['record'] and len(sys.argv) == 5:
+        print(record(*sys.argv[2:5]))
+    else:
+        print(__doc__)
@@ -1,27 +1,164 @@
 """
 LOG定義モジュール
+
+呼び出し元のモジュール毎に ../log/<モジュール名>.log へ出力する
+ファイルへの書き込みは別スレッドで行い、呼び出し元はキューに積むだけで戻る
+キーワード引数(target, url, duration等)は構造化した項目として出力する
+
+    log.info('collect: complete', target='weather', duration=1.23)
 """
+import atexit
+import json
 import logging
-import inspect
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+LOG_DIR = '../log/'
+LEVEL = logging.INFO
+FORMAT = '[%(asctime)s][%(levelname)s] %(message)s'
+
+# TrueでJSON Lines形式({"time":..,"level":..,"module":..,"msg":..,項目...})で出力する
+STRUCTURED = False
+
+# ロガー名の接頭辞(他ライブラリのロガーと区別する)
+PREFIX = 'daily.'
+
+QUEUE = queue.Queue(-1)
+LISTENER = None
+LOGGERS = {}
+LOCK = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """
+    テキスト形式. 項目はメッセージの後ろに key=value で出力する
+    """
+
+    def format(self, record: object) -> str:
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join('%s=%s' % item for item in fields.items())
+
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    JSON Lines形式.
+    """
+
+    def format(self, record: object) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'module': record.name[len(PREFIX):],
+            'msg': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', None) or {})
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ModuleFileHandler(logging.Handler):
+    """
+    モジュール名毎のファイルに振り分けて出力するハンドラ.
+    キューを読み出すスレッドからのみ呼ばれる
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+
+    def emit(self, record: object):
+        handler = self.handlers.get(record.name)
+        if handler is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = logging.FileHandler(
+                os.path.join(LOG_DIR, record.name[len(PREFIX):] + '.log'),
+                encoding='utf-8')
+            handler.setFormatter(
+                JsonFormatter() if STRUCTURED else TextFormatter(FORMAT))
+            self.handlers[record.name] = handler
+
+        handler.handle(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+def start():
+    """
+    キューを読み出すスレッドを起動する.
+    """
+
+    global LISTENER
+    if LISTENER is None:
+        LISTENER = logging.handlers.QueueListener(QUEUE, ModuleFileHandler())
+        LISTENER.start()
+        atexit.register(stop)
+
+
+def stop():
+    """
+    キューに残ったログを書き出し、スレッドを停止する.
+    """
+
+    global LISTENER
+    if LISTENER is not None:
+        LISTENER.stop()
+        for handler in LISTENER.handlers:
+            handler.close()
+        LISTENER = None
+
+
+def get_logger(file_name: str) -> object:
+    """
+    モジュールのロガーを取得する.
+    ロガーはモジュール毎に初回のみ生成する
+
+    param:
+        file_name モジュールのファイルパス
+
+    return:
+        logger
+    """
+
+    logger = LOGGERS.get(file_name)
+    if logger is not None:
+        return logger
 
+    with LOCK:
+        if file_name not in LOGGERS:
+            start()
+            name = os.path.splitext(os.path.basename(file_name))[0]
+            logger = logging.getLogger(PREFIX + name)
+            logger.setLevel(LEVEL)
+            logger.propagate = False
+            logger.addHandler(logging.handlers.QueueHandler(QUEUE))
+            LOGGERS[file_name] = logger
 
-def base_conf(file_name):
-    file_name = file_name.split('/')[-1][:-3]
-    filename = '../log/' + file_name + '.log'
-    logging.basicConfig(filename=filename,
-                        format='[%(asctime)s][%(levelname)s] %(message)s')
+    return LOGGERS[file_name]
 
 
-def info(msg):
-    base_conf(inspect.stack()[1][1])
-    return logging.info(msg)
+def info(msg, **fields):
+    logger = get_logger(sys._getframe(1).f_code.co_filename)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(msg, extra={'fields': fields})
 
 
-def warn(msg):
-    base_conf(inspect.stack()[1][1])
-    return logging.warning(msg)
+def warn(msg, **fields):
+    logger = get_logger(sys._getframe(1).f_code.co_filename)
+    if logger.isEnabledFor(logging.WARNING):
+        logger.warning(msg, extra={'fields': fields})
 
 
-def error(msg):
-    base_conf(inspect.stack()[1][1])
-    return logging.error(msg)
+def error(msg, **fields):
+    logger = get_logger(sys._getframe(1).f_code.co_filename)
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error(msg, extra={'fields': fields})
@@ -1,17 +1,324 @@
 """
 実行モジュール.
+サブコマンドに必要なモジュールはサブコマンドの中でimportする
+seleniumはdriverを起動する時(fetch.create_driver)にだけimportするため、
+ページを取得しないサブコマンド(render、debug、migrate、import --file、enqueue)は
+seleniumが無くても動く(test_main.pyで確認する)
+
+Usage:
+    $ python main.py [run]    1回実行する
+    $ python main.py daemon   常駐し、収集情報毎の間隔で実行する
+    $ python main.py serve [--port 8000]
+                              daemonに加え、生成したHTML、JSONをメモリから返すHTTPサーバを起動する
+                              運行情報の変化は/train/events(SSE)、/train/changes(ロングポーリング)で配信する
+    $ python main.py render [weather] [train] [english]
+                              DBに保存された収集結果からHTMLを生成する(省略時は全て)
+    $ python main.py debug    デバッグHTMLを生成する
+    $ python main.py import english [--file words.csv]
+                              英単語を一括登録する(省略時はサイトから収集)
+    $ python main.py import weather|train --file targets.csv [--dry-run]
+                              収集先をCSV/JSONファイルから一括登録(更新)する
+    $ python main.py migrate [--check]
+                              スキーマを最新にする(--checkで頻出クエリの実行計画を確認する)
+    $ python main.py enqueue  収集先をジョブキューに登録する
+    $ python main.py worker [--threads N] [--once] [--no-cache]
+                              ジョブキューを処理する(複数プロセス、複数マシンで実行可)
 """
-import daily_html
+import argparse
+import signal
+import sys
+import dbaccess
 
+# HTML作成対象
+RENDER_TARGETS = ['weather', 'train', 'english']
 
-if __name__ == "__main__":
+
+def run():
     """
+    天気予報、運行情報収集.
     天気予報、運行情報、英単語HTML生成.
     デバッグHTML作成
     """
 
+    import collect
+    import daily_html
+    import metrics
+
+    scraping = collect.Scraping()
+    scraping.refresh(['weather','train'])
+    scraping.close_driver()
+
     ins = daily_html.CreateHtml(['weather','train','english'])
     del ins
 
     debug = daily_html.Debug()
     debug.create_html_about_debug()
+
+    metrics.write()
+
+
+def render(targets: list):
+    """
+    DBに保存された収集結果からHTMLを生成する.
+
+    param:
+        targets HTML作成対象リスト
+    """
+
+    import daily_html
+    import metrics
+
+    daily_html.CreateHtml(targets)
+    metrics.write()
+
+
+def debug():
+    """
+    デバッグHTML作成.
+    """
+
+    import daily_html
+
+    daily_html.Debug().create_html_about_debug()
+
+
+def daemon():
+    """
+    常駐実行.
+    SIGTERM、SIGINTで停止する
+    """
+
+    import scheduler
+
+    ins = scheduler.Scheduler()
+    signal.signal(signal.SIGTERM, lambda signum, frame: ins.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: ins.stop())
+    ins.run()
+
+
+def serve(port: int):
+    """
+    常駐実行し、生成したHTML、JSONをHTTPで返す.
+    HTMLを生成する度にメモリ上の内容を差し替え、運行情報の変化を配信する
+    SIGTERM、SIGINTで停止する
+
+    param:
+        port ポート番号(Noneの場合はserver.PORT)
+    """
+
+    import events
+    import scheduler
+    import server
+
+    store = server.PageStore()
+    store.load()
+    broker = events.ChangeBroker()
+    if not broker.start():
+        broker = None
+    httpd = server.PageServer(store, port=port or server.PORT, broker=broker)
+    httpd.start()
+
+    def on_complete(target: str):
+        store.reload(target)
+        if broker is not None:
+            broker.notify(target)
+
+    ins = scheduler.Scheduler(on_complete=on_complete)
+    signal.signal(signal.SIGTERM, lambda signum, frame: ins.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: ins.stop())
+    try:
+        ins.run()
+    finally:
+        httpd.stop()
+
+
+def enqueue():
+    """
+    天気予報、運行情報の収集先をジョブキューに登録する.
+    """
+
+    import worker
+
+    counts = worker.enqueue(['weather', 'train'])
+    if counts is False:
+        print('enqueue failed')
+        return
+
+    print(' '.join('%s %d' % item for item in counts.items()))
+
+
+def run_worker(threads: int, once: bool, use_cache: bool):
+    """
+    ジョブキューを処理する.
+    SIGTERM、SIGINTで処理中のジョブを書き戻してから停止する
+
+    param:
+        threads 同時に取得するページ数(Noneの場合はfetch.POOL_SIZE)
+        once Trueの場合、ジョブが無くなった時点で終了する
+        use_cache Falseの場合、HTTPレスポンスをキャッシュしない
+    """
+
+    import fetch
+    import worker
+
+    fetch.USE_CACHE = use_cache
+    ins = worker.Worker(threads or fetch.POOL_SIZE)
+    signal.signal(signal.SIGTERM, lambda signum, frame: ins.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: ins.stop())
+    stats = ins.run(once)
+
+    print('done %(done)d failed %(failed)d released %(released)d lost %(lost)d' % stats)
+
+
+def import_english(path: str):
+    """
+    英単語一括登録.
+
+    param:
+        path CSV/TSVファイルパス(Noneの場合はサイトから収集)
+    """
+
+    import collect
+
+    stats = collect.Insert().insert_english(path)
+    if stats is False:
+        print('import failed')
+        return
+
+    print('read %(read)d inserted %(inserted)d in %(seconds).3fs' % stats)
+
+
+def import_targets(target: str, path: str, dry_run: bool):
+    """
+    収集先一括登録.
+    登録(dry_runの場合は登録せず)した差分を表示する
+
+    param:
+        target 収集情報のキーワード
+        path CSV/JSONファイルパス
+        dry_run Trueの場合、差分を表示するだけで登録しない
+    """
+
+    import collect
+
+    diff = collect.Insert().import_targets(target, path, dry_run)
+    if diff is False:
+        print('import failed')
+        return
+
+    for key, url in diff['added']:
+        print('+ %s %s' % (key, url))
+    for key, old_url, new_url in diff['updated']:
+        print('~ %s %s -> %s' % (key, old_url, new_url))
+    for key, url in diff['removed']:
+        print('- %s %s' % (key, url))
+    print('%sadded %d updated %d removed %d unchanged %d' % (
+        '(dry run) ' if dry_run else '', len(diff['added']),
+        len(diff['updated']), len(diff['removed']), diff['unchanged']))
+
+
+def migrate(check: bool):
+    """
+    スキーマを最新にする.
+
+    param:
+        check Trueの場合、頻出クエリがインデックスを使っているか確認する
+    """
+
+    print('schema version %d' % dbaccess.CreateTable().schema_version)
+    if not check:
+        return
+
+    plans = dbaccess.check_query_plans()
+    for name, uses_index, details in plans:
+        print('%-4s %s: %s' % ('ok' if uses_index else 'SCAN', name, ' / '.join(details)))
+    if not all(uses_index for _, uses_index, _ in plans):
+        sys.exit(1)
+
+
+def parse_args() -> object:
+    """
+    コマンドライン引数を解析する.
+
+    return:
+        args サブコマンドを省略した場合、commandはrun
+    """
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('run', help='1回実行する')
+    subparsers.add_parser('daemon', help='常駐し、収集情報毎の間隔で実行する')
+
+    sub = subparsers.add_parser('serve', help='daemonに加え、HTTPサーバを起動する')
+    sub.add_argument('--port', type=int,
+                     help='HTTPサーバのポート番号(省略時はserver.PORT)')
+
+    sub = subparsers.add_parser('render', help='DBの収集結果からHTMLを生成する')
+    # nargs='*'とchoicesを併用すると省略時にエラーになるため、解析後に確認する
+    sub.add_argument('targets', nargs='*',
+                     metavar='{%s}' % ','.join(RENDER_TARGETS),
+                     help='HTML作成対象(省略時は全て)')
+
+    subparsers.add_parser('debug', help='デバッグHTMLを生成する')
+
+    sub = subparsers.add_parser('import', help='英単語、収集先を一括登録する')
+    sub.add_argument('kind', choices=['english', 'weather', 'train'])
+    sub.add_argument('--file', help='英単語のCSV/TSVファイル、収集先のCSV/JSONファイル')
+    sub.add_argument('--dry-run', action='store_true',
+                     help='収集先の差分を表示するだけで登録しない')
+
+    sub = subparsers.add_parser('migrate', help='スキーマを最新にする')
+    sub.add_argument('--check', action='store_true',
+                     help='頻出クエリの実行計画を確認する')
+
+    subparsers.add_parser('enqueue', help='収集先をジョブキューに登録する')
+
+    sub = subparsers.add_parser('worker', help='ジョブキューを処理する')
+    sub.add_argument('--threads', type=int,
+                     help='同時に取得するページ数(省略時はfetch.POOL_SIZE)')
+    sub.add_argument('--once', action='store_true',
+                     help='ジョブが無くなった時点で終了する')
+    sub.add_argument('--no-cache', action='store_true',
+                     help='HTTPレスポンスをキャッシュしない')
+
+    args = parser.parse_args()
+    if args.command is None:
+        args.command = 'run'
+    if args.command == 'render':
+        for target in args.targets:
+            if target not in RENDER_TARGETS:
+                parser.error('invalid render target: %s' % target)
+    if args.command == 'import' and args.kind != 'english' and args.file is None:
+        parser.error('import %s requires --file' % args.kind)
+
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # 未適用のマイグレーションを適用する(適用済みであれば版番号を読むだけ)
+    dbaccess.CreateTable()
+
+    if args.command == 'daemon':
+        daemon()
+    elif args.command == 'serve':
+        serve(args.port)
+    elif args.command == 'render':
+        render(args.targets or RENDER_TARGETS)
+    elif args.command == 'debug':
+        debug()
+    elif args.command == 'import':
+        if args.kind == 'english':
+            import_english(args.file)
+        else:
+            import_targets(args.kind, args.file, args.dry_run)
+    elif args.command == 'migrate':
+        migrate(args.check)
+    elif args.command == 'enqueue':
+        enqueue()
+    elif args.command == 'worker':
+        run_worker(args.threads, args.once, not args.no_cache)
+    else:
+        run()
@@ -0,0 +1,256 @@
+"""
+計測モジュール.
+処理段階(stage)、収集情報(target)毎の処理時間と失敗回数を集計し、
+Prometheusのテキスト形式(node exporterのtextfile collector用)とJSONで出力する
+
+    with metrics.timer('driver_get', 'weather'):
+        driver.get(url)
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# 出力先
+METRICS_DIR = '../metrics/'
+PROM_FILE = 'daily_app.prom'
+JSON_FILE = 'daily_app.json'
+
+# メトリクス名の接頭辞
+PREFIX = 'daily_app'
+
+# ヒストグラムのバケット(秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    処理時間の分布クラス.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float):
+        """
+        処理時間を記録する.
+
+        param:
+            seconds 処理時間(秒)
+        """
+
+        for idx, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[idx] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+
+class Registry:
+    """
+    集計クラス.
+    複数スレッドから記録できる
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 出力時に値を読み込むカウンタ {名前:カウンタを返す関数}(resetで消さない)
+        self.sources = {}
+        self.reset()
+
+    def reset(self):
+        """
+        集計を初期化する.
+        """
+
+        with self.lock:
+            self.histograms = {}
+            self.failures = {}
+
+    def observe(self, stage: str, target: str, seconds: float):
+        """
+        処理時間を記録する.
+
+        param:
+            stage 処理段階
+            target 収集情報のキーワード
+            seconds 処理時間(秒)
+        """
+
+        key = (stage, target)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def fail(self, stage: str, target: str = ''):
+        """
+        失敗を記録する.
+
+        param:
+            stage 処理段階
+            target 収集情報のキーワード
+        """
+
+        key = (stage, target)
+        with self.lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    def register(self, name: str, source: object):
+        """
+        出力時に値を読み込むカウンタを登録する. 同じ名前で登録し直すと置き換える
+
+        param:
+            name 名前(メトリクス名は<PREFIX>_<名前>_<カウンタ名>)
+            source {カウンタ名:値}を返す関数
+        """
+
+        with self.lock:
+            self.sources[name] = source
+
+    def read_sources(self) -> dict:
+        """
+        登録されたカウンタを読み込む.
+
+        return:
+            values {名前:{カウンタ名:値}}
+        """
+
+        with self.lock:
+            sources = dict(self.sources)
+
+        return {name: source() for name, source in sorted(sources.items())}
+
+    @contextmanager
+    def timer(self, stage: str, target: str = ''):
+        """
+        with文の処理時間を記録する. 例外が発生した場合は失敗も記録する
+
+        param:
+            stage 処理段階
+            target 収集情報のキーワード
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.fail(stage, target)
+            raise
+        finally:
+            self.observe(stage, target, time.perf_counter() - start)
+
+    def prometheus(self) -> str:
+        """
+        Prometheusのテキスト形式で返す.
+
+        return:
+            text
+        """
+
+        name = PREFIX + '_stage_duration_seconds'
+        lines = [
+            '# HELP %s Duration of each stage per target.' % name,
+            '# TYPE %s histogram' % name,
+        ]
+        with self.lock:
+            for (stage, target), hist in sorted(self.histograms.items()):
+                labels = 'stage="%s",target="%s"' % (stage, target)
+                for bound, count in zip(BUCKETS, hist.buckets):
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        name, labels, bound, count))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+                    name, labels, hist.count))
+                lines.append('%s_sum{%s} %.6f' % (name, labels, hist.sum))
+                lines.append('%s_count{%s} %d' % (name, labels, hist.count))
+
+            name = PREFIX + '_failures_total'
+            lines.append('# HELP %s Failures of each stage per target.' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (stage, target), count in sorted(self.failures.items()):
+                lines.append('%s{stage="%s",target="%s"} %d' % (
+                    name, stage, target, count))
+
+        for source, values in self.read_sources().items():
+            for key, value in sorted(values.items()):
+                name = '%s_%s_%s' % (PREFIX, source, key)
+                lines.append('# HELP %s %s %s.' % (name, source, key))
+                lines.append('# TYPE %s gauge' % name)
+                lines.append('%s %s' % (name, value))
+
+        name = PREFIX + '_last_run_timestamp_seconds'
+        lines.append('# HELP %s Time the metrics were written.' % name)
+        lines.append('# TYPE %s gauge' % name)
+        lines.append('%s %.3f' % (name, time.time()))
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """
+        JSON出力用の集計を返す.
+
+        return:
+            summary {generated_at, stages:[...], failures:[...], sources:{...}}
+        """
+
+        with self.lock:
+            stages = [
+                {
+                    'stage': stage,
+                    'target': target,
+                    'count': hist.count,
+                    'sum': round(hist.sum, 6),
+                    'avg': round(hist.sum / hist.count, 6),
+                    'min': round(hist.min, 6),
+                    'max': round(hist.max, 6),
+                }
+                for (stage, target), hist in sorted(self.histograms.items())
+            ]
+            failures = [
+                {'stage': stage, 'target': target, 'count': count}
+                for (stage, target), count in sorted(self.failures.items())
+            ]
+
+        return {
+            'generated_at': time.time(),
+            'stages': stages,
+            'failures': failures,
+            'sources': self.read_sources(),
+        }
+
+    def write(self, directory: str = METRICS_DIR):
+        """
+        Prometheusのテキスト形式とJSONでファイルに出力する.
+        収集途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+
+        param:
+            directory 出力先
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        outputs = {
+            PROM_FILE: self.prometheus(),
+            JSON_FILE: json.dumps(self.summary(), indent=2),
+        }
+        for file_name, text in outputs.items():
+            path = os.path.join(directory, file_name)
+            # 一時ファイルはプロセス毎に分け、複数のワーカーが同時に書いても壊れないようにする
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+            os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+timer = REGISTRY.timer
+observe = REGISTRY.observe
+fail = REGISTRY.fail
+register = REGISTRY.register
+write = REGISTRY.write
@@ -0,0 +1,130 @@
+"""
+常駐実行モジュール.
+driver、HTTPキャッシュを起動したまま、収集情報毎の間隔で収集・HTML生成を繰り返す
+"""
+import heapq
+import random
+import threading
+import time
+import cache
+import collect
+import daily_html
+import log
+import metrics
+import worker
+
+# 収集情報毎の更新間隔(秒)
+INTERVALS = {
+    'train': 2 * 60,
+    'weather': 60 * 60,
+    'english': 24 * 60 * 60,
+}
+
+# Trueの場合、収集はジョブキューに登録するだけにし、ワーカー(main.py worker)に任せる
+# HTMLはワーカーが書き戻した最新の収集結果から生成する
+USE_QUEUE = False
+
+# 更新間隔の揺らぎ(割合)
+# 複数台で動かした場合に収集先へのアクセスが同時刻に集中しないようにする
+JITTER = 0.1
+
+
+class Scheduler:
+    """
+    常駐実行クラス.
+    """
+
+    def __init__(self, intervals: dict = INTERVALS, jitter: float = JITTER,
+                 on_complete: object = None):
+        """
+        param:
+            intervals {収集情報のキーワード:更新間隔(秒)}
+            jitter 更新間隔の揺らぎ(割合)
+            on_complete HTML生成後に呼ぶ関数(引数は収集情報のキーワード)
+        """
+
+        self.intervals = intervals
+        self.jitter = jitter
+        self.on_complete = on_complete
+        self.scraping = collect.Scraping()
+
+        # キャッシュの有効期限が最短の更新間隔以上の場合、更新しても古いページを返す
+        for target, interval in intervals.items():
+            ttl = cache.TTL.get(target)
+            if ttl is not None and ttl >= interval * (1 - jitter):
+                log.warn('__init__: cache ttl exceeds interval', target=target,
+                         ttl=ttl, interval=interval, jitter=jitter)
+        self.stopped = threading.Event()
+
+        # (次回実行時刻, 収集情報のキーワード) 起動直後に全て実行する
+        now = time.time()
+        self.queue = [(now, target) for target in intervals]
+        heapq.heapify(self.queue)
+
+    def next_interval(self, target: str) -> float:
+        """
+        揺らぎを加えた次回までの間隔を返す.
+
+        param:
+            target 収集情報のキーワード
+
+        return:
+            interval 間隔(秒)
+        """
+
+        interval = self.intervals[target]
+
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def run_target(self, target: str):
+        """
+        収集し、対象のHTMLだけを生成する.
+
+        param:
+            target 収集情報のキーワード
+        """
+
+        if target in collect.TARGET_KEYS:
+            if USE_QUEUE:
+                worker.enqueue([target])
+            else:
+                self.scraping.refresh([target])
+
+        daily_html.CreateHtml([target])
+
+        if self.on_complete is not None:
+            self.on_complete(target)
+
+    def run(self):
+        """
+        stopが呼ばれるまで実行する.
+        """
+
+        log.info('run: scheduler start %s' % self.intervals)
+        while not self.stopped.is_set():
+            due, target = self.queue[0]
+            if self.stopped.wait(max(0, due - time.time())):
+                break
+
+            heapq.heappop(self.queue)
+            start = time.time()
+            try:
+                self.run_target(target)
+            except Exception as e:
+                log.error('run: %r' % e, target=target)
+            log.info('run: complete', target=target,
+                     duration=round(time.time() - start, 3))
+            metrics.write()
+
+            heapq.heappush(
+                self.queue, (start + self.next_interval(target), target))
+
+        self.scraping.close_driver()
+        log.info('run: scheduler stop')
+
+    def stop(self):
+        """
+        停止する.
+        """
+
+        self.stopped.set()
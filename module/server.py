@@ -0,0 +1,420 @@
+"""
+HTTPサーバモジュール.
+生成したHTML、JSON、静的ファイルをメモリに保持して返す
+内容のハッシュによるETagで304を返し、gzip圧縮済みの本文を使い回す
+HTMLの再生成後はreloadで差し替える(処理中のリクエストは差し替え前の内容を返す)
+運行情報の変化はServer-Sent Events(/train/events)、ロングポーリング(/train/changes)で配信する
+
+    $ python main.py serve
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import log
+
+# 待ち受けるアドレス、ポート
+HOST = '0.0.0.0'
+PORT = 8000
+
+# 公開するディレクトリ(生成したHTML、JSONの出力先)
+ROOT_DIR = '../'
+
+# ROOT_DIR直下で公開するファイルの拡張子、公開するサブディレクトリ
+PAGE_EXTENSIONS = ('.html', '.json')
+PUBLIC_DIRS = ('static', 'debug')
+
+# /で返すページ
+INDEX = 'weather.html'
+
+# gzip圧縮する最小サイズ(バイト) これより小さい場合は圧縮しない
+GZIP_MIN_SIZE = 256
+
+# Cache-Control
+# ファイル名にハッシュを含む静的ファイル(static/dist/)は変わらないため期限を長くする
+CACHE_CONTROL = 'no-cache'
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# keep-aliveで次のリクエストを待つ時間(秒)
+KEEP_ALIVE_TIMEOUT = 75
+
+# 運行情報の変化の配信先
+#   EVENTS_PATH Server-Sent Events 受信済みのidはLast-Event-IDヘッダまたは?since=
+#   CHANGES_PATH ロングポーリング ?since=<受信済みのid>&timeout=<秒>
+#                sinceを省略した場合は待たずに最新のidを返す
+EVENTS_PATH = '/train/events'
+CHANGES_PATH = '/train/changes'
+
+# Server-Sent Eventsで変化が無い場合にコメントを送る間隔(秒)、再接続までの待ち時間(ミリ秒)
+HEARTBEAT_INTERVAL = 15
+RETRY_INTERVAL = 3000
+
+# ロングポーリングで待つ時間の上限(秒)
+LONG_POLL_TIMEOUT = 30
+
+
+class Resource:
+    """
+    メモリに保持するファイルクラス.
+    """
+
+    def __init__(self, path: str, body: bytes):
+        """
+        本文のETag、gzip圧縮した本文を生成する.
+
+        param:
+            path URLのパス
+            body 本文
+        """
+
+        self.body = body
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = '"%s"' % digest
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in (
+                'application/json', 'application/javascript'):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+
+        if '/dist/' in path:
+            self.cache_control = CACHE_CONTROL_IMMUTABLE
+        else:
+            self.cache_control = CACHE_CONTROL
+
+        # 圧縮しても小さくならない本文(画像等)はgzipで返さない
+        self.gzip_body = None
+        self.gzip_etag = None
+        if len(body) >= GZIP_MIN_SIZE:
+            compressed = gzip.compress(body, compresslevel=9)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                self.gzip_etag = '"%s-gz"' % digest
+
+
+class PageStore:
+    """
+    公開するファイルの保持クラス.
+    {URLのパス:Resource}の辞書ごと差し替えるため、読み出し側はロック不要
+    """
+
+    def __init__(self, root_dir: str = ROOT_DIR):
+        """
+        param:
+            root_dir 公開するディレクトリ
+        """
+
+        self.root_dir = root_dir
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> object:
+        """
+        URLのパスのファイルを返す.
+
+        param:
+            path URLのパス
+
+        return:
+            resource 存在しない場合None
+        """
+
+        return self.resources.get(path)
+
+    def read(self, rel_path: str) -> object:
+        """
+        ファイルを読み込む.
+
+        param:
+            rel_path 公開するディレクトリからの相対パス
+
+        return:
+            resource 読み込めない場合None
+        """
+
+        try:
+            with open(os.path.join(self.root_dir, rel_path), 'rb') as file:
+                body = file.read()
+        except OSError:
+            return None
+
+        return Resource('/' + rel_path.replace(os.sep, '/'), body)
+
+    def load(self) -> int:
+        """
+        公開する全ファイルを読み込み、差し替える.
+
+        return:
+            count ファイル数
+        """
+
+        rel_paths = [
+            name for name in os.listdir(self.root_dir)
+            if name.endswith(PAGE_EXTENSIONS)
+        ]
+        for public_dir in PUBLIC_DIRS:
+            top = os.path.join(self.root_dir, public_dir)
+            for dir_path, _, names in os.walk(top):
+                for name in names:
+                    if name.endswith(('.gz', '.tmp')):
+                        continue
+                    rel_paths.append(os.path.relpath(
+                        os.path.join(dir_path, name), self.root_dir))
+
+        resources = {}
+        for rel_path in rel_paths:
+            resource = self.read(rel_path)
+            if resource is not None:
+                resources['/' + rel_path.replace(os.sep, '/')] = resource
+
+        with self.lock:
+            self.resources = resources
+        log.info('load: complete', count=len(resources))
+
+        return len(resources)
+
+    def reload(self, target: str) -> int:
+        """
+        HTML作成対象のHTML、JSONを読み込み直し、差し替える.
+
+        param:
+            target HTML作成対象
+
+        return:
+            count 読み込んだファイル数
+        """
+
+        loaded = {}
+        for rel_path in (target + '.html', target + '.json', target + '.delta.json'):
+            resource = self.read(rel_path)
+            if resource is not None:
+                loaded['/' + rel_path] = resource
+
+        with self.lock:
+            resources = dict(self.resources)
+            resources.update(loaded)
+            self.resources = resources
+        log.info('reload: complete', target=target, count=len(loaded))
+
+        return len(loaded)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    リクエストハンドラ.
+    HTTP/1.1でkeep-aliveする
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def respond(self, head: bool):
+        """
+        保持しているファイルを返す.
+
+        param:
+            head HEADリクエストの場合True
+        """
+
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        if path == '/':
+            path = '/' + INDEX
+
+        broker = self.server.broker
+        if broker is not None and path == EVENTS_PATH:
+            self.stream(broker, parse_qs(url.query), head)
+            return
+        if broker is not None and path == CHANGES_PATH:
+            self.long_poll(broker, parse_qs(url.query), head)
+            return
+
+        resource = self.server.store.get(path)
+        if resource is None:
+            self.send_error(404)
+            return
+
+        use_gzip = (resource.gzip_body is not None
+                    and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        if use_gzip:
+            body, etag = resource.gzip_body, resource.gzip_etag
+        else:
+            body, etag = resource.body, resource.etag
+
+        # 圧縮の有無に関わらず、同じ内容のETagであれば変わっていない
+        if_none_match = self.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or any(
+                tag.strip() in (resource.etag, resource.gzip_etag)
+                for tag in if_none_match.split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', resource.cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', resource.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', resource.cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def stream(self, broker: object, query: dict, head: bool):
+        """
+        運行情報の変化をServer-Sent Eventsで送り続ける.
+        クライアントが切断するか、サーバが停止するまで戻らない
+
+        param:
+            broker events.ChangeBroker
+            query クエリ文字列
+            head HEADリクエストの場合True
+        """
+
+        last_id = self.last_id(self.headers.get('Last-Event-ID'), query)
+        if last_id is None:
+            last_id = broker.last_id
+
+        # 長さが決まらないため、切断をもって終わりとする
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+        if head:
+            return
+
+        payload = 'retry: %d\n\n' % RETRY_INTERVAL
+        while True:
+            try:
+                self.wfile.write(payload.encode('utf-8'))
+                self.wfile.flush()
+            except OSError:
+                break
+            if broker.stopped.is_set():
+                break
+
+            changes = broker.wait(last_id, HEARTBEAT_INTERVAL)
+            if changes:
+                last_id = changes[-1]['id']
+                payload = ''.join(
+                    'id: %d\nevent: change\ndata: %s\n\n'
+                    % (change['id'], json.dumps(change, ensure_ascii=False))
+                    for change in changes)
+            else:
+                payload = ': ping\n\n'
+
+    def long_poll(self, broker: object, query: dict, head: bool):
+        """
+        運行情報の変化が届くまで待ち、JSONで返す.
+
+        param:
+            broker events.ChangeBroker
+            query クエリ文字列
+            head HEADリクエストの場合True
+        """
+
+        last_id = self.last_id(None, query)
+        if last_id is None:
+            changes = []
+            last_id = broker.last_id
+        else:
+            try:
+                timeout = float(query.get('timeout', [LONG_POLL_TIMEOUT])[0])
+            except ValueError:
+                timeout = LONG_POLL_TIMEOUT
+            changes = broker.wait(last_id, max(0, min(timeout, LONG_POLL_TIMEOUT)))
+            if changes:
+                last_id = changes[-1]['id']
+
+        body = json.dumps({'last_id': last_id, 'changes': changes},
+                          ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def last_id(self, header: str, query: dict) -> int:
+        """
+        クライアントが受信済みのidを返す.
+
+        param:
+            header Last-Event-IDヘッダ
+            query クエリ文字列
+
+        return:
+            last_id 指定が無い、不正な場合None
+        """
+
+        value = header or query.get('since', [None])[0]
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PageServer(ThreadingMixIn, HTTPServer):
+    """
+    接続毎にスレッドで処理するHTTPサーバ.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store: object, host: str = HOST, port: int = PORT,
+                 broker: object = None):
+        """
+        param:
+            store PageStore
+            host 待ち受けるアドレス
+            port ポート番号(0の場合は空いているポート)
+            broker events.ChangeBroker(省略時は運行情報の変化を配信しない)
+        """
+
+        super().__init__((host, port), PageHandler)
+        self.store = store
+        self.broker = broker
+        self.thread = None
+
+    def start(self):
+        """
+        バックグラウンドで起動する.
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        log.info('start: listening', host=self.server_address[0],
+                 port=self.server_address[1])
+
+    def stop(self):
+        """
+        停止する. 変化を待っているクライアントは切断する
+        """
+
+        if self.broker is not None:
+            self.broker.stop()
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,107 @@
+"""
+テンプレートモジュール.
+ページの骨格を一度だけ解析して使い回し、bodyは断片のリストのまま出力する
+"""
+import os
+import re
+
+# 置換箇所 {{ 名前 }}
+PLACEHOLDER = re.compile(r'\{\{ (\w+) \}\}')
+
+# bodyを差し込む置換箇所の名前
+BODY = 'body'
+
+
+class Template:
+    """
+    テンプレートクラス.
+    """
+
+    def __init__(self, source: str):
+        """
+        テンプレートを解析する.
+
+        param:
+            source テンプレート文字列
+        """
+
+        # 偶数番目は固定文字列、奇数番目は置換箇所の名前
+        self.parts = PLACEHOLDER.split(source)
+
+    def render(self, **context) -> str:
+        """
+        置換箇所を埋めた文字列を返す.
+
+        param:
+            context {置換箇所の名前:値}
+
+        return:
+            text
+        """
+
+        parts = self.parts[:]
+        for idx in range(1, len(parts), 2):
+            parts[idx] = str(context[parts[idx]])
+
+        return ''.join(parts)
+
+
+class Page:
+    """
+    ページの骨格クラス.
+    {{ body }}の前後をヘッダ、フッタとして解析しておく
+    """
+
+    def __init__(self, source: str):
+        """
+        param:
+            source テンプレート文字列({{ body }}を1箇所含む)
+        """
+
+        header, footer = source.split('{{ %s }}' % BODY)
+        self.header = Template(header)
+        self.footer = Template(footer)
+
+    def iter_render(self, fragments: list, **context):
+        """
+        ヘッダ、bodyの断片、フッタを順に返す.
+
+        param:
+            fragments bodyの断片のイテラブル
+            context {置換箇所の名前:値}
+        """
+
+        yield self.header.render(**context)
+        for fragment in fragments:
+            yield fragment
+        yield self.footer.render(**context)
+
+    def render(self, fragments: list, **context) -> str:
+        """
+        ページ全体を1回の結合で返す.
+
+        param:
+            fragments bodyの断片のイテラブル
+            context {置換箇所の名前:値}
+
+        return:
+            html
+        """
+
+        return ''.join(self.iter_render(fragments, **context))
+
+    def write(self, path: str, fragments: list, **context):
+        """
+        ページを結合せずにファイルへ書き出す.
+        読み込み中のクライアントに書きかけのページを返さないよう、一時ファイルに書いてから置き換える
+
+        param:
+            path 出力ファイルパス
+            fragments bodyの断片のイテラブル
+            context {置換箇所の名前:値}
+        """
+
+        with open(path + '.tmp', 'w', encoding='utf-8', newline='') as file:
+            for text in self.iter_render(fragments, **context):
+                file.write(text)
+        os.replace(path + '.tmp', path)
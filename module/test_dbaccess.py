@@ -0,0 +1,146 @@
+"""
+dbaccessのマイグレーションのテスト.
+
+    $ cd module && python -m pytest -q
+"""
+import sqlite3
+import pytest
+import dbaccess
+import log
+
+# 最新のスキーマの版
+LATEST = len(dbaccess.MIGRATIONS)
+
+
+@pytest.fixture
+def warnings(monkeypatch):
+    """
+    log.warnの呼び出しを記録する.
+    """
+
+    calls = []
+    monkeypatch.setattr(log, 'warn', lambda msg, **fields: calls.append((msg, fields)))
+
+    return calls
+
+
+def user_version() -> int:
+    conn = sqlite3.connect(dbaccess.DB_PATH)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def create_legacy(path: str, table: str, columns: str, rows: list):
+    """
+    バージョン管理前のスキーマのテーブルを作る.
+    """
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE %s (pkey integer PRIMARY KEY AUTOINCREMENT, %s)" % (
+        table, columns))
+    names = [column.split()[0] for column in columns.split(', ')]
+    conn.executemany("INSERT INTO %s (%s) VALUES (%s)" % (
+        table, ', '.join(names), ', '.join('?' * len(names))), rows)
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_db_is_latest(workdir):
+    assert dbaccess.CreateTable().schema_version == LATEST
+    assert user_version() == LATEST
+
+
+def test_query_plans_use_index(workdir):
+    plans = dbaccess.check_query_plans()
+
+    assert len(plans) == len(dbaccess.QUERY_PLANS)
+    for name, uses_index, details in plans:
+        assert uses_index, (name, details)
+
+
+def test_migrate_unversioned_db(workdir, warnings):
+    # 版管理前のdaily.db(英単語に復習日時が無い、収集先に重複がある)
+    path = dbaccess.DB_PATH
+    create_legacy(path, 'english_study', 'english text NOT NULL, japanese text NOT NULL',
+                  [('word%d' % i, '単語%d' % i) for i in range(20)])
+    create_legacy(path, 'weather', 'place text NOT NULL, url text NOT NULL',
+                  [('東京', 'http://a/1'), ('東京', 'http://a/2'), ('大阪', 'http://a/3')])
+    create_legacy(path, 'train', 'route text NOT NULL, url text NOT NULL',
+                  [('山手線', 'http://b/1')])
+    assert user_version() == 0
+
+    assert dbaccess.CreateTable().schema_version == LATEST
+    assert user_version() == LATEST
+
+    db = dbaccess.Weather()
+    assert [(row['place'], row['url']) for row in db.select_all()] == [
+        ('東京', 'http://a/1'), ('大阪', 'http://a/3')]
+    db.close()
+    removed = [fields for msg, fields in warnings
+               if msg == 'create_index: duplicate removed']
+    assert [(fields['table'], fields['url']) for fields in removed] == [
+        ('weather', 'http://a/2')]
+
+    db = dbaccess.EnglishStudy()
+    reviews = [row['next_review'] for row in db.select_all()]
+    db.close()
+    assert len(reviews) == 20
+    assert all(0 < review < 1 for review in reviews)
+    assert len(set(reviews)) == 20
+
+
+def test_import_legacy_files(workdir):
+    # テーブル毎のデータベースファイル(<テーブル名>.db)
+    create_legacy(str(workdir / 'english_study.db'), 'english_study',
+                  'english text NOT NULL, japanese text NOT NULL',
+                  [('word%d' % i, '単語%d' % i) for i in range(20)])
+    create_legacy(str(workdir / 'train.db'), 'train',
+                  'route text NOT NULL, url text NOT NULL',
+                  [('山手線', 'http://b/1'), ('山手線', 'http://b/1')])
+
+    assert dbaccess.CreateTable().schema_version == LATEST
+    assert user_version() == LATEST
+
+    db = dbaccess.EnglishStudy()
+    reviews = [row['next_review'] for row in db.select_all()]
+    db.close()
+    assert len(reviews) == 20
+    assert all(0 < review < 1 for review in reviews)
+    assert len(set(reviews)) == 20
+
+    db = dbaccess.Train()
+    assert len(db.select_all()) == 1
+    db.close()
+
+
+def test_import_legacy_once(workdir):
+    create_legacy(str(workdir / 'train.db'), 'train',
+                  'route text NOT NULL, url text NOT NULL',
+                  [('old', 'http://b/1')])
+    dbaccess.CreateTable()
+    assert not (workdir / 'train.db').exists()
+    assert (workdir / ('train.db' + dbaccess.LEGACY_SUFFIX)).exists()
+
+    db = dbaccess.Train()
+    db.delete_by_route('old')
+    db.commit()
+
+    # 再起動しても削除した路線は戻らない
+    dbaccess.CreateTable()
+    db = dbaccess.Train()
+    assert db.select_all() == []
+    db.close()
+
+
+def test_migrate_twice_is_noop(workdir):
+    dbaccess.CreateTable()
+    db = dbaccess.Weather()
+    db.insert('東京', 'http://a/1')
+    db.commit()
+
+    assert dbaccess.CreateTable().schema_version == LATEST
+    db = dbaccess.Weather()
+    assert len(db.select_all()) == 1
+    db.close()
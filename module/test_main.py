@@ -0,0 +1,72 @@
+"""
+main.pyのサブコマンドのテスト.
+収集しないサブコマンドはselenium、chromedriver_binaryが無くても動くことを確認する
+
+    $ cd module && python -m pytest -q
+"""
+import os
+import subprocess
+import sys
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# seleniumをimportできない状態にする
+# (sys.modulesにNoneを入れたモジュールはimportでImportErrorになる)
+BLOCK_SELENIUM = '''
+import sys
+sys.modules['selenium'] = None
+sys.modules['chromedriver_binary'] = None
+sys.path.insert(0, %r)
+''' % MODULE_DIR
+
+# main.pyを実行する
+RUN_MAIN = '''
+import runpy
+sys.argv = ['main.py'] + sys.argv[1:]
+runpy.run_path(%r, run_name='__main__')
+''' % os.path.join(MODULE_DIR, 'main.py')
+
+
+def python(module_dir: object, code: str, *args: str) -> object:
+    """
+    seleniumをimportできない状態でcodeを実行する.
+    """
+
+    return subprocess.run(
+        [sys.executable, '-c', BLOCK_SELENIUM + code] + list(args),
+        cwd=str(module_dir), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, timeout=60)
+
+
+def run(module_dir: object, *args: str) -> object:
+    return python(module_dir, RUN_MAIN, *args)
+
+
+def test_selenium_is_blocked(module_dir):
+    result = python(module_dir, 'import collect, fetch, worker')
+    assert result.returncode == 0, result.stderr
+
+    result = python(module_dir, 'import fetch; fetch.create_driver()')
+    assert result.returncode != 0
+    assert 'import of selenium halted' in result.stderr
+
+
+def test_import_and_enqueue_without_selenium(module_dir):
+    path = module_dir / 'places.csv'
+    path.write_text('東京,http://a/1\n大阪,http://a/2\n', encoding='utf-8')
+
+    result = run(module_dir, 'import', 'weather', '--file', str(path), '--dry-run')
+    assert result.returncode == 0, result.stderr
+    assert 'added 2' in result.stdout
+
+    result = run(module_dir, 'import', 'weather', '--file', str(path))
+    assert result.returncode == 0, result.stderr
+
+    result = run(module_dir, 'enqueue')
+    assert result.returncode == 0, result.stderr
+    assert 'weather 2' in result.stdout
+
+
+def test_migrate_without_selenium(module_dir):
+    result = run(module_dir, 'migrate', '--check')
+    assert result.returncode == 0, result.stderr
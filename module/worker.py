@@ -0,0 +1,251 @@
+"""
+ワーカーモジュール.
+DBのジョブキュー(scrape_job)からジョブを借りてスクレイピングし、結果をDBに書き戻す
+複数のプロセス、DBファイルを共有する複数のマシンで同時に動かせる
+リース期限内に完了しなかったジョブ(ワーカーの異常終了等)は他のワーカーが再取得する
+
+    $ python main.py enqueue    収集先をジョブキューに登録する
+    $ python main.py worker     ジョブキューを処理し続ける
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import socket
+import sqlite3
+import threading
+import time
+import collect
+import dbaccess
+import fetch
+import log
+import metrics
+
+# 1回に借りるジョブ数(ワーカーのスレッド数の倍)
+CLAIM_FACTOR = 2
+
+# リース期間(秒) 1回に借りたジョブを処理し終えるのに十分な長さにする
+LEASE = 5 * 60
+
+# 貸出回数の上限 リース期限切れを繰り返すジョブは失敗にする
+MAX_ATTEMPTS = 3
+
+# ジョブが無い場合に待つ時間(秒)
+POLL_INTERVAL = 5
+
+
+def enqueue(targets: list) -> dict:
+    """
+    DBに登録された収集先をジョブキューに登録する.
+
+    param:
+        targets 収集情報のキーワードのリスト
+
+    return:
+        counts {収集情報のキーワード:待ちにしたジョブ数} DBアクセスに失敗した場合False
+    """
+
+    counts = {}
+    now = time.time()
+    for target in targets:
+        try:
+            if target == 'weather':
+                db = dbaccess.Weather()
+            elif target == 'train':
+                db = dbaccess.Train()
+        except RuntimeError:
+            log.error('enqueue: RuntimeError')
+            return False
+
+        rows = db.select_all()
+        db.close()
+        if rows is False:
+            return False
+
+        key = collect.TARGET_KEYS[target]
+        db = dbaccess.ScrapeJob()
+        counts[target] = db.enqueue(
+            [(target, row[key], row['url']) for row in rows], now)
+        db.close()
+        log.info('enqueue: complete', target=target, count=counts[target])
+
+    return counts
+
+
+class Worker:
+    """
+    ワーカークラス.
+    """
+
+    def __init__(self, threads: int = fetch.POOL_SIZE, owner: str = None):
+        """
+        param:
+            threads 同時に取得するページ数
+            owner ワーカーID(省略時は<ホスト名>:<プロセスID>)
+        """
+
+        self.threads = max(1, threads)
+        self.owner = owner or '%s:%d' % (socket.gethostname(), os.getpid())
+        self.scraping = collect.Scraping(self.threads)
+        self.stopped = threading.Event()
+
+    def claim(self) -> list:
+        """
+        ジョブを借りる.
+
+        return:
+            jobs [{pkey, target, key, url, attempts}]
+        """
+
+        db = dbaccess.ScrapeJob()
+        try:
+            return db.claim(self.owner, self.threads * CLAIM_FACTOR, LEASE,
+                            time.time(), MAX_ATTEMPTS)
+        finally:
+            db.close()
+
+    def process(self, jobs: list) -> dict:
+        """
+        借りたジョブをスクレイピングし、結果をDBに書き戻す.
+        リースの確認、収集結果の保存、ジョブの完了は1つのトランザクションで行い、
+        他のワーカーに貸し出されたジョブの結果は保存しない
+        保存に失敗した場合は、ジョブを待ちに戻して再取得させる
+
+        param:
+            jobs [{pkey, target, key, url, attempts}]
+
+        return:
+            stats {done:完了数, failed:失敗数, released:待ちに戻した数, lost:リース切れ数}
+        """
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(
+                self.scraping.fetch_with_retry,
+                [(job['target'], {
+                    'url': job['url'],
+                    collect.TARGET_KEYS[job['target']]: job['key'],
+                }) for job in jobs]))
+
+        stats = {'done': 0, 'failed': 0, 'released': 0, 'lost': 0}
+        grouped = {}
+        for job, result in zip(jobs, results):
+            grouped.setdefault(job['target'], []).append((job, result))
+
+        for target, items in grouped.items():
+            for key, count in self.write_back(target, items).items():
+                stats[key] += count
+
+        return stats
+
+    def write_back(self, target: str, items: list) -> dict:
+        """
+        1つの収集情報のキーワードのジョブの結果をDBに書き戻す.
+
+        param:
+            target 収集情報のキーワード
+            items [(job, (info, status))]
+
+        return:
+            stats {done:完了数, failed:失敗数, released:待ちに戻した数, lost:リース切れ数}
+        """
+
+        stats = {'done': 0, 'failed': 0, 'released': 0, 'lost': 0}
+        now = time.time()
+        db = dbaccess.ScrapeJob()
+        try:
+            db.conn.execute("BEGIN IMMEDIATE")
+            held = db.select_held([job['pkey'] for job, _ in items], self.owner)
+        except sqlite3.Error as e:
+            log.error('write_back: sqlite error', target=target, error=repr(e))
+            held = False
+        if held is False:
+            db.close()
+            return stats
+
+        held = set(held)
+        for job, _ in items:
+            if job['pkey'] not in held:
+                log.warn('write_back: lease lost', target=target, key=job['key'])
+                stats['lost'] += 1
+        items = [(job, result) for job, result in items if job['pkey'] in held]
+        if not items:
+            db.close()
+            return stats
+
+        collected = {}
+        statuses = {}
+        for job, (info, status) in items:
+            statuses[job['key']] = status
+            if info is not None:
+                collected[job['key']] = info
+
+        stored = True
+        if collected:
+            with metrics.timer('sqlite', target):
+                stored = self.scraping.store(target, collected, now, statuses, db.conn)
+        if stored is False:
+            metrics.fail('sqlite', target)
+            log.error('write_back: store error', target=target)
+            db.close()
+            db = dbaccess.ScrapeJob()
+            stats['released'] = db.release(
+                [job['pkey'] for job, _ in items], self.owner, 'store error',
+                now, MAX_ATTEMPTS)
+            db.commit()
+            return stats
+
+        for job, (info, status) in items:
+            if info is not None:
+                state = dbaccess.JOB_DONE
+            else:
+                state = dbaccess.JOB_FAILED
+            db.complete(job['pkey'], self.owner, state, status['error'], now)
+            stats[state] += 1
+        db.commit()
+
+        if self.scraping.store_status(target, statuses, now) is False:
+            log.error('write_back: store status error', target=target)
+
+        return stats
+
+    def run(self, once: bool = False) -> dict:
+        """
+        stopが呼ばれるまでジョブを処理する.
+
+        param:
+            once Trueの場合、ジョブが無くなった時点で終了する
+
+        return:
+            stats {done:完了数, failed:失敗数}
+        """
+
+        log.info('run: worker start', owner=self.owner, threads=self.threads)
+        stats = {'done': 0, 'failed': 0, 'released': 0, 'lost': 0}
+        try:
+            while not self.stopped.is_set():
+                jobs = self.claim()
+                if not jobs:
+                    if once:
+                        break
+                    self.stopped.wait(POLL_INTERVAL)
+                    continue
+
+                start = time.perf_counter()
+                processed = self.process(jobs)
+                for key in stats:
+                    stats[key] += processed[key]
+                log.info('run: processed %d' % len(jobs), owner=self.owner,
+                         duration=round(time.perf_counter() - start, 3),
+                         **processed)
+                metrics.write()
+        finally:
+            self.scraping.close_driver()
+            metrics.write()
+            log.info('run: worker stop', owner=self.owner, **stats)
+
+        return stats
+
+    def stop(self):
+        """
+        停止する. 処理中のジョブは書き戻してから停止する
+        """
+
+        self.stopped.set()
@@ -0,0 +1,29 @@
+/* ====================
+        debug
+==================== */
+
+// 1つ目のJSONで表を表示し、残りのJSONは順に読み込んで追加する
+$(function(){
+    $('.debug-table').each(function(){
+      var url = $(this).data('url');
+      var chunks = $(this).data('chunks');
+
+      $(this).DataTable({
+        ajax: url + '0.json',
+        deferRender: true,
+        initComplete: function(){
+          var table = this.api();
+          var load = function(num){
+            if(num >= chunks) {
+              return;
+            }
+            $.getJSON(url + num + '.json', function(json){
+              table.rows.add(json.data).draw(false);
+              load(num + 1);
+            });
+          };
+          load(1);
+        }
+      });
+    });
+});